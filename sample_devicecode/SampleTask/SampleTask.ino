@@ -11,6 +11,11 @@
 #define CFG_CHR_STIM  'd'
 #define CFG_CHR_RESP  'f'
 #define CMD_CHR_EXEC  'X'
+#define CFG_CHR_BINARY 'B'
+#define CMD_CHR_BATCH 'N'
+#define CMD_CHR_ABORT 'A'
+
+#define FRAME_START   0x02
 
 // #define DEBUG_GENRESP
 #ifdef DEBUG_GENRESP
@@ -38,6 +43,8 @@ struct Duration {
 
 Mode mode = Pair;
 Duration dur;
+bool binary = false;
+int terminator = 0; // the character that ended the last unsigned integer
 
 void setup() {
   // put your setup code here, to run once:
@@ -138,11 +145,28 @@ void parseFromSerial(const char& ch) {
     writeRespDur(true);
     break;
 
+    case CFG_CHR_BINARY:
+    binary = (parseUnsignedFromSerial(binary? 1:0) != 0);
+    Serial.print("@");
+    Serial.print(CFG_CHR_BINARY);
+    Serial.println(binary? 1:0);
+    break;
+
     case CMD_CHR_EXEC:
     runOnce();
     break;
 
+    case CMD_CHR_BATCH:
+    {
+      // 'N<count>[;<interval>]'
+      uint16_t count    = parseUnsignedFromSerial(0);
+      uint16_t interval = (terminator == ';')? parseUnsignedFromSerial(0) : 0;
+      runBatch(count, interval);
+    }
+    break;
+
     case ';':
+    case CMD_CHR_ABORT: // arrived after the batch
     break;
 
     default:
@@ -161,6 +185,7 @@ uint16_t parseUnsignedFromSerial(const uint16_t& orig)
     while (Serial.available() == 0);
     
     int readChar = Serial.read();
+    terminator = readChar;
 
     // only accepts digits
     if ((readChar >= 48) && (readChar <= 57)) {
@@ -270,8 +295,102 @@ void runOnce() {
   writeResults(cued, responded, _stop - _start, response, nresp);
 }
 
+/**
+ * reads the input that is available, and returns whether it includes CMD_CHR_ABORT.
+ * any other input is ignored during a batch.
+ */
+bool pollAbort() {
+  bool aborted = false;
+  while (Serial.available() > 0) {
+    if (Serial.read() == CMD_CHR_ABORT) {
+      aborted = true;
+    }
+  }
+  return aborted;
+}
+
+/**
+ * runs `count` trials in a row, with `interval` ms in between.
+ * CMD_CHR_ABORT stops the batch after the current trial.
+ */
+void runBatch(const uint16_t& count, const uint16_t& interval) {
+  for (uint16_t i=0; i<count; i++) {
+    runOnce();
+    if (i == count - 1) {
+      break;
+    }
+    unsigned long start = millis();
+    while (true) {
+      if (pollAbort()) {
+        return;
+      }
+      if ((millis() - start) >= interval) {
+        break;
+      }
+    }
+  }
+}
+
+void writeUInt16(const uint16_t& value) {
+  Serial.write((uint8_t)(value & 0xFF));
+  Serial.write((uint8_t)(value >> 8));
+}
+
+void writeInt32(const int32_t& value) {
+  for (int i=0; i<4; i++) {
+    Serial.write((uint8_t)((value >> (8*i)) & 0xFF));
+  }
+}
+
+/**
+ * writes the result as a binary frame (see ublock.core.encodeframe()):
+ *
+ *   STX | '+' | body length (uint16) | "<status>;wait<N>" NUL | "lick" NUL | count (uint16) | int32 x count
+ */
+void writeBinaryResult(const char* status, const long& wait, const int* response, const int& nresp)
+{
+  char text[32];
+  int textlen = snprintf(text, sizeof(text), "%s;wait%ld", status, wait);
+  uint16_t bodylen = (textlen + 1) + (4 + 1) + 2 + 4 * nresp;
+
+  Serial.write(FRAME_START);
+  Serial.write('+');
+  writeUInt16(bodylen);
+  Serial.write((const uint8_t*)text, textlen + 1);
+  Serial.write((const uint8_t*)"lick", 5);
+  writeUInt16(nresp);
+  for (int i=0; i<nresp; i++) {
+    writeInt32(response[i]);
+  }
+}
+
+const char* resultStatus(const bool& cued, const bool& resp)
+{
+  if (cued) {
+    if (resp) {
+      return "hit";
+    } else if (mode == Pair) {
+      return "noresp";
+    } else {
+      return "miss";
+    }
+  } else {
+    if (resp) {
+      return "catch";
+    } else if (mode == Pair){
+      return "noresp";
+    } else {
+      return "reject";
+    }
+  }
+}
+
 void writeResults(const bool& cued, const bool& resp, const long& wait, const int* response, const int& nresp)
 {
+  if (binary) {
+    writeBinaryResult(resultStatus(cued, resp), wait, response, nresp);
+    return;
+  }
   if (cued) {
     if (resp) {
       Serial.print("+hit;");
@@ -0,0 +1,20 @@
+import asyncio
+
+from ublock import aio
+
+"""tests for `ublock.aio`."""
+
+class silentio:
+    """a fake client that never replies."""
+
+    def request(self, cmd, returns='result'):
+        return asyncio.get_running_loop().create_future()
+
+def test_abort_cancels_the_awaited_reply():
+    async def session():
+        trials = aio.loop('X', 5, io=silentio())
+        task   = trials.start()
+        await asyncio.sleep(0.01)
+        trials.abort()
+        return await asyncio.wait_for(task, 1)
+    assert asyncio.run(session()) == 0
@@ -0,0 +1,37 @@
+from ublock import convert
+
+"""tests for `ublock.convert`."""
+
+SCHEMA = (('hit', 'miss'), ('wait',), ('lick',))
+
+def writelog(tmp_path, lines):
+    path = tmp_path / "session.log"
+    path.write_text(''.join(line + "\n" for line in lines))
+    return str(path)
+
+def test_arrays_beyond_int32(tmp_path):
+    path = writelog(tmp_path, ["+hit;wait1;lick[1,3000000000,5];",
+                               "+miss;wait2;lick[4294967295,,7];",
+                               "+hit;wait3;lick[];"])
+    outpath, ntrials = convert.convertlog(path, SCHEMA)
+    session = convert.loadsession(outpath)
+    assert ntrials == 3
+    assert [list(licks) for licks in session['arrays']['lick']] == \
+                [[1, 3000000000, 5], [4294967295, 7], []]
+
+def test_array_out_of_range_is_skipped(tmp_path):
+    path = writelog(tmp_path, ["+hit;wait1;lick[1,99999999999999999999];",
+                               "+hit;wait2;lick[2];"])
+    outpath, ntrials = convert.convertlog(path, SCHEMA)
+    session = convert.loadsession(outpath)
+    assert [list(licks) for licks in session['arrays']['lick']] == [[], [2]]
+    assert list(session['values']['wait']) == [1, 2]
+
+def test_session_without_trials(tmp_path):
+    path = writelog(tmp_path, [">port opened", "@wait100"])
+    outpath, ntrials = convert.convertlog(path, SCHEMA)
+    session = convert.loadsession(outpath)
+    assert ntrials == 0
+    assert len(session['trial']) == 0
+    assert session['arrays']['lick'] == []
+    assert len(session['values']['wait']) == 0
@@ -0,0 +1,251 @@
+import random
+import threading
+import statistics
+
+import pytest
+
+from ublock import core
+
+"""tests for `ublock.core`."""
+
+@pytest.fixture(params=['numpy', 'array'])
+def decoding(request, monkeypatch):
+    """runs the test with and without numpy."""
+    if request.param == 'array':
+        monkeypatch.setattr(core, 'numpy', None)
+    return request.param
+
+@pytest.mark.parametrize('payload, expected', [
+    ('1,3000000000,5',      [1, 3000000000, 5]),
+    ('1,,3000000000',       [1, 3000000000]),
+    ('4294967295,0',        [4294967295, 0]),
+    ('-3000000000,,2',      [-3000000000, 2]),
+    ('9223372036854775807', [9223372036854775807]),
+    ('',                    []),
+])
+def test_decodearray_beyond_int32(decoding, payload, expected):
+    assert list(core.decodearray(payload)) == expected
+
+@pytest.mark.parametrize('payload', [
+    '1,99999999999999999999,5',
+    '1,,99999999999999999999',
+    '-9223372036854775809',
+    '1,a,3',
+])
+def test_decodearray_rejects_invalid(decoding, payload):
+    with pytest.raises(ValueError):
+        core.decodearray(payload)
+
+def test_replyqueue_drops_cancelled():
+    replies = core.replyqueue()
+    aborted = [replies.expect('result') for i in range(47)]
+    for future in aborted:
+        future.cancel()
+    assert len(replies) == 0
+
+    future = replies.expect('result')
+    assert len(replies) == 1
+    assert len(replies.pending[core.protocol.RESULT]) == 1
+    replies.resolve(core.rxline('+hit;'))
+    assert future.result() == '+hit;'
+    assert len(replies) == 0
+
+class batchio:
+    """a fake client that replies to the batches after the given delays."""
+
+    def __init__(self, delays):
+        self.replies = core.replyqueue()
+        self.delays  = delays # {command: [(delay, line)]}
+        self.sent    = []
+
+    def reply(self, command):
+        for delay, line in self.delays.get(command, ()):
+            timer = threading.Timer(delay, self.replies.resolve, (core.rxline(line),))
+            timer.daemon = True
+            timer.start()
+
+    def request(self, command, returns=None, flush=False):
+        self.sent.append(command)
+        self.reply(command)
+        return None if returns is None else self.replies.expect(returns)
+
+    def requestBatch(self, command, count, returns, flush=False):
+        self.sent.append(command)
+        futures = [self.replies.expect(returns) for i in range(count)]
+        self.reply(command)
+        return futures
+
+class recorder(core.loophandler):
+    def __init__(self):
+        self.results = []
+
+    def evaluate(self, result):
+        self.results.append(result)
+        return True
+
+def test_batch_discards_late_replies():
+    # the reply of the second trial comes after the timeout,
+    # and the device stops the batch before the third one
+    io      = batchio({'N3': [(0, '+hit;1'), (0.35, '+hit;2')],
+                       'N1': [(0.01, '+hit;3')]})
+    handler = recorder()
+    trials  = core.loop('X', 3, io=io, handler=handler, returns='result',
+                        timeout=0.2, ontimeout='skip', batch='N')
+    trials.run()
+    assert io.sent == ['N3', 'A', 'N1']
+    assert handler.results == ['+hit;1', '+hit;3']
+    assert len(io.replies) == 0
+
+def test_replyqueue_concurrent_requests():
+    replies  = core.replyqueue()
+    number   = 20000
+    errors   = []
+    futures  = []
+    def requester():
+        try:
+            for i in range(number):
+                future = replies.expect('result')
+                if i % 3 == 0:
+                    future.cancel()
+                else:
+                    futures.append(future)
+                len(replies)
+        except Exception as e:
+            errors.append(e)
+    thread = threading.Thread(target=requester)
+    thread.start()
+    line = core.rxline('+hit;')
+    while thread.is_alive():
+        replies.resolve(line)
+        len(replies)
+    thread.join()
+    for i in range(number):
+        replies.resolve(line)
+    assert errors == []
+    assert len(replies) == 0
+    assert all(future.result(0) == '+hit;' for future in futures)
+
+def test_resultparser_tokens():
+    parser = core.resultparser(('hit', 'miss'), ('wait', 'wait1', 'x'), ('lick', 'lick2'))
+    assert parser.parseToken('hit') == ('status', 'hit', None)
+    assert parser.parseToken('wait220') == ('value', 'wait', 220)
+    assert parser.parseToken('wait120') == ('value', 'wait1', 20)
+    assert parser.parseToken('wait1-5') == ('value', 'wait1', -5)
+    assert parser.parseToken('x+3') == ('value', 'x', 3)
+    kind, name, values = parser.parseToken('lick2[1,,3000000000]')
+    assert (kind, name, list(values)) == ('array', 'lick2', [1, 3000000000])
+    for token in ('hits', 'wait', 'waitx1', 'lick[1,2', 'lick[1,a]', 'lick3[1]', 'y12'):
+        assert parser.parseToken(token) == ('unknown', token, None)
+
+def test_resultparser_without_names():
+    parser = core.resultparser()
+    assert parser.parse('+hit;wait1;lick[1];') == [('unknown', 'hit', None),
+                                                  ('unknown', 'wait1', None),
+                                                  ('unknown', 'lick[1]', None)]
+
+@pytest.mark.parametrize('line, has_header, expected', [
+    ('+hit;wait5;',         True,  ['hit', 'wait5']),
+    ('+hit;;wait5',         True,  ['hit', 'wait5']),
+    ('+;hit;',              True,  ['hit']),
+    ('+ hit ; wait5 ;  ',   True,  ['hit', 'wait5']),
+    ('+',                   True,  []),
+    ('+;; ;',               True,  []),
+    ('hit;wait5',           False, ['hit', 'wait5']),
+])
+def test_tokenize(line, has_header, expected):
+    assert list(core.tokenize(line, has_header=has_header)) == expected
+    assert core.splittokens(line, has_header=has_header) == expected
+    spans = list(core.tokenize(line, has_header=has_header, spans=True))
+    assert [line[start:end] for start, end in spans] == expected
+
+def test_tokenize_spans():
+    assert list(core.tokenize('+ hit ;wait5;', spans=True)) == [(2, 5), (7, 12)]
+    assert list(core.tokenize('hit; hit', has_header=False, spans=True)) == [(0, 3), (5, 8)]
+
+def test_rxline_tokens():
+    assert core.rxline('+hit; wait5;;').tokens() == ('hit', 'wait5')
+
+def test_testresult():
+    evaluate = core.testResult(('hit',))
+    assert evaluate('+hit;wait5;') == True
+    assert evaluate('+hit') == True
+    assert evaluate('hit;') == True
+    assert evaluate('+hit2;') == False
+    assert evaluate('+miss;hit;') == False
+    # the status is the text before the first delimiter
+    assert evaluate('+;hit') == False
+
+def feedlines(chunks):
+    lines  = []
+    buffer = core.linebuffer(lambda line, stamp: lines.append(core.decodeline(bytes(line), stamp)))
+    for chunk in chunks:
+        buffer.feed(chunk, 0)
+    assert len(buffer) == 0
+    return lines
+
+def test_frame_roundtrip(decoding):
+    frame = core.encodeframe('+', 'hit;wait5', {'lick': [1, -2, 2147483647], 'none': []})
+    line  = core.decodeframe(frame)
+    assert line == '+hit;wait5'
+    assert line.tokens() == ('hit', 'wait5')
+    assert list(line.arrays) == ['lick', 'none']
+    assert list(line.arrays['lick']) == [1, -2, 2147483647]
+    assert list(line.arrays['none']) == []
+
+def test_frame_dtype_matches_text(decoding):
+    framed = core.decodeframe(core.encodeframe('+', 'hit', {'lick': [1, 2]})).arrays['lick']
+    text   = core.decodearray('1,2')
+    if decoding == 'numpy':
+        assert framed.dtype == text.dtype
+    else:
+        assert framed.typecode == text.typecode
+
+def test_frame_split_across_chunks():
+    # STX (0x02) also appears in the payload: in the text, and in the values
+    frame = core.encodeframe('+', 'hit\x02;wait2', {'lick': [2, 0x0202, 10]})
+    data  = b'>before\n' + frame + b'+after;\n'
+    for split in range(1, len(data)):
+        lines = feedlines([data[:split], data[split:]])
+        assert [str(line) for line in lines] == ['>before', '+hit\x02;wait2', '+after;']
+        assert list(lines[1].arrays['lick']) == [2, 0x0202, 10]
+
+def test_trialhistory_window():
+    rng     = random.Random(1)
+    parser  = core.resultparser(('hit', 'miss'), ('wait',), ())
+    history = core.trialhistory(parser, size=7)
+    lines   = []
+    for i in range(60):
+        status = rng.choice(('hit', 'hit', 'miss', 'unknown'))
+        wait   = "wait{};".format(rng.randrange(-50, 1000)) if rng.random() < 0.8 else ""
+        lines.append("+{};{}".format(status, wait))
+        history.add(lines[-1])
+
+        trials = [parser.parseTrial(line) for line in lines]
+        recent = trials[-7:]
+        assert len(history) == len(recent)
+        assert [trial.status for trial in history] == [trial.status for trial in recent]
+        for status in ('hit', 'miss', None):
+            assert history.count(status) == sum(1 for trial in recent if trial.status == status)
+            assert history.count(status, recent=False) == sum(1 for trial in trials if trial.status == status)
+        assert history.rate(('hit', 'miss')) == pytest.approx(
+                    sum(1 for trial in recent if trial.status in ('hit', 'miss')) / len(recent))
+        assert history.rate('hit', recent=False) == pytest.approx(
+                    sum(1 for trial in trials if trial.status == 'hit') / len(trials))
+
+        streak = 0
+        while (streak < len(trials)) and (trials[-1 - streak].status == trials[-1].status):
+            streak += 1
+        assert history.streak == streak
+
+        for scope, subset in ((True, recent), (False, trials)):
+            waits = [trial.values['wait'] for trial in subset if 'wait' in trial.values]
+            stats = history.stats('wait', recent=scope)
+            assert stats.count == len(waits)
+            if len(waits) > 0:
+                assert stats.mean == pytest.approx(statistics.mean(waits))
+            else:
+                assert stats.mean is None
+            if len(waits) > 1:
+                assert stats.variance == pytest.approx(statistics.variance(waits))
+            else:
+                assert stats.variance is None
@@ -0,0 +1,73 @@
+import pytest
+
+from ublock.core import resultparser
+from ublock.criteria import compilecriteria
+
+"""tests for `ublock.criteria`."""
+
+def evaluate(spec, line):
+    return compilecriteria(spec)(line)
+
+@pytest.mark.parametrize('spec, line, expected', [
+    ('hit or miss and wait>100', '+hit;wait50;',  True),
+    ('hit or miss and wait>100', '+miss;wait50;', False),
+    ('(hit or miss) and wait>100', '+hit;wait50;', False),
+    ('not hit and wait>100',     '+miss;wait150;', True),
+    ('not (hit or miss)',        '+catch;',        True),
+    ('not not hit',              '+hit;',          True),
+])
+def test_precedence(spec, line, expected):
+    assert evaluate(spec, line) == expected
+
+@pytest.mark.parametrize('spec, expected', [
+    ('wait>200', False), ('wait>=200', True), ('wait<200', False),
+    ('wait<=200', True), ('wait==200', True), ('wait!=200', False),
+    ('wait>-1', True),   ('wait > 199', True),
+])
+def test_comparators(spec, expected):
+    assert evaluate(spec, '+hit;wait200;') == expected
+
+def test_len():
+    assert evaluate('len(lick)>=3', '+hit;lick[1,2,3];') == True
+    assert evaluate('len(lick)>=3', '+hit;lick[1,2];') == False
+    assert evaluate('len(lick)==0', '+hit;lick[];') == True
+
+def test_missing_values():
+    assert evaluate('wait>0', '+hit;') == False
+    assert evaluate('wait<0', '+hit;') == False
+    assert evaluate('not wait>0', '+hit;') == True
+    assert evaluate('len(lick)>=0', '+hit;') == False
+
+def test_names_starting_with_digits():
+    assert evaluate('2afc', '+2afc;') == True
+    assert evaluate('2afc and 1st>3', '+2afc;1st5;') == True
+    assert evaluate('2afc|3afc', '+3afc;') == True
+
+def test_status_is_the_first_token():
+    for spec in ('hit', 'hit|miss', 'hit and wait>0'):
+        assert evaluate(spec, '+hit;wait5;') == True
+        assert evaluate(spec, '+early;hit;wait5;') == False
+
+def test_trialresult():
+    trial = resultparser(('hit',), ('wait',), ()).parseTrial('+hit;wait5;')
+    assert evaluate('hit and wait>4', trial) == True
+    assert evaluate(('hi',), trial) == True
+
+def test_status_sequence_is_a_prefix_match():
+    assert evaluate(('hit',), '+hit;wait5;') == True
+    assert evaluate(('hit',), '+hit2;') == True
+    assert evaluate(('hit', 'catch'), '+catch;') == True
+    assert evaluate(('hit',), '+miss;hit;') == False
+
+def test_callable_and_none():
+    predicate = lambda result: True
+    assert compilecriteria(predicate) is predicate
+    assert compilecriteria(None) is None
+
+@pytest.mark.parametrize('spec', [
+    '', 'hit and', 'wait>', 'wait>x', 'wait=3', 'len(lick', 'len(lick)',
+    '(hit', 'hit)', 'and', 'hit hit', 'len(and)>1',
+])
+def test_invalid(spec):
+    with pytest.raises(ValueError, match="invalid criteria"):
+        compilecriteria(spec)
@@ -0,0 +1,38 @@
+import sys
+import threading
+
+from ublock import metrics
+
+"""tests for `ublock.metrics`."""
+
+def test_count_during_clear():
+    collector = metrics.collector()
+    errors    = []
+    def counter():
+        try:
+            for i in range(50000):
+                collector.count('result', 10)
+        except Exception as e:
+            errors.append(e)
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    try:
+        thread = threading.Thread(target=counter)
+        thread.start()
+        while thread.is_alive():
+            collector.clear()
+        thread.join()
+    finally:
+        sys.setswitchinterval(interval)
+    assert errors == []
+    snapshot = collector.snapshot()
+    assert snapshot['bytes'].get('result', 0) == 10 * snapshot['lines'].get('result', 0)
+
+def test_count():
+    collector = metrics.collector()
+    collector.count('result', 10)
+    collector.count('result', 5)
+    collector.count('config', 3)
+    snapshot = collector.snapshot()
+    assert snapshot['lines'] == {'result': 2, 'config': 1}
+    assert snapshot['bytes'] == {'result': 15, 'config': 3}
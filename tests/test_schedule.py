@@ -0,0 +1,118 @@
+from concurrent.futures import Future
+
+import pytest
+
+from ublock.model import Task
+from ublock.schedule import design, scheduler, readcheckpoint
+
+"""tests for `ublock.schedule`."""
+
+def sampletask():
+    task = Task("Sample")
+    task.addMode('Pair', 'P')
+    task.addMode('Test', 'T')
+    task.addConfig('stim_dur_ms', 'd')
+    task.addAction('runTask', 'X')
+    return task
+
+class replyingio:
+    """a fake client that replies to every request at once."""
+
+    def __init__(self):
+        self.sent = []
+
+    def request(self, command, returns=None, flush=False):
+        self.sent.append(command)
+        if returns is None:
+            return None
+        future = Future()
+        future.set_result(('@' + command) if returns == 'config' else '+hit;')
+        return future
+
+def compiled(task, number=10):
+    session = design(task, seed=0)
+    session.addBlock('runTask', number, conditions=[{'stim_dur_ms': 100}, {'stim_dur_ms': 200}])
+    return session.compile()
+
+def test_resume_after_truncated_write(tmp_path):
+    task  = sampletask()
+    steps = compiled(task)
+    path  = str(tmp_path / "session.ckpt")
+
+    # runs 4 steps, and then crashes in the middle of writing a record
+    class crashing(scheduler):
+        def record(self):
+            super().record()
+            if self.position == 4:
+                self.output.write('{"position": 5, "tri')
+                self.output.flush()
+                self.abort()
+    crashing(task, steps, io=replyingio(), checkpoint=path).run()
+    assert readcheckpoint(path)[1:] == (4, 4)
+
+    resumed = scheduler.resume(path, task, io=replyingio())
+    assert resumed.position == 4
+    resumed.run()
+    assert resumed.position == len(steps)
+    assert readcheckpoint(path)[1:] == (len(steps), len(steps))
+
+    # nothing is run again
+    io = replyingio()
+    scheduler.resume(path, task, io=io).run()
+    assert 'X' not in io.sent
+
+def test_readcheckpoint_skips_broken_lines(tmp_path):
+    path = tmp_path / "session.ckpt"
+    path.write_text('{"task": "Sample", "steps": []}\n'
+                    '{"position": 1, "trials": 1}\n'
+                    '{"position": 2, "tr{"position": 3, "trials": 3}\n'
+                    '{"position": 4, "trials": 5}\n')
+    assert readcheckpoint(str(path))[1:] == (4, 5)
+
+class silentio(replyingio):
+    """a fake client that never acknowledges the config commands."""
+
+    def request(self, command, returns=None, flush=False):
+        if returns != 'config':
+            return super().request(command, returns=returns, flush=flush)
+        self.sent.append(command)
+        return Future()
+
+def test_unacknowledged_state_is_not_counted(tmp_path):
+    task  = sampletask()
+    steps = compiled(task)
+    path  = str(tmp_path / "session.ckpt")
+
+    runner = scheduler(task, steps, io=silentio(), checkpoint=path)
+    runner.run()
+    assert runner.toabort == True
+    assert runner.position == 0
+    assert runner.sent == {}
+    assert readcheckpoint(path)[1] == 0
+
+    resumed = scheduler.resume(path, task, io=replyingio())
+    resumed.run()
+    assert resumed.position == len(steps)
+
+def longestrun(steps):
+    longest = run = 1
+    for prev, item in zip(steps, steps[1:]):
+        run = (run + 1) if (prev.state, prev.catch) == (item.state, item.catch) else 1
+        longest = max(longest, run)
+    return longest
+
+def test_maxrun_includes_catch_trials():
+    task = sampletask()
+    for seed in range(20):
+        session = design(task, seed=seed)
+        session.addBlock('runTask', 40, conditions=[{'stim_dur_ms': 100}, {'stim_dur_ms': 200}],
+                         order='balanced', catch=0.25, catchcondition={'stim_dur_ms': 0}, maxrun=1)
+        steps = session.compile()
+        assert sum(1 for item in steps if item.catch) == 10
+        assert longestrun(steps) == 1
+
+def test_maxrun_rejected_for_sequential():
+    session = design(sampletask(), seed=0)
+    with pytest.raises(ValueError):
+        session.addBlock('runTask', 10, conditions=[{'stim_dur_ms': 100}],
+                         order='sequential', maxrun=2)
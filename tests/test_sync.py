@@ -0,0 +1,135 @@
+import time
+
+import pytest
+
+from ublock import transport, sim
+from ublock.core import client, loophandler
+from ublock.sync import coordinator
+
+"""tests for `ublock.sync`, with simulated devices on `transport.loopback()` pairs."""
+
+class replier(sim.device):
+    """a device that replies to each 'X' after `latency` seconds, with the
+    statuses in `statuses` in turn."""
+
+    def __init__(self, port, latency=0, statuses=('hit',)):
+        self.latency  = latency
+        self.statuses = statuses
+        self.trials   = 0
+        super().__init__(port)
+
+    def loop(self):
+        ch = self.readChar()
+        if ch == 'X':
+            self.delay(self.latency * 1000)
+            self.println("+{};".format(self.statuses[self.trials % len(self.statuses)]))
+            self.trials += 1
+
+class recorder(loophandler):
+    """counts the 'hit' trials only, and keeps the timings."""
+
+    def __init__(self):
+        self.timings = []
+        self.ended   = None
+
+    def evaluate(self, result):
+        return result.startswith('+hit')
+
+    def timing(self, timing):
+        self.timings.append(timing)
+
+    def done(self, command, number, counter):
+        self.ended = time.perf_counter_ns()
+
+@pytest.fixture
+def devices():
+    opened = []
+    def __open(*specs):
+        ios = []
+        for spec in specs:
+            host, dev = transport.loopback()
+            opened.append(replier(dev, **spec))
+            ios.append(client(host))
+        opened.extend(ios)
+        deadline = time.perf_counter() + 2
+        while (not all(io.io.connected for io in ios)) and (time.perf_counter() < deadline):
+            time.sleep(0.01)
+        return ios
+    yield __open
+    for item in opened:
+        if isinstance(item, client):
+            item.close()
+        else:
+            item.stop()
+
+def runwithin(session, timeout):
+    thread = session.start()
+    thread.join(timeout)
+    if thread.is_alive():
+        session.abort()
+        thread.join()
+        pytest.fail("the coordinator did not finish in time")
+    return [member.counter for member in session.loops]
+
+def onsets(handler):
+    return [timing.started for timing in handler.timings]
+
+def test_barrier_aligns_the_onsets(devices):
+    ios      = devices({}, {}, {'latency': 0.03})
+    handlers = [recorder() for io in ios]
+    session  = coordinator('X', 5, ios, handlers=handlers, returns='result')
+    assert runwithin(session, 10) == [5, 5, 5]
+    skew = session.skew()
+    assert skew['count'] == 5
+    # the fast devices wait for the slow one at every trial
+    assert skew['max'] < 10e6
+    for k in range(5):
+        starts = [onsets(handler)[k] for handler in handlers]
+        assert max(starts) - min(starts) < 10e6
+    assert session.metrics.histograms['release'].count == 5
+
+def test_leaving_the_barrier(devices):
+    # the first device only counts every other trial, and runs alone after the others leave
+    ios      = devices({'statuses': ('hit', 'miss')}, {}, {})
+    handlers = [recorder() for io in ios]
+    session  = coordinator('X', 4, ios, handlers=handlers, returns='result')
+    assert runwithin(session, 10) == [4, 4, 4]
+    assert [len(handler.timings) for handler in handlers] == [7, 4, 4]
+    assert session.active == 0
+    assert session.arrived == 0
+
+def test_deadline_does_not_wait(devices):
+    interval = 0.02
+    ios      = devices({}, {'latency': 0.06})
+    handlers = [recorder() for io in ios]
+    session  = coordinator('X', 5, ios, handlers=handlers, mode='deadline',
+                           returns='result', interval=interval)
+    assert runwithin(session, 10) == [5, 5]
+    fast, slow = onsets(handlers[0]), onsets(handlers[1])
+    # both start at the shared deadline
+    assert abs(fast[0] - slow[0]) < 10e6
+    # the fast device stays on the grid of `interval`
+    for k in range(1, 5):
+        assert abs((fast[k] - fast[0]) - k * interval * 1e9) < 10e6
+    # the slow one starts each trial as soon as its deadline has passed
+    for k in range(1, 5):
+        assert slow[k] - slow[k - 1] >= 0.06e9
+    assert handlers[0].ended < handlers[1].ended
+    assert 'release' not in session.metrics.histograms
+
+def test_abort_at_the_barrier(devices):
+    ios     = devices({}, {'latency': 10})
+    session = coordinator('X', 5, ios, returns='result')
+    thread  = session.start()
+    time.sleep(0.2)
+    # the first loop is waiting at the barrier, the second one for its reply
+    assert session.arrived == 1
+    session.abort()
+    thread.join(5)
+    assert not thread.is_alive()
+    assert session.wait(0) == True
+
+@pytest.mark.parametrize('options', [dict(mode='x'), dict(batch='N'), dict(handlers=[None])])
+def test_invalid_options(options):
+    with pytest.raises(ValueError):
+        coordinator('X', 1, [None, None], **options)
@@ -1,5 +1,6 @@
 from .core import *
 from .model import Task
+from .criteria import compilecriteria
 
 VERSION_STR = "0.1.2"
 
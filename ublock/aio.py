@@ -0,0 +1,176 @@
+import time
+import asyncio
+import serial
+
+from .core import protocol, linebuffer, rawline, replyqueue, dispatcher, eventhandler, loophandler
+from .transport import openport
+
+"""asyncio-based counterparts of `core.client` and `core.loop`.
+
+a single event loop can drive any number of devices, e.g.:
+
+    async def session(addr):
+        async with await aio.client.open(addr) as io:
+            result = await io.request('X')
+            async for line in io:
+                ...
+"""
+
+class client(dispatcher):
+    """an asyncio client that conforms to the CUISerial protocol.
+
+    incoming lines are dispatched to `handler` (an `eventhandler`), just
+    as in `core.client`. in addition:
+
+    + `async for line in client` iterates over incoming lines
+      (only the lines that arrive after the iteration started are queued),
+    + `await client.request(cmd)` resolves with the next RESULT line
+      (or CONFIG line, with `returns='config'`). multiple requests may be
+      in flight; they are resolved in the order they were sent.
+
+    use `client.open()` to create an instance from an address.
+    """
+
+    def __init__(self, port, handler=None):
+        self.port       = port
+        self.port.timeout = 0
+        self.handler    = eventhandler() if handler is None else handler
+        self.lines      = linebuffer(self.dispatchLine)
+        self.queue      = None
+        self.replies    = replyqueue()
+        self.eventloop  = asyncio.get_running_loop()
+        self.eventloop.add_reader(self.port.fileno(), self.readReady)
+        self.handler.connected(self)
+
+    @classmethod
+    async def open(cls, addr, handler=None, baud=9600, waitfirst=0, initialcmd=None):
+        """opens `addr` (see `transport.openport()`) and returns a new client."""
+        io = cls(openport(addr, baud=baud), handler=handler)
+        if waitfirst > 0:
+            await asyncio.sleep(waitfirst)
+        if initialcmd is not None:
+            io.request(initialcmd, returns=None)
+        return io
+
+    @classmethod
+    async def Uno(cls, addr, handler=None, baud=9600, initialcmd=None):
+        """default call signatures for Uno-type boards."""
+        return await cls.open(addr, handler=handler, baud=baud, waitfirst=1.2, initialcmd=initialcmd)
+
+    @classmethod
+    async def Leonardo(cls, addr, handler=None, baud=9600, initialcmd=protocol.HELP):
+        """default call signatures for Leonardo-type boards."""
+        return await cls.open(addr, handler=handler, baud=baud, waitfirst=0, initialcmd=initialcmd)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc, *args):
+        self.close()
+
+    def __aiter__(self):
+        if self.queue is None:
+            self.queue = asyncio.Queue()
+        return self
+
+    async def __anext__(self):
+        line = await self.queue.get()
+        if line is None:
+            raise StopAsyncIteration
+        return line
+
+    def readReady(self):
+        try:
+            data = self.port.read(max(self.port.in_waiting, 1))
+        except serial.SerialException:
+            self.close()
+            return
+        if len(data) > 0:
+            self.lines.feed(data, time.perf_counter_ns())
+
+    def dispatchLine(self, line, stamp):
+        line = rawline(line, stamp)
+        if self.queue is not None:
+            self.queue.put_nowait(line.decode())
+        self.handleLine(line)
+
+    def request(self, cmd, returns='result'):
+        """sends `cmd` to the device.
+
+        returns a future that resolves with the next line of the `returns`
+        type ('result' or 'config'), or None if `returns` is None."""
+        if self.port is None:
+            raise serial.SerialException("port not open")
+        future = None
+        if returns is not None:
+            future = self.eventloop.create_future()
+            self.replies.expect(returns, future)
+        self.port.write((cmd + "\r\n").encode())
+        return future
+
+    def close(self):
+        if self.port is None:
+            return
+        self.eventloop.remove_reader(self.port.fileno())
+        self.port.close()
+        self.port = None
+        self.replies.fail(serial.SerialException("port closed"))
+        if self.queue is not None:
+            self.queue.put_nowait(None)
+        self.handler.closed()
+
+class loop:
+    """the asyncio counterpart of `core.loop`.
+
+    `io` is an `aio.client`, and `handler` is a `loophandler`
+    (its `request()` method is not used). `start()` returns
+    an `asyncio.Task` that runs the loop."""
+
+    def __init__(self, command, number, interval=0, io=None, handler=None,
+                 returns='result'):
+        self.command  = command
+        self.io       = io
+        self.number   = number
+        self.interval = interval
+        self.returns  = returns
+        self.handler  = loophandler() if handler is None else handler
+        self.result   = None
+        self.future   = None    # the reply that is being awaited
+        self.toabort  = False
+
+    def start(self):
+        return asyncio.ensure_future(self.run())
+
+    async def run(self):
+        counter = 0
+        self.toabort = False
+        while (counter < self.number) and (self.toabort == False):
+            self.handler.starting(self.command,self.number,counter)
+            if self.io is None:
+                print("***no IO linked to: {}".format(self))
+                break
+            self.future = self.io.request(self.command, returns=self.returns)
+            try:
+                self.result = await self.future
+            except asyncio.CancelledError:
+                if self.toabort == True:
+                    # aborted while waiting for the reply
+                    break
+                raise
+            finally:
+                self.future = None
+            if self.handler.evaluate(self.result) == True:
+                counter += 1
+            if self.toabort == True:
+                break
+            if (self.number > 1) and (self.interval > 0):
+                await asyncio.sleep(self.interval)
+        self.handler.done(self.command,self.number,counter)
+        return counter
+
+    def abort(self):
+        """stops the loop, without waiting for the reply that is being awaited
+        (to be called from the event loop)."""
+        self.toabort = True
+        if self.future is not None:
+            self.future.cancel()
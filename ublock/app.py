@@ -1,17 +1,22 @@
 from warnings import warn
 try:
+    import numpy as np
     import pyqtgraph as pg
     from pyqtgraph.Qt import QtWidgets, QtCore, QtGui
 except ImportError:
     raise RuntimeError("ublock.app submodule is disabled; install the 'pyqtgraph' module to use it.")
 
 import os
+import time
 from datetime import datetime
 from collections import OrderedDict
-from traceback import print_exc
 from serial.tools import list_ports
 
-from .core import client, protocol, eventhandler, loop, loophandler
+from .core import client, protocol, eventhandler, loop, loophandler, walltime, resultparser, \
+                  configstate
+from .criteria import compilecriteria
+from .metrics import collector
+from .replay import replayport
 from .model import StatusPlot, ArrayPlot
 
 mainapp = QtGui.QApplication([])
@@ -47,15 +52,21 @@ class SerialIO(QtWidgets.QWidget, eventhandler):
     serialClosed        = QtCore.pyqtSignal()
     serialStatusChanged = QtCore.pyqtSignal(bool)
 
-    messageReceived         = QtCore.pyqtSignal(str)
-    debugMessageReceived    = QtCore.pyqtSignal(str)
-    infoMessageReceived     = QtCore.pyqtSignal(str)
-    configMessageReceived   = QtCore.pyqtSignal(str)
+    # the line signals carry `object` instead of `str`, so that
+    # the received `rxline` (and its time stamp) passes through as it is
+    messageReceived         = QtCore.pyqtSignal(object)
+    debugMessageReceived    = QtCore.pyqtSignal(object)
+    infoMessageReceived     = QtCore.pyqtSignal(object)
+    configMessageReceived   = QtCore.pyqtSignal(object)
     configElementReceived   = QtCore.pyqtSignal(str)
-    resultMessageReceived   = QtCore.pyqtSignal(str)
-    errorMessageReceived    = QtCore.pyqtSignal(str)
-    outputMessageReceived   = QtCore.pyqtSignal(str)
-    rawMessageReceived      = QtCore.pyqtSignal(str)
+    configValueChanged      = QtCore.pyqtSignal(str, object)
+    resultMessageReceived   = QtCore.pyqtSignal(object)
+    errorMessageReceived    = QtCore.pyqtSignal(object)
+    outputMessageReceived   = QtCore.pyqtSignal(object)
+    rawMessageReceived      = QtCore.pyqtSignal(object)
+
+    # emitted with the `metrics.collector` when it is attached (None when detached)
+    metricsChanged          = QtCore.pyqtSignal(object)
 
     def __init__(self, serialclient=client.Leonardo, handler=None,
                  label="Port: ", acqByResp=True, parent=None, **kwargs):
@@ -74,6 +85,9 @@ class SerialIO(QtWidgets.QWidget, eventhandler):
         self.clientkw['handler'] = self if handler is None else handler
 
         self.acqByResp  = acqByResp
+        self.configState = configstate() # the keys are added by the config UIs
+        self.metrics = None
+        self.probes  = []
         self.io     = None
         self.reader = None
         self.active = False     # whether or not this IO is "connected"
@@ -100,15 +114,78 @@ class SerialIO(QtWidgets.QWidget, eventhandler):
 
     def openPort(self, addr):
         self.io     = self.serialclient(addr, **self.clientkw)
+        if self.metrics is not None:
+            self.io.enableMetrics(self.metrics)
         self.active = True
 
+    def openReplay(self, path, speed=None):
+        """opens a log file recorded by `LoggerUI` in place of the serial port
+        (see `replay.replayport`)."""
+        self.openPort(replayport(path, speed=speed))
+
     def closePort(self):
         if self.io is not None:
             self.io.close()
             self.io = None
+            self.configState.invalidate()
             self.serialClosed.emit()
             self.active = False
 
+    def lineSignals(self):
+        """returns the (category, signal) pairs of the line signals."""
+        return (('received', self.messageReceived), ('debug', self.debugMessageReceived),
+                ('info', self.infoMessageReceived), ('config', self.configMessageReceived),
+                ('result', self.resultMessageReceived), ('error', self.errorMessageReceived),
+                ('output', self.outputMessageReceived), ('message', self.rawMessageReceived))
+
+    def enableMetrics(self, metrics=None, path=None, interval=1.0):
+        """attaches a `metrics.collector` (a new one by default), and returns it.
+
+        in addition to the metrics of the client (see `client.enableMetrics()`),
+        the time from the arrival of a line until the Qt slots of its signal
+        have been called is kept as 'deliver.<category>', for the signals that
+        are connected at this point. the `ResultParser`s that are connected
+        to this instance time their parsing and plotting ('parse', 'plot').
+
+        if `path` is given, the snapshot is appended to it every `interval` seconds."""
+        self.disableMetrics()
+        if metrics is None:
+            metrics = collector()
+        self.metrics = metrics
+        if self.io is not None:
+            self.io.enableMetrics(metrics)
+        for category, signal in self.lineSignals():
+            if self.receivers(signal) > 0:
+                # connected last, so that it is called after the other slots
+                probe = self.deliveryProbe(metrics, 'deliver.' + category)
+                signal.connect(probe)
+                self.probes.append((signal, probe))
+        self.metricsChanged.emit(metrics)
+        if path is not None:
+            metrics.startDumping(path, interval)
+        return metrics
+
+    def disableMetrics(self):
+        """detaches the metrics collector (if any)."""
+        if self.metrics is None:
+            return
+        self.metrics.stopDumping()
+        for signal, probe in self.probes:
+            signal.disconnect(probe)
+        self.probes = []
+        if self.io is not None:
+            self.io.disableMetrics()
+        self.metrics = None
+        self.metricsChanged.emit(None)
+
+    @staticmethod
+    def deliveryProbe(metrics, name):
+        def __probe(line):
+            stamp = getattr(line, 'stamp', None)
+            if stamp is not None:
+                metrics.latency(name, time.perf_counter_ns() - stamp)
+        return __probe
+
     def enumeratePorts(self):
         """(re-)enumerate serial ports"""
         ports          = list_ports.comports()
@@ -144,11 +221,67 @@ class SerialIO(QtWidgets.QWidget, eventhandler):
         else:
             self.closePort()
 
-    def request(self, line):
+    def request(self, line, returns=None):
         """sends a line of command (not having the newline character(s))
-        through the serial port."""
+        through the serial port.
+
+        returns the future for the reply if `returns` is specified
+        (see `core.baseclient.request()`)."""
+        if self.io is not None:
+            return self.io.request(line, returns=returns)
+        return None
+
+    def categories(self):
+        """re-implementing eventhandler's `categories`:
+        only the categories whose signals are connected are subscribed."""
+        signals = {
+            'received': (self.messageReceived,),
+            'debug':    (self.debugMessageReceived,),
+            'info':     (self.infoMessageReceived,),
+            'config':   (self.configMessageReceived, self.configElementReceived,
+                         self.configValueChanged),
+            'result':   (self.resultMessageReceived,),
+            'error':    (self.errorMessageReceived,),
+            'output':   (self.outputMessageReceived,),
+            'message':  (self.rawMessageReceived,),
+        }
+        if getattr(self, 'dispatchPending', False) == True:
+            # called from `connectNotify()`: see `scheduleDispatch()`
+            return list(signals.keys())
+        return [name for name, sigs in signals.items()
+                if any(self.receivers(sig) > 0 for sig in sigs)]
+
+    def connectNotify(self, signal):
+        """updates the dispatch table of the client, in case
+        a signal has been connected after the port was opened."""
+        super().connectNotify(signal)
+        self.scheduleDispatch(connected=True)
+
+    def disconnectNotify(self, signal):
+        super().disconnectNotify(signal)
+        self.scheduleDispatch(connected=False)
+
+    def scheduleDispatch(self, connected):
+        """Qt may call `connectNotify()` and `disconnectNotify()` with the lock of
+        the connections held, so `receivers()` must not be called from there.
+        instead, all the categories are dispatched right away (in case a signal
+        has been connected), and the dispatch table is rebuilt from the event loop."""
+        io = getattr(self, 'io', None)
+        if io is None:
+            return
+        pending = getattr(self, 'dispatchPending', False)
+        self.dispatchPending = True
+        if connected == True:
+            io.updateDispatch()
+        if pending == False:
+            QtCore.QMetaObject.invokeMethod(self, "updateDispatch", QtCore.Qt.QueuedConnection)
+
+    @QtCore.pyqtSlot()
+    def updateDispatch(self):
+        """rebuilds the dispatch table of the client from the connected signals."""
+        self.dispatchPending = False
         if self.io is not None:
-            self.io.request(line)
+            self.io.updateDispatch()
 
     def connected(self, client):
         """re-implementing eventhandler's `connected`"""
@@ -171,9 +304,12 @@ class SerialIO(QtWidgets.QWidget, eventhandler):
     def config(self, line):
         """re-implementing eventhandler's `config`"""
         self.configMessageReceived.emit(line)
-        elems = [v.strip() for v in line[1:].split(";") if len(v.strip()) > 0]
-        for elem in elems:
-            self.configElementReceived.emit(elem)
+        if self.receivers(self.configElementReceived) > 0:
+            for elem in line.tokens():
+                self.configElementReceived.emit(elem)
+        # only the values that have changed are notified
+        for key, value in self.configState.update(line):
+            self.configValueChanged.emit(key, value)
 
     def result(self, line):
         """re-implementing eventhandler's `result`"""
@@ -227,6 +363,7 @@ class LineConfigUI(QtCore.QObject):
         self.editor  = QtWidgets.QLineEdit()
         self.label   = QtWidgets.QLabel(label)
         self.command = command
+        self.state   = None
         self.editor.editingFinished.connect(self.dispatchRequest)
         self.setEnabled(False)
 
@@ -241,15 +378,20 @@ class LineConfigUI(QtCore.QObject):
         """
         if output == True:
             self.configValueChanged.connect(serial.request)
-        serial.configElementReceived.connect(self.updateConfigValue)
+        self.state = serial.configState
+        self.state.addConfig(self.command)
+        serial.configValueChanged.connect(self.updateConfigValue)
         serial.serialStatusChanged.connect(self.setEnabled)
 
     def dispatchRequest(self):
+        if self.state is not None:
+            # the reply must update the editor, even if the value stays the same
+            self.state.invalidate(self.command)
         self.configValueChanged.emit(self.command + self.editor.text())
 
-    def updateConfigValue(self, msg):
-        if msg.startswith(self.command):
-            self.editor.setText(msg[len(self.command):])
+    def updateConfigValue(self, key, value):
+        if key == self.command:
+            self.editor.setText(value)
 
 class ModeConfigUI(QtWidgets.QComboBox):
     # emitted when the user changed the selection
@@ -261,6 +403,7 @@ class ModeConfigUI(QtWidgets.QComboBox):
     def __init__(self, options, parent=None):
         """options -- {modestr: modecmd} dict"""
         super().__init__(parent=parent)
+        self.state = None
         self.loadOptions(options)
         self.setEnabled(False)
 
@@ -271,13 +414,15 @@ class ModeConfigUI(QtWidgets.QComboBox):
         """
         if output == True:
             self.configValueChanged.connect(serial.request)
-        serial.configElementReceived.connect(self.updateConfigValue)
+        self.state = serial.configState
+        self.state.addModes(self._commands)
+        serial.configValueChanged.connect(self.updateConfigValue)
         serial.serialStatusChanged.connect(self.setEnabled)
         serial.errorMessageReceived.connect(self.updateWithError)
 
     def loadOptions(self, options):
         self._options = options
-        self._abbreviations = ''.join(opt.command for opt in options.values())
+        self._commands = [opt.command for opt in options.values()]
         for opt in options.keys():
             self.addItem(opt)
         self.setCurrentIndex(0)
@@ -290,14 +435,18 @@ class ModeConfigUI(QtWidgets.QComboBox):
     def updateWithSelection(self, idx):
         if self.valueChanging == False:
             self.valueChanging = True
-            self.configValueChanged.emit(self._abbreviations[idx])
+            if self.state is not None:
+                # the reply must update the selection, even if it stays the same
+                for command in self._commands:
+                    self.state.invalidate(command)
+            self.configValueChanged.emit(self._commands[idx])
         else:
             pass
 
-    def updateConfigValue(self, msg):
-        if all(c in msg for c in self._abbreviations):
-            idx = msg.index(']') - 2
-            # print("mode config: {} (index={})".format(msg, idx))
+    def updateConfigValue(self, key, value):
+        if (value == True) and (key in self._commands):
+            idx = self._commands.index(key)
+            # print("mode config: {} (index={})".format(key, idx))
             self.setCurrentIndex(idx)
             self.currentModeChanged.emit(self.currentText())
             self.prevIndex = idx
@@ -351,11 +500,9 @@ class ActionUI(QtWidgets.QPushButton):
             print("*unknown return type for {}: {}".format(label, returns))
             returns = None
         self.returns = returns
+        criteria = compilecriteria(criteria)
         if criteria is not None:
-            if callable(criteria):
-                self.evaluate = criteria
-            else:
-                print(f"***criteria '{criteria}' is not callable and hence disabled. try using ublock.testResult()", flush=True)
+            self.evaluate = criteria
 
         self.label = label
         self.waiting = False
@@ -394,26 +541,30 @@ class RepeatUI(QtWidgets.QWidget, loophandler):
     """the GUI class for managing repeat number"""
     dispatchingRequest  = QtCore.pyqtSignal(str)
     repeatStarting      = QtCore.pyqtSignal(str, int, int)
+    repeatTiming        = QtCore.pyqtSignal(object)
     repeatEnding        = QtCore.pyqtSignal(str, int, int)
 
     def __init__(self, label, command, header='Repeat',
                  returns='result', criteria=None, strict=None,
-                 parent=None, interval=0):
+                 parent=None, interval=0, timeout=None, retries=0,
+                 ontimeout='skip', schedule='start', batch=None, history=None):
+        """see `core.loop` for `interval`, `timeout`, `retries`, `ontimeout`,
+        `schedule`, `batch` and `history`."""
         QtWidgets.QWidget.__init__(self, parent=parent)
         loophandler.__init__(self)
-        self.loop       = loop(command, 1, io=self, interval=interval, handler=self)
+        self.loop       = loop(command, 1, io=self, interval=interval, handler=self,
+                               timeout=timeout, retries=retries, ontimeout=ontimeout,
+                               schedule=schedule, batch=batch, history=history)
         self.loopthread = None
 
         if not returns in ('result', 'config'):
             print("*unknown return type for {}: {}".format(label, returns))
             returns = None
         self.returns = returns
-        self.strict = strict
+        self.strict = compilecriteria(strict)
+        criteria = compilecriteria(criteria)
         if criteria is not None:
-            if callable(criteria):
-                self.evaluate = criteria
-            else:
-                print(f"***criteria '{criteria}' is not callable and hence disabled. try using ublock.testResult()", flush=True)
+            self.evaluate = criteria
 
         self.header  = QtWidgets.QLabel(header)
         self.editor  = QtWidgets.QLineEdit()
@@ -508,7 +659,7 @@ class RepeatUI(QtWidgets.QWidget, loophandler):
 
     def evaluate(self, resultline):
         if self.strictmode == True:
-            return any(resultline[1:].startswith(status) for status in self.strict)
+            return self.strict(resultline)
         else:
             return True
 
@@ -517,6 +668,12 @@ class RepeatUI(QtWidgets.QWidget, loophandler):
         self.repeatStarting.emit(cmd, num, idx)
         self.status.setText(f"Running: {idx+1} of {num}...")
 
+    def timing(self, timing):
+        """emits the `core.trialtiming` of each trial through `repeatTiming`."""
+        if timing.status in ('retry', 'skip'):
+            print("***{}: no reply within {} s ({})".format(timing.command, self.loop.timeout, timing.status))
+        self.repeatTiming.emit(timing)
+
     def done(self, cmd, planned, actual):
         self.button.setText(self.buttonLabel)
         self.loopthread = None
@@ -565,13 +722,17 @@ class ResultParser(QtCore.QObject):
 
     + status -- str-only token
     + value  -- (str, int) token
-    + array  -- (str, [int]) token
-    """
+    + array  -- (str, array of int) token
+
+    each result line is emitted as a `core.trialresult` through `trialReceived`.
+    the per-token signals (from `beginParsing` to `endParsing`) are only
+    emitted when any of them are connected."""
+    trialReceived        = QtCore.pyqtSignal(object)
     beginParsing         = QtCore.pyqtSignal()
     endParsing           = QtCore.pyqtSignal()
     resultStatusReceived = QtCore.pyqtSignal(str)
     resultValueReceived  = QtCore.pyqtSignal(str, int)
-    resultArrayReceived  = QtCore.pyqtSignal(str, list)
+    resultArrayReceived  = QtCore.pyqtSignal(str, object)
     unknownResultReceived= QtCore.pyqtSignal(str)
 
     def __init__(self, parent=None, status=(), values=(), arrays=()):
@@ -579,62 +740,72 @@ class ResultParser(QtCore.QObject):
         self.status = list(status)
         self.values = list(values)
         self.arrays = list(arrays)
+        self.parser = resultparser(self.status, self.values, self.arrays)
+        self.serial = None
+        self.metrics = None
 
     def setSerialIO(self, serial):
         """serial: the SerialIO instance."""
         if serial is not None:
+            self.serial = serial
             serial.resultMessageReceived.connect(self.parseResult)
-
-    def __parseSingleResult(self, token):
-        token = token.strip()
-        if debug == True:
-            print(f"token({token})")
-        for s in self.status:
-            if debug == True:
-                print(f"testing status: {s}...")
-            if token == s:
-                self.resultStatusReceived.emit(s)
-                return
-        for val in self.values:
-            if debug == True:
-                print(f"testing value: {val}...")
-            try:
-                if token.startswith(val):
-                    arg = int(token[len(val):])
-                    self.resultValueReceived.emit(val, arg)
-                    return
-            except ValueError:
-                print_exc()
-                print("***error while parsing value '{}': {}".format(val, token))
-                return
-        for arr in self.arrays:
-            if debug == True:
-                print(f"testing array: {arr}...")
-            try:
-                if token.startswith(arr):
-                    arg = token[len(arr):]
-                    if (arg[0] != '[') or (arg[-1] != ']'):
-                        continue
-                    args = arg[1:-1].split(',')
-                    arglist = []
-                    for elem in args:
-                        if len(elem.strip()) == 0:
-                            continue
-                        arglist.append(int(elem))
-                    self.resultArrayReceived.emit(arr, arglist)
-                    return
-            except ValueError:
-                print_exc()
-                print("***error while parsing array '{}': {}".format(arr, arg))
-                return
-        # no match
-        self.unknownResultReceived.emit(token)
+            serial.metricsChanged.connect(self.setMetrics)
+
+    def setMetrics(self, metrics):
+        """switches between `parseResult` and `parseResultMetered`,
+        depending on whether `metrics` (a `metrics.collector`) is None."""
+        if (metrics is None) == (self.metrics is None):
+            self.metrics = metrics
+            return
+        if metrics is None:
+            self.serial.resultMessageReceived.disconnect(self.parseResultMetered)
+            self.serial.resultMessageReceived.connect(self.parseResult)
+        else:
+            self.serial.resultMessageReceived.disconnect(self.parseResult)
+            self.serial.resultMessageReceived.connect(self.parseResultMetered)
+        self.metrics = metrics
+
+    def parseResultMetered(self, line):
+        """`parseResult` while the metrics are enabled: the parsing and
+        the slots of `trialReceived` (i.e. the views) are timed."""
+        metrics = self.metrics
+        if (metrics is None) or (self.receivers(self.trialReceived) == 0):
+            self.parseResult(line)
+            return
+        start   = time.perf_counter_ns()
+        trial   = self.parser.parseTrial(line)
+        parsed  = time.perf_counter_ns()
+        self.trialReceived.emit(trial)
+        metrics.latency('parse', parsed - start)
+        metrics.latency('plot', time.perf_counter_ns() - parsed)
+        if any(self.receivers(sig) > 0 for sig in (self.beginParsing, self.endParsing,
+                    self.resultStatusReceived, self.resultValueReceived,
+                    self.resultArrayReceived, self.unknownResultReceived)):
+            self.emitTokens(line)
 
     def parseResult(self, line):
+        """parses the line through `core.resultparser`, and emits the result."""
+        if self.receivers(self.trialReceived) > 0:
+            trial = self.parser.parseTrial(line)
+            if debug == True:
+                print(f"trial: {trial}")
+            self.trialReceived.emit(trial)
+        if any(self.receivers(sig) > 0 for sig in (self.beginParsing, self.endParsing,
+                    self.resultStatusReceived, self.resultValueReceived,
+                    self.resultArrayReceived, self.unknownResultReceived)):
+            self.emitTokens(line)
+
+    def emitTokens(self, line):
         self.beginParsing.emit()
-        tokens = line[1:].split(protocol.DELIMITER)
-        for token in tokens:
-            self.__parseSingleResult(token)
+        for kind, name, value in self.parser.parse(line):
+            if kind == resultparser.STATUS:
+                self.resultStatusReceived.emit(name)
+            elif kind == resultparser.VALUE:
+                self.resultValueReceived.emit(name, value)
+            elif kind == resultparser.ARRAY:
+                self.resultArrayReceived.emit(name, value)
+            else:
+                self.unknownResultReceived.emit(name)
         self.endParsing.emit()
 
 class ResultStatsView(QtWidgets.QGroupBox):
@@ -664,7 +835,7 @@ class ResultStatsView(QtWidgets.QGroupBox):
         self.setLayout(self.layout)
 
     def setResultParser(self, parser):
-        parser.resultStatusReceived.connect(self.addStatus)
+        parser.trialReceived.connect(self.addTrial)
 
     def clearCounts(self):
         for field in self.fields.values():
@@ -674,6 +845,10 @@ class ResultStatsView(QtWidgets.QGroupBox):
         prev = int(field.text())
         field.setText(str(prev+1))
 
+    def addTrial(self, trial):
+        if trial.status is not None:
+            self.addStatus(trial.status)
+
     def addStatus(self, status):
         if status in self.summarized:
             self.__incrementField(self.fields[status])
@@ -685,7 +860,7 @@ class SessionView(pg.PlotWidget):
     a complete set of trials during one session."""
 
     resultStatusReceived    = QtCore.pyqtSignal(int,str)
-    resultArrayReceived     = QtCore.pyqtSignal(int,str,list)
+    resultArrayReceived     = QtCore.pyqtSignal(int,str,object)
     refreshing              = QtCore.pyqtSignal(object)
 
     plotted     = False
@@ -707,10 +882,7 @@ class SessionView(pg.PlotWidget):
             super().__setattr__(name, value)
 
     def setResultParser(self, parser):
-        parser.beginParsing.connect(self.initPlotting)
-        parser.resultStatusReceived.connect(self.plotResultStatus)
-        parser.resultArrayReceived.connect(self.plotResultArray)
-        parser.endParsing.connect(self.finalizePlotting)
+        parser.trialReceived.connect(self.plotTrial)
 
     def addPlotter(self, item):
         self.plotters.append(item)
@@ -727,20 +899,18 @@ class SessionView(pg.PlotWidget):
         self.index = 0
         self.refreshing.emit(self)
 
-    def initPlotting(self):
+    def plotTrial(self, trial):
+        """plots the trial in the next row, if its status is
+        accepted by any of the plotters."""
+        if trial.status is None:
+            return
         self.plotted = False
-
-    def finalizePlotting(self):
+        self.resultStatusReceived.emit(self.index, trial.status)
         if self.plotted == True:
+            for name, values in trial.arrays.items():
+                self.resultArrayReceived.emit(self.index, name, values)
             self.index += 1
 
-    def plotResultStatus(self, status):
-        self.resultStatusReceived.emit(self.index, status)
-
-    def plotResultArray(self, name, values):
-        if self.plotted == True:
-            self.resultArrayReceived.emit(self.index, name, values)
-
     def scheduleFurtherPlotting(self):
         self.plotted = True
 
@@ -814,7 +984,8 @@ class ArrayPlotItem(QtCore.QObject):
         if debug == True:
             print(f"addResultArray({index}, {name})")
         if name in self.plotters.keys():
-            self.plotters[name].addPoints(x=values, y=(index,)*len(values))
+            values = np.asarray(values)
+            self.plotters[name].addPoints(x=values, y=np.full(len(values), index))
 
 class LoggerUI(QtWidgets.QGroupBox):
     """a class that handles generation of (and writing to) the log file."""
@@ -822,10 +993,10 @@ class LoggerUI(QtWidgets.QGroupBox):
     loggers = {}
 
     @classmethod
-    def get(cls, name, label=None, fmt="{}_%Y-%m-%d_%H%M%S.log"):
+    def get(cls, name, label=None, fmt="{}_%Y-%m-%d_%H%M%S.log", timestamps=False):
         """used for sharing the log file."""
         if name not in cls.loggers.keys():
-            cls.loggers[name] = cls(name, label=label, fmt=fmt)
+            cls.loggers[name] = cls(name, label=label, fmt=fmt, timestamps=timestamps)
         return cls.loggers[name]
 
     @classmethod
@@ -834,11 +1005,16 @@ class LoggerUI(QtWidgets.QGroupBox):
         from the device show up on the standard output."""
         print(line, flush=True)
 
-    def __init__(self, name, label=None, fmt="{}_%Y-%m-%d_%H%M%S.log", parent=None):
+    def __init__(self, name, label=None, fmt="{}_%Y-%m-%d_%H%M%S.log", timestamps=False,
+                 parent=None):
+        """timestamps: if True, each line is prefixed with the wall-clock time
+        of its arrival (seconds since the epoch, in microsecond precision)
+        followed by a tab."""
         if label is None:
             label = "'{}' log file".format(name)
         QtWidgets.QGroupBox.__init__(self, label, parent=parent)
         self.name       = name
+        self.timestamps = timestamps
         self.baseformat = fmt.format(self.name)
         self.logfile    = None
         self.fileinfo   = None
@@ -906,7 +1082,17 @@ class LoggerUI(QtWidgets.QGroupBox):
         """writes a line to the log file.
         warns if there is no open file."""
         if self.logfile is not None:
-            print(line, file=self.logfile, flush=True)
+            if getattr(line, 'arrays', None) is not None:
+                # binary frames are logged in the text form
+                line = line.expand()
+            if self.timestamps == True:
+                stamp = getattr(line, 'stamp', None)
+                if stamp is None:
+                    # e.g. running notes
+                    stamp = time.perf_counter_ns()
+                print("{:.6f}\t{}".format(walltime(stamp) / 1e9, line), file=self.logfile, flush=True)
+            else:
+                print(line, file=self.logfile, flush=True)
         else:
             print("{}no log file is open".format(protocol.ERROR), flush=True)
 
@@ -1133,9 +1319,15 @@ class TaskWidget(QtWidgets.QWidget):
         # add Actions
         widget.actions  = OrderedDict()
         for name, action in model.actions.items():
-            uitype = RepeatUI if action.repeats == True else ActionUI
-            uiobj = uitype(action.label, action.command, returns=action.returns,
-                            criteria=action.criteria, strict=action.strict)
+            if action.repeats == True:
+                uiobj = RepeatUI(action.label, action.command, returns=action.returns,
+                                 criteria=action.criteria, strict=action.strict,
+                                 interval=action.interval, timeout=action.timeout,
+                                 retries=action.retries, ontimeout=action.ontimeout,
+                                 batch=action.batch)
+            else:
+                uiobj = ActionUI(action.label, action.command, returns=action.returns,
+                                 criteria=action.criteria, strict=action.strict)
             uiobj.setSerialIO(widget.serial, output=True)
             widget.actions[name] = uiobj
 
@@ -1174,7 +1366,8 @@ class TaskWidget(QtWidgets.QWidget):
         # add loggerUI
         widget.loggers  = OrderedDict()
         for name, logger in model.loggers.items():
-            uiobj = LoggerUI.get(logger.name, label=logger.label, fmt=logger.fmt)
+            uiobj = LoggerUI.get(logger.name, label=logger.label, fmt=logger.fmt,
+                                 timestamps=logger.timestamps)
             uiobj.attachSerialIO(widget.serial)
             if 'note' in model.features:
                 uiobj.attachNoteUI(widget.features['note'])
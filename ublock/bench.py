@@ -0,0 +1,740 @@
+import os
+import sys
+import time
+import random
+import tempfile
+import threading
+import multiprocessing
+import serial
+
+from .core import iothread, client, eventhandler, linebuffer, rawline, dispatcher, protocol, \
+                  rxline, resultparser, decodearray, encodeframe, decodeframe, tokenize, splittokens, \
+                  loop, loophandler, trialhistory
+
+"""throughput benchmarks for the ublock I/O pipeline.
+
+run as `python -m ublock.bench [name ...]`; with no names, all the
+benchmarks are run in turn."""
+
+def resultline(nlicks=50):
+    """generates a typical result line, with `nlicks` elements in its array."""
+    licks = ','.join(str(100 + 37 * i) for i in range(nlicks))
+    return "+hit;wait1234;lick[{}];\r\n".format(licks)
+
+class memoryport:
+    """a read-only, port-like object that serves a fixed payload.
+
+    `in_waiting` reports at most `chunksize` bytes at a time, to mimic
+    the driver-side receive buffer. it raises `serial.SerialException`
+    when the payload has been read out, so that `iothread` finishes.
+    if `ready` (a `threading.Event`) is given, reading blocks until it is set."""
+
+    def __init__(self, payload, chunksize=4096, ready=None):
+        self.payload    = memoryview(payload)
+        self.offset     = 0
+        self.chunksize  = chunksize
+        self.timeout    = None
+        self.ready      = ready
+
+    @property
+    def in_waiting(self):
+        return min(len(self.payload) - self.offset, self.chunksize)
+
+    def read(self, size=1):
+        if self.ready is not None:
+            self.ready.wait()
+        if self.offset >= len(self.payload):
+            raise serial.SerialException("end of payload")
+        data = self.payload[self.offset:(self.offset+size)].tobytes()
+        self.offset += len(data)
+        return data
+
+    def write(self, data):
+        return len(data)
+
+    def close(self):
+        pass
+
+class counter:
+    """a minimal delegate for `iothread`, that only counts lines."""
+
+    def __init__(self):
+        self.count = 0
+
+    def connected(self):
+        pass
+
+    def closed(self):
+        pass
+
+    def handleLine(self, line):
+        self.count += 1
+
+def readthroughput(chunked, nlines=20000, nlicks=50, chunksize=4096):
+    """measures the time for an `iothread` to read `nlines` result lines.
+    returns (lines/sec, MB/sec)."""
+    payload = resultline(nlicks).encode() * nlines
+    port    = memoryport(payload, chunksize=chunksize)
+    handler = counter()
+    start   = time.perf_counter()
+    thread  = iothread(port, handler, chunked=chunked)
+    thread.join()
+    elapsed = time.perf_counter() - start
+    if handler.count != nlines:
+        raise RuntimeError("{} lines were received (expected {})".format(handler.count, nlines))
+    return nlines / elapsed, len(payload) / elapsed / 1e6
+
+def readers(nlines=20000):
+    """compares the chunked reading of `iothread` against its per-byte reading."""
+    print("iothread reading ({} lines each):".format(nlines))
+    for nlicks in (0, 10, 100):
+        for chunked in (False, True):
+            lps, mbps = readthroughput(chunked, nlines=nlines, nlicks=nlicks)
+            mode = "chunked" if chunked == True else "per-byte"
+            print("  {:>3} licks/line, {:<8}: {:>10.0f} lines/s ({:.2f} MB/s)".format(nlicks, mode, lps, mbps),
+                  flush=True)
+
+class linecounter(eventhandler):
+    """an `eventhandler` that only counts the received lines."""
+
+    def __init__(self):
+        self.count = 0
+
+    def received(self, line):
+        self.count += 1
+
+def streamdevices(ports, line, nlines):
+    """the target of the device process for `multiplexing()`."""
+    from .sim import streamer
+    devices = [streamer(port, line, count=nlines) for port in ports]
+    while any(device.sent < nlines for device in devices):
+        time.sleep(0.01)
+    time.sleep(3600) # until terminated
+
+def hubthroughput(usehub, nports=16, nlines=5000, nlicks=10):
+    """measures the time for `nports` clients to receive `nlines` lines each,
+    either through their own `iothread`s or through a shared `hub`.
+    the simulated devices run in a separate process.
+    returns (lines/sec, CPU usage of the host process in %)."""
+    from .transport import loopback
+    from .hub import hub
+    pairs   = [loopback() for i in range(nports)]
+    line    = resultline(nlicks).rstrip()
+    device  = multiprocessing.get_context('fork').Process(target=streamdevices,
+                    args=([dev for host, dev in pairs], line, nlines), daemon=True)
+    iohub   = hub() if usehub == True else None
+    wall    = time.perf_counter()
+    cpu     = time.process_time()
+    device.start()
+    handlers = [linecounter() for i in range(nports)]
+    clients  = [client(host, handler=handler, hub=iohub) for (host, dev), handler in zip(pairs, handlers)]
+    total    = nports * nlines
+    while sum(handler.count for handler in handlers) < total:
+        time.sleep(0.001)
+    wall    = time.perf_counter() - wall
+    cpu     = time.process_time() - cpu
+    device.terminate()
+    for c in clients:
+        c.close()
+    if iohub is not None:
+        iohub.close()
+    return total / wall, 100 * cpu / wall
+
+def multiplexing(nlines=5000):
+    """compares N independent `iothread`s against a single `hub` thread."""
+    print("multiplexing ({} lines per port):".format(nlines))
+    for nports in (1, 4, 16, 32):
+        for usehub in (False, True):
+            lps, cpu = hubthroughput(usehub, nports=nports, nlines=nlines)
+            mode = "hub" if usehub == True else "iothreads"
+            print("  {:>2} ports, {:<9}: {:>10.0f} lines/s (host CPU {:.0f}%)".format(nports, mode, lps, cpu),
+                  flush=True)
+
+class resultcounter(eventhandler):
+    """an `eventhandler` that only subscribes to RESULT lines,
+    and reads their tokens."""
+
+    def __init__(self):
+        self.count = 0
+
+    def result(self, line):
+        self.count += len(line.tokens())
+
+def dispatchthroughput(prefix, nlines=100000, nlicks=50, chunksize=4096):
+    """measures the time for a `dispatcher` (that only subscribes to RESULT
+    lines) to split and dispatch `nlines` lines, whose prefix is replaced
+    with `prefix`. returns lines/sec."""
+    sink = dispatcher()
+    sink.handler = resultcounter()
+    lines   = linebuffer(lambda line, stamp: sink.handleLine(rawline(line, stamp)))
+    payload = (prefix + resultline(nlicks)[1:]).encode() * nlines
+    start   = time.perf_counter()
+    for offset in range(0, len(payload), chunksize):
+        lines.feed(payload[offset:(offset+chunksize)], 0)
+    return nlines / (time.perf_counter() - start)
+
+def dispatching(nlines=100000):
+    """compares the cost of lines that are not observed by the handler
+    (never decoded) against those that are decoded and tokenized."""
+    print("dispatching ({} lines each):".format(nlines))
+    for prefix, label in ((protocol.DEBUG, "unobserved"), (protocol.RESULT, "observed")):
+        lps = dispatchthroughput(prefix, nlines=nlines)
+        print("  {:<10}: {:>10.0f} lines/s".format(label, lps), flush=True)
+
+def linearparse(status, values, arrays, token):
+    """the reference parser that scans all the statuses, values and arrays
+    in turn for each token (as `app.ResultParser` used to do)."""
+    for s in status:
+        if token == s:
+            return (resultparser.STATUS, s, None)
+    for val in values:
+        if token.startswith(val):
+            return (resultparser.VALUE, val, int(token[len(val):]))
+    for arr in arrays:
+        if token.startswith(arr) and token[len(arr)] == '[' and token[-1] == ']':
+            return (resultparser.ARRAY, arr, [int(elem) for elem in token[len(arr)+1:-1].split(',')])
+    return (resultparser.UNKNOWN, token, None)
+
+def parsethroughput(nfields, compiled, nlines=20000):
+    """measures the time to parse `nlines` result lines against a model with
+    `nfields` fields of each kind. the lines use the last field of each kind.
+    returns lines/sec."""
+    status  = ["status{}".format(i) for i in range(nfields)]
+    values  = ["value{}_".format(i) for i in range(nfields)]
+    arrays  = ["array{}_".format(i) for i in range(nfields)]
+    line    = rxline("+{};{}1234;{}[1,2,3,4,5];".format(status[-1], values[-1], arrays[-1]))
+    tokens  = line.tokens()
+    parser  = resultparser(status, values, arrays)
+    start   = time.perf_counter()
+    if compiled == True:
+        for i in range(nlines):
+            parser.parse(line)
+    else:
+        for i in range(nlines):
+            [linearparse(status, values, arrays, token) for token in tokens]
+    return nlines / (time.perf_counter() - start)
+
+def parsing(nlines=20000):
+    """compares `core.resultparser` against the linear scan, as the number
+    of the result fields grows."""
+    print("result parsing ({} lines each):".format(nlines))
+    for nfields in (3, 30, 100):
+        for compiled in (False, True):
+            lps  = parsethroughput(nfields, compiled, nlines=nlines)
+            mode = "compiled" if compiled == True else "linear"
+            print("  {:>3} fields/kind, {:<8}: {:>10.0f} lines/s".format(nfields, mode, lps), flush=True)
+
+def arraythroughput(mode, nelems, nlines=200):
+    """measures the time to decode `nlines` array payloads of `nelems` elements,
+    with `mode` being one of 'per-element' (one `int()` call per element, as
+    `ResultParser` used to do), 'vectorized' (`decodearray()`) or 'binary'
+    (from binary frames). returns elements/sec."""
+    elems   = [100 + 37 * i for i in range(nelems)]
+    payload = ','.join(str(v) for v in elems)
+    frame   = encodeframe(protocol.RESULT, 'hit', {'lick': elems})
+    start   = time.perf_counter()
+    for i in range(nlines):
+        if mode == 'per-element':
+            [int(elem) for elem in payload.split(',') if len(elem.strip()) > 0]
+        elif mode == 'vectorized':
+            decodearray(payload)
+        else:
+            decodeframe(frame)
+    return nlines * nelems / (time.perf_counter() - start)
+
+def arrays(nlines=200):
+    """compares the decoding of long array tokens."""
+    print("array decoding ({} arrays each):".format(nlines))
+    for nelems in (10, 1000, 10000):
+        for mode in ('per-element', 'vectorized', 'binary'):
+            eps = arraythroughput(mode, nelems, nlines=nlines)
+            print("  {:>5} elements/array, {:<11}: {:>12.0f} elements/s".format(nelems, mode, eps), flush=True)
+
+def tokenizing(nlines=50000):
+    """compares `tokenize()` against `splittokens()` (splitting the line into a list)."""
+    print("tokenizing ({} lines each):".format(nlines))
+    for nlicks in (0, 50):
+        line = resultline(nlicks).rstrip()
+        for mode in ('split', 'tokenize', 'spans', 'first'):
+            start = time.perf_counter()
+            if mode == 'split':
+                for i in range(nlines):
+                    splittokens(line)
+            elif mode == 'tokenize':
+                for i in range(nlines):
+                    for token in tokenize(line):
+                        pass
+            elif mode == 'spans':
+                for i in range(nlines):
+                    for span in tokenize(line, spans=True):
+                        pass
+            else:
+                # e.g. testing only the status
+                for i in range(nlines):
+                    next(tokenize(line))
+            lps = nlines / (time.perf_counter() - start)
+            print("  {:>3} licks/line, {:<8}: {:>10.0f} lines/s".format(nlicks, mode, lps), flush=True)
+
+def writecohort(directory, nfiles, ntrials, nlicks=50):
+    """writes `nfiles` time-stamped session logs with `ntrials` trials each,
+    in the format of `app.LoggerUI`. returns the list of the paths."""
+    statuses = ('hit', 'miss', 'catch')
+    paths    = []
+    for i in range(nfiles):
+        path = os.path.join(directory, "session{:03d}.log".format(i))
+        with open(path, 'w') as logfile:
+            stamp = 1.79e9 + 3600 * i
+            for j in range(ntrials):
+                licks = ','.join(str(100 + 37 * k + j) for k in range(nlicks))
+                print("{:.6f}\t>Delay".format(stamp), file=logfile)
+                print("{:.6f}\t+{};wait{};lick[{}];".format(stamp + 0.5, statuses[j % 3], 1000 + j, licks),
+                      file=logfile)
+                stamp += 1.0
+        paths.append(path)
+    return paths
+
+def converting(nfiles=16, ntrials=2000):
+    """compares the per-line parsing of a cohort of session logs into
+    `core.trialresult` objects against the conversion into `.npz` files,
+    and the loading of the converted files."""
+    from .convert import convertlogs, loadsession
+    status, values, arrays = ('hit', 'miss', 'catch'), ('wait',), ('lick',)
+    print("converting ({} logs of {} trials each):".format(nfiles, ntrials))
+    with tempfile.TemporaryDirectory() as directory:
+        paths = writecohort(directory, nfiles, ntrials)
+
+        start  = time.perf_counter()
+        parser = resultparser(status, values, arrays)
+        for path in paths:
+            with open(path, 'r') as logfile:
+                for line in logfile:
+                    text = line.partition('\t')[2]
+                    if text[:1] == protocol.RESULT:
+                        parser.parseTrial(text.strip())
+        print("  {:<16}: {:>8.3f} s".format("per-line", time.perf_counter() - start), flush=True)
+
+        for processes in (1, None):
+            start = time.perf_counter()
+            convertlogs(paths, (status, values, arrays), processes=processes)
+            nprocs = processes or multiprocessing.cpu_count()
+            label  = "npz, {} process{}".format(nprocs, "" if nprocs == 1 else "es")
+            print("  {:<16}: {:>8.3f} s".format(label, time.perf_counter() - start), flush=True)
+
+        start = time.perf_counter()
+        for path in paths:
+            loadsession(os.path.splitext(path)[0] + '.npz')
+        print("  {:<16}: {:>8.3f} s".format("loading npz", time.perf_counter() - start), flush=True)
+
+def percentiles(samples, points=(50, 90, 99)):
+    """returns the values at `points` (in %) of `samples`, and their maximum."""
+    ordered = sorted(samples)
+    if len(ordered) == 0:
+        return [float('nan')] * (len(points) + 1)
+    return [ordered[min(int(len(ordered) * point / 100), len(ordered) - 1)] for point in points] \
+                + [ordered[-1]]
+
+def lineshape(shape):
+    """returns the line that the simulated device writes for `shape`, one of:
+    'status' (a status and a value), 'licks' (with a 50-element array),
+    'long' (with a 1000-element array), or 'binary' (the 'licks' line as a frame)."""
+    if shape == 'status':
+        return "+hit;wait1234;"
+    elif shape == 'licks':
+        return resultline(50).rstrip()
+    elif shape == 'long':
+        return resultline(1000).rstrip()
+    elif shape == 'binary':
+        return encodeframe(protocol.RESULT, 'hit;wait1234', {'lick': [100 + 37 * i for i in range(50)]})
+    raise ValueError("unknown line shape: {}".format(shape))
+
+class stageprobe:
+    """records the time at which each line passes each stage of the pipeline."""
+
+    STAGES = ('transport', 'dispatch', 'queue', 'parse', 'views')
+
+    def __init__(self):
+        self.sent       = []  # written by the device
+        self.arrived    = []  # read by the I/O thread (the stamp of the line)
+        self.dispatched = []  # passed to SerialIO (the I/O thread)
+        self.queued     = []  # delivered to the GUI thread
+        self.parsed     = []  # emitted as a `trialresult` by ResultParser
+        self.viewed     = []  # after all the views have been updated
+
+    def dispatch(self, line):
+        self.dispatched.append(time.perf_counter_ns())
+        self.arrived.append(line.stamp)
+
+    def queue(self, line):
+        self.queued.append(time.perf_counter_ns())
+
+    def parse(self, trial):
+        self.parsed.append(time.perf_counter_ns())
+
+    def view(self, trial):
+        self.viewed.append(time.perf_counter_ns())
+
+    def latencies(self):
+        """returns {stage: [latency in us, ...]}, including the 'total' latency."""
+        points = (self.sent, self.arrived, self.dispatched, self.queued, self.parsed, self.viewed)
+        count  = min(len(stamps) for stamps in points)
+        stages = {}
+        for i, stage in enumerate(self.STAGES):
+            stages[stage] = [(points[i+1][j] - points[i][j]) / 1000 for j in range(count)]
+        stages['total'] = [(self.viewed[j] - self.sent[j]) / 1000 for j in range(count)]
+        return stages
+
+def e2etask():
+    """the task model used by `endtoend()`."""
+    from .model import Task, StatusPlot, ArrayPlot
+    task = Task("Bench")
+    task.setResult(status=('hit', 'miss', 'catch'), values=('wait',), arrays=('lick',))
+    task.addView('stats', summarized=('hit', 'miss', 'catch'), rewarded=('hit',))
+    task.addView('session', items=(StatusPlot({'hit': 'b', 'miss': 'k', 'catch': 'm'}),
+                                   ArrayPlot({'lick': 'g'})), xwidth=5000)
+    return task
+
+def e2ethroughput(shape='licks', rate=None, nlines=500, allocations=False, timeout=120):
+    """streams `nlines` lines of `shape` (see `lineshape()`) at `rate` lines/sec
+    (or as fast as possible) from a simulated device over a pty, through
+    `iothread` -> `client.handleLine` -> `app.SerialIO` -> `app.ResultParser`
+    -> the stats and session views of a headless `app.fromTask()` widget.
+
+    returns a dict with 'lines' (the number of lines through the pipeline),
+    'lps' (lines/sec), 'latencies' (see `stageprobe.latencies()`), and
+    (if `allocations` is True) 'allocated' (the net bytes allocated per line)
+    and 'peak' (the peak of the traced memory, in bytes)."""
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    import tracemalloc
+    from .transport import ptypair
+    from .sim import streamer
+    from .app import fromTask, mainapp, QtCore
+
+    probe   = stageprobe()
+    widget  = fromTask(e2etask(), 'leonardo')
+    serial  = widget.serial
+
+    # the probes are connected around each stage, in the order of the pipeline
+    result  = serial.result
+    def __dispatched(line):
+        probe.dispatch(line)
+        result(line)
+    serial.result = __dispatched
+    serial.resultMessageReceived.disconnect()
+    serial.resultMessageReceived.connect(probe.queue)
+    widget.result.setSerialIO(serial)
+    widget.result.trialReceived.disconnect()
+    widget.result.trialReceived.connect(probe.parse)
+    for view in widget.views.values():
+        view.setResultParser(widget.result)
+    widget.result.trialReceived.connect(probe.view)
+
+    if allocations == True:
+        tracemalloc.start()
+        baseline = tracemalloc.get_traced_memory()[0]
+    host, dev = ptypair()
+    serial.openPort(host)
+    device  = streamer(dev, lineshape(shape), rate=rate, count=nlines, stamps=probe.sent)
+
+    deadline = time.perf_counter() + timeout
+    def __check():
+        if (len(probe.viewed) >= nlines) or (time.perf_counter() > deadline):
+            mainapp.quit()
+    timer = QtCore.QTimer()
+    timer.timeout.connect(__check)
+    timer.start(10)
+    mainapp.exec()
+    timer.stop()
+
+    measured = {}
+    if allocations == True:
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        measured['allocated'] = (current - baseline) / max(len(probe.viewed), 1)
+        measured['peak']      = peak - baseline
+    serial.closePort()
+    device.stop()
+    widget.deleteLater()
+
+    count = len(probe.viewed)
+    if count < nlines:
+        print("***only {} of {} lines passed the pipeline".format(count, nlines), flush=True)
+    measured['lines']     = count
+    measured['lps']       = count / max((probe.viewed[-1] - probe.sent[0]) / 1e9, 1e-9) if count > 0 else 0
+    measured['latencies'] = probe.latencies()
+    return measured
+
+def endtoend(nlines=500, rates=(None, 50), shapes=('status', 'licks', 'long', 'binary')):
+    """streams result lines from a pty-backed device through the whole
+    pipeline up to the views (in a headless Qt application), and reports
+    lines/sec, the per-stage latency percentiles and the allocations."""
+    print("end-to-end ({} lines each; latencies in us as p50/p90/p99/max):".format(nlines))
+    for shape in shapes:
+        for rate in rates:
+            measured = e2ethroughput(shape=shape, rate=rate, nlines=nlines)
+            label    = "max" if rate is None else "{}/s".format(rate)
+            print("  {:<6} @ {:>6}: {:>8.0f} lines/s".format(shape, label, measured['lps']), flush=True)
+            for stage in stageprobe.STAGES + ('total',):
+                print("    {:<9}: {}".format(stage, '/'.join("{:.0f}".format(value)
+                        for value in percentiles(measured['latencies'][stage]))), flush=True)
+        measured = e2ethroughput(shape=shape, rate=None, nlines=max(nlines // 4, 1), allocations=True)
+        print("  {:<6} allocations: {:>8.0f} B/line (net), peak {:.0f} kB".format(
+                shape, measured['allocated'], measured['peak'] / 1024), flush=True)
+
+class closingcounter(resultcounter):
+    """a `resultcounter` that notifies when the port is closed."""
+
+    def __init__(self):
+        super().__init__()
+        self.done = threading.Event()
+
+    def closed(self):
+        self.done.set()
+
+def meteredthroughput(metered, nlines=50000, nlicks=10):
+    """measures the time for a `client` to read and dispatch `nlines` result
+    lines, with or without its metrics enabled. returns lines/sec."""
+    ready   = threading.Event()
+    payload = resultline(nlicks).encode() * nlines
+    handler = closingcounter()
+    io      = client(memoryport(payload, ready=ready), handler=handler)
+    if metered == True:
+        io.enableMetrics()
+    start   = time.perf_counter()
+    ready.set()
+    handler.done.wait()
+    elapsed = time.perf_counter() - start
+    io.close()
+    return nlines / elapsed
+
+def instrumentation(nlines=50000):
+    """compares a `client` with its metrics disabled and enabled."""
+    print("instrumentation ({} lines each):".format(nlines))
+    for metered in (False, True, False, True):
+        lps  = meteredthroughput(metered, nlines=nlines)
+        mode = "enabled" if metered == True else "disabled"
+        print("  metrics {:<8}: {:>10.0f} lines/s".format(mode, lps), flush=True)
+
+class delayedio:
+    """a fake `io` for `loop`, that replies to each request after a random
+    latency (of up to `latency` seconds), or drops every `drop`-th reply."""
+
+    def __init__(self, latency=0.005, drop=None, seed=0):
+        self.latency    = latency
+        self.drop       = drop
+        self.random     = random.Random(seed)
+        self.requests   = 0
+        self.target     = None
+
+    def request(self, command):
+        self.requests += 1
+        if (self.drop is not None) and (self.requests % self.drop == 0):
+            return
+        timer = threading.Timer(self.random.uniform(0, self.latency),
+                                self.target.updateWithMessage, args=(rxline("+hit;", time.perf_counter_ns()),))
+        timer.daemon = True
+        timer.start()
+
+class timingrecorder(loophandler):
+    """a `loophandler` that keeps the `trialtiming`s."""
+
+    def __init__(self):
+        self.timings = []
+
+    def timing(self, timing):
+        self.timings.append(timing)
+
+def sleepafter(io, number, interval):
+    """the reference loop, that sleeps `interval` after each reply
+    (as `loop` used to do). returns the start times of the trials."""
+    recv    = threading.Condition()
+    starts  = []
+    class __target:
+        def updateWithMessage(self, msg):
+            with recv:
+                recv.notify_all()
+    io.target = __target()
+    for i in range(number):
+        with recv:
+            starts.append(time.perf_counter_ns())
+            io.request('X')
+            recv.wait()
+        time.sleep(interval)
+    return starts
+
+def scheduling(ntrials=200, interval=0.02, latency=0.005):
+    """compares the drift of the trial starts of `loop` against sleeping
+    after each reply, with a random reply latency."""
+    print("scheduling ({} trials at {:.0f} ms intervals, up to {:.0f} ms latency):".format(
+            ntrials, interval * 1000, latency * 1000))
+    for mode in ('sleep-after', 'deadline'):
+        io = delayedio(latency=latency)
+        if mode == 'sleep-after':
+            starts = sleepafter(io, ntrials, interval)
+        else:
+            handler = timingrecorder()
+            trials  = loop('X', ntrials, interval=interval, io=io, handler=handler)
+            io.target = trials
+            trials.run()
+            starts  = [timing.started for timing in handler.timings]
+        itis  = [(b - a) / 1e6 for a, b in zip(starts[:-1], starts[1:])]
+        drift = (starts[-1] - starts[0]) / 1e6 - (len(starts) - 1) * interval * 1000
+        print("  {:<11}: ITI mean {:.3f} ms (max {:.3f} ms), drift after {} trials: {:.1f} ms".format(
+                mode, sum(itis) / len(itis), max(itis), len(starts), drift), flush=True)
+
+def scheduletask():
+    """the task model used by `schedules()`."""
+    from .model import Task
+    task = Task("Bench")
+    task.addMode('Pair', 'P')
+    task.addMode('Test', 'T')
+    task.addConfig('stim_dur_ms', 'd')
+    task.addAction('runTask', 'X')
+    return task
+
+def scripted(io, task, steps):
+    """the reference, that sends each mode/config change and waits for
+    its acknowledgement before requesting the trial (as a script around
+    `RepeatUI` would do)."""
+    sent = {}
+    for item in steps:
+        for key, value in item.state.items():
+            if sent.get(key, None) != value:
+                command = task.modes[value].command if key == 'mode' else \
+                          task.configs[key].command + str(value)
+                io.request(command, returns='config').result(5)
+                sent[key] = value
+        io.request(task.actions[item.action].command, returns='result').result(5)
+
+def schedules(ntrials=500):
+    """compares the trial rate of the `schedule.scheduler` against waiting
+    for each config change, for a balanced design with catch trials
+    on a simulated device (over a pty, with no delays in the trials)."""
+    from .transport import ptypair
+    from .sim import sampletask
+    from .schedule import design, scheduler
+    task    = scheduletask()
+    session = design(task, seed=0)
+    session.addBlock('runTask', ntrials, mode='Test', order='balanced',
+                     conditions=[{'stim_dur_ms': 100}, {'stim_dur_ms': 200}, {'stim_dur_ms': 300}],
+                     catch=0.2, catchcondition={'mode': 'Pair', 'stim_dur_ms': 0})
+    steps   = session.compile()
+    print("schedules ({} trials, balanced with 20% catch trials):".format(ntrials))
+    for mode in ('scripted', 'scheduler'):
+        host, dev = ptypair()
+        device    = sampletask(dev, timescale=0, seed=0)
+        io        = client(host)
+        time.sleep(0.2)
+        started   = time.perf_counter()
+        if mode == 'scripted':
+            scripted(io, task, steps)
+        else:
+            scheduler(task, steps, io=io).run()
+        elapsed   = time.perf_counter() - started
+        io.close()
+        device.stop()
+        print("  {:<9}: {:.1f} trials/s".format(mode, ntrials / elapsed), flush=True)
+
+def onsetskews(recorders):
+    """returns the spread of the onsets (in ns) for each trial index
+    that all the `timingrecorder`s have."""
+    onsets = {}
+    for recorder in recorders:
+        for timing in recorder.timings:
+            onsets.setdefault(timing.index, []).append(timing.started)
+    return [max(starts) - min(starts) for starts in onsets.values()
+            if len(starts) == len(recorders)]
+
+def synchronizing(ndevices=4, ntrials=100, intervals=(0, 0.01)):
+    """compares the onset skew across simulated devices of different speeds
+    (a trial takes about 2.5-3.5 ms), between the loops started one by one
+    and a `sync.coordinator`."""
+    from .transport import loopback
+    from .sim import sampletask
+    from .sync import coordinator
+    print("synchronizing ({} devices, {} trials; skews in ms as p50/p90/p99/max):".format(
+            ndevices, ntrials))
+    for interval in intervals:
+        for mode in ('independent', 'deadline', 'barrier'):
+            ports   = [loopback() for i in range(ndevices)]
+            devices = [sampletask(dev, timescale=0.001 * (1 + 0.4 * i / ndevices), seed=i)
+                       for i, (host, dev) in enumerate(ports)]
+            ios     = [client(host) for host, dev in ports]
+            time.sleep(0.2)
+            recorders = [timingrecorder() for io in ios]
+            if mode == 'independent':
+                loops   = [loop('X', ntrials, interval=interval, io=io, handler=recorder, returns='result')
+                           for io, recorder in zip(ios, recorders)]
+                threads = []
+                for trials in loops:
+                    threads.append(trials.start())
+                    time.sleep(0.001)
+                for thread in threads:
+                    thread.join()
+            else:
+                coordinator('X', ntrials, ios, handlers=recorders, mode=mode,
+                            interval=interval, returns='result').run()
+            for io in ios:
+                io.close()
+            for device in devices:
+                device.stop()
+            skews = percentiles([skew / 1e6 for skew in onsetskews(recorders)])
+            print("  interval {:>4.0f} ms, {:<11}: {}".format(interval * 1000, mode,
+                  '/'.join("{:.3f}".format(value) for value in skews)), flush=True)
+
+def adhocdecision(trials):
+    """the reference, that recomputes the hit rate and the mean and variance
+    of 'wait' from all the (parsed) trials kept so far."""
+    hits   = sum(1 for trial in trials if trial.status == 'hit') / len(trials)
+    waits  = [trial.values['wait'] for trial in trials if 'wait' in trial.values]
+    mean   = sum(waits) / len(waits)
+    return hits, mean, sum((wait - mean) ** 2 for wait in waits) / max(len(waits) - 1, 1)
+
+def histories(sessions=(1000, 3000, 10000), size=100):
+    """compares the cost per trial of keeping the trials and deciding on the session's
+    hit rate and the mean/variance of a value, between recomputing them from the
+    kept trials and `core.trialhistory` (of `size` trials)."""
+    parser = resultparser(('hit', 'miss'), ('wait',), ('lick',))
+    print("trial history (decisions on the whole session):")
+    for ntrials in sessions:
+        lines   = ["+{};wait{};lick[{}];".format('hit' if i % 3 else 'miss', 200 + i % 50,
+                   ','.join(str(100 * k) for k in range(10))) for i in range(ntrials)]
+        for mode in ('ad-hoc', 'history'):
+            started = time.perf_counter()
+            if mode == 'ad-hoc':
+                kept = []
+                for line in lines:
+                    kept.append(parser.parseTrial(line))
+                    adhocdecision(kept)
+            else:
+                history = trialhistory(parser, size=size)
+                for line in lines:
+                    history.add(line)
+                    history.rate('hit', recent=False), history.mean('wait', recent=False), \
+                        history.variance('wait', recent=False)
+            elapsed = time.perf_counter() - started
+            print("  {:>6} trials, {:<7}: {:.2f} us/trial".format(ntrials, mode,
+                  elapsed / ntrials * 1e6), flush=True)
+
+benchmarks = {
+    'readers':      readers,
+    'multiplexing': multiplexing,
+    'dispatching':  dispatching,
+    'parsing':      parsing,
+    'arrays':       arrays,
+    'tokenizing':   tokenizing,
+    'converting':   converting,
+    'endtoend':     endtoend,
+    'instrumentation': instrumentation,
+    'scheduling':   scheduling,
+    'schedules':    schedules,
+    'synchronizing': synchronizing,
+    'histories':    histories,
+}
+
+if __name__ == "__main__":
+    names = sys.argv[1:] if len(sys.argv) > 1 else list(benchmarks.keys())
+    for name in names:
+        if name not in benchmarks.keys():
+            print("***unknown benchmark: {} (choose from: {})".format(name, ', '.join(benchmarks.keys())))
+            continue
+        benchmarks[name]()
@@ -0,0 +1,259 @@
+import os
+import sys
+import time
+import argparse
+import multiprocessing
+from array import array
+import numpy
+
+from .core import protocol, splittokens, resultparser, decodearray
+from .replay import parselogline
+
+"""converting the log files recorded by `app.LoggerUI` into columnar arrays.
+
+the result lines of a log file are parsed against a result model (a
+`model.Task`, a `model.Result`, or a (status, values, arrays) tuple),
+and are saved as a `.npz` file per session, with the entries:
+
+    trial           -- the index of the trial (int64)
+    time            -- the time of recording, in seconds since the epoch
+                       (float64; NaN if the line has no time stamp)
+    status          -- the index of the status in `status_names` (int16;
+                       -1 if the line has no known status)
+    status_names    -- the names of the statuses
+    values.<name>   -- the value for each trial (int64; 0 if it is missing)
+    valid.<name>    -- whether the trial had the value (bool)
+    arrays.<name>   -- the elements of the array from all the trials (int64)
+    offsets.<name>  -- the start of each trial in `arrays.<name>`, with the
+                       total number of the elements at the end (int64),
+                       i.e. trial `i` is `arrays[offsets[i]:offsets[i+1]]`
+
+the log file is read in chunks (of about `chunksize` bytes), and the columns
+are accumulated in flat buffers, so that a session is never held as a list
+of per-trial objects. `convertlogs()` fans the files out to a process pool.
+
+run as `python -m ublock.convert --status hit,miss --values wait --arrays lick LOGFILE ...`.
+"""
+
+def schemaof(model):
+    """returns the (status, values, arrays) tuple of `model` (a `model.Task`,
+    a `model.Result`, or a sequence of three sequences of names)."""
+    model = getattr(model, 'result', model)
+    if model is None:
+        raise ValueError("the task does not have any result model")
+    if hasattr(model, 'as_dict'):
+        model = model.as_dict()
+        model = (model['status'], model['values'], model['arrays'])
+    status, values, arrays = model
+    return (tuple(status), tuple(values), tuple(arrays))
+
+def outputpath(path, outdir=None):
+    """returns the path of the `.npz` file for the log file at `path`."""
+    base = os.path.splitext(path)[0] + '.npz'
+    if outdir is not None:
+        base = os.path.join(outdir, os.path.basename(base))
+    return base
+
+class sessioncolumns:
+    """the columnar buffers of a session that is being converted.
+
+    the payloads of the arrays are kept as text until `flush()`, so that
+    the arrays of a whole chunk of the log are decoded in a single call."""
+
+    def __init__(self, status, values, arrays):
+        self.parser         = resultparser(status, values, ())
+        self.status_names   = tuple(status)
+        self.status_codes   = dict((name, i) for i, name in enumerate(self.status_names))
+        self.trial          = 0
+        self.time           = array('d')
+        self.status         = array('h')
+        self.values         = dict((name, array('q')) for name in values)
+        self.valid          = dict((name, bytearray()) for name in values)
+        self.arrays         = dict((name, []) for name in arrays)
+        self.lengths        = dict((name, array('q')) for name in arrays)
+        self.payloads       = dict((name, []) for name in arrays)
+
+    def __len__(self):
+        return self.trial
+
+    def add(self, wall, line):
+        """adds a trial from its recorded time (in ns, or None) and its result line."""
+        status  = -1
+        values  = {}
+        payloads = {}
+        for token in splittokens(line):
+            if token.endswith(']'):
+                start = token.find('[')
+                name  = token[:start]
+                if (start > 0) and (name in self.payloads):
+                    payloads[name] = token[(start+1):-1]
+                continue
+            kind, name, value = self.parser.parseToken(token)
+            if kind == resultparser.STATUS:
+                if status < 0:
+                    status = self.status_codes[name]
+            elif kind == resultparser.VALUE:
+                values[name] = value
+
+        self.trial += 1
+        self.time.append(numpy.nan if wall is None else wall / 1e9)
+        self.status.append(status)
+        for name, column in self.values.items():
+            value = values.get(name, None)
+            column.append(0 if value is None else value)
+            self.valid[name].append(0 if value is None else 1)
+        for name, pending in self.payloads.items():
+            payload = payloads.get(name, '')
+            pending.append(payload)
+            self.lengths[name].append(payload.count(',') + 1 if len(payload.strip()) > 0 else 0)
+
+    def flush(self):
+        """decodes the pending payloads of the arrays."""
+        for name, pending in self.payloads.items():
+            if len(pending) == 0:
+                continue
+            lengths = self.lengths[name][-len(pending):]
+            try:
+                values = decodearray(','.join(payload for payload in pending if len(payload.strip()) > 0))
+                if len(values) != sum(lengths):
+                    raise ValueError("empty elements")
+                self.arrays[name].append(values)
+            except ValueError:
+                # decode one by one to keep the trials aligned
+                for i, payload in enumerate(pending):
+                    try:
+                        values = decodearray(payload) if len(payload.strip()) > 0 else ()
+                    except ValueError:
+                        print("***error while parsing array '{}': {}".format(name, payload))
+                        values = ()
+                    self.lengths[name][len(self.lengths[name]) - len(pending) + i] = len(values)
+                    self.arrays[name].append(numpy.asarray(values, dtype=numpy.int64))
+            del pending[:]
+
+    def columns(self):
+        """returns the {key: ndarray} dictionary to be saved."""
+        self.flush()
+        columns = {
+            'trial':        numpy.arange(self.trial, dtype=numpy.int64),
+            'time':         numpy.frombuffer(self.time, dtype=numpy.float64).copy(),
+            'status':       numpy.frombuffer(self.status, dtype=numpy.int16).copy(),
+            'status_names': numpy.array(self.status_names, dtype=str),
+        }
+        for name, column in self.values.items():
+            columns['values.' + name] = numpy.frombuffer(column, dtype=numpy.int64).copy()
+            columns['valid.' + name]  = numpy.frombuffer(self.valid[name], dtype=numpy.bool_).copy()
+        for name, chunks in self.arrays.items():
+            offsets = numpy.zeros(self.trial + 1, dtype=numpy.int64)
+            numpy.cumsum(numpy.frombuffer(self.lengths[name], dtype=numpy.int64), out=offsets[1:])
+            if len(chunks) > 0:
+                columns['arrays.' + name] = numpy.concatenate(chunks).astype(numpy.int64, copy=False)
+            else:
+                columns['arrays.' + name] = numpy.zeros(0, dtype=numpy.int64)
+            columns['offsets.' + name] = offsets
+        return columns
+
+def readcolumns(path, model, chunksize=1 << 20):
+    """parses the result lines in the log file at `path` against `model`,
+    and returns a `sessioncolumns` object."""
+    session = sessioncolumns(*schemaof(model))
+    with open(path, 'r') as logfile:
+        while True:
+            lines = logfile.readlines(chunksize)
+            if len(lines) == 0:
+                break
+            for line in lines:
+                if (line[:1] != protocol.RESULT) and ('\t' + protocol.RESULT not in line):
+                    continue
+                wall, text = parselogline(line.rstrip('\r\n'))
+                if text[:1] == protocol.RESULT:
+                    session.add(wall, text)
+            session.flush()
+    return session
+
+def convertlog(path, model, outpath=None, chunksize=1 << 20):
+    """converts the log file at `path` into a `.npz` file at `outpath`
+    (by default, next to the log file). returns (outpath, number of trials)."""
+    if outpath is None:
+        outpath = outputpath(path)
+    session = readcolumns(path, model, chunksize=chunksize)
+    numpy.savez(outpath, **session.columns())
+    return outpath, len(session)
+
+def _convertjob(job):
+    path, schema, outpath, chunksize = job
+    try:
+        return (path,) + convertlog(path, schema, outpath=outpath, chunksize=chunksize)
+    except Exception as e:
+        print("***failed to convert '{}': {}".format(path, e), flush=True)
+        return (path, None, 0)
+
+def convertlogs(paths, model, outdir=None, processes=None, chunksize=1 << 20):
+    """converts the log files in `paths` into `.npz` files (in `outdir`,
+    or next to each log file), using a pool of `processes` worker processes
+    (by default, as many as the CPUs; 1 converts the files in this process).
+
+    returns the list of (logpath, npzpath, number of trials), in the order
+    of `paths`. `npzpath` is None for a file that could not be converted."""
+    schema  = schemaof(model)
+    jobs    = [(path, schema, outputpath(path, outdir), chunksize) for path in paths]
+    if processes is None:
+        processes = os.cpu_count() or 1
+    processes = min(processes, len(jobs))
+    if processes <= 1:
+        return [_convertjob(job) for job in jobs]
+    with multiprocessing.Pool(processes) as pool:
+        return pool.map(_convertjob, jobs, chunksize=1)
+
+def loadsession(path):
+    """loads a `.npz` file written by `convertlog()` into a dictionary,
+    with the ragged arrays split into the list of per-trial arrays."""
+    with numpy.load(path) as data:
+        session = {
+            'trial':        data['trial'],
+            'time':         data['time'],
+            'status':       data['status'],
+            'status_names': tuple(str(name) for name in data['status_names']),
+            'values':       {},
+            'valid':        {},
+            'arrays':       {},
+        }
+        for key in data.files:
+            kind, sep, name = key.partition('.')
+            if kind in ('values', 'valid'):
+                session[kind][name] = data[key]
+            elif kind == 'arrays':
+                offsets = data['offsets.' + name]
+                if len(offsets) > 1:
+                    session['arrays'][name] = numpy.split(data[key], offsets[1:-1])
+                else:
+                    # no trials
+                    session['arrays'][name] = []
+    return session
+
+def namelist(arg):
+    return tuple(name.strip() for name in arg.split(',') if len(name.strip()) > 0)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog="python -m ublock.convert",
+                                     description="converts session logs into columnar .npz files.")
+    parser.add_argument('--status', type=namelist, default=(), help="comma-separated status names")
+    parser.add_argument('--values', type=namelist, default=(), help="comma-separated value names")
+    parser.add_argument('--arrays', type=namelist, default=(), help="comma-separated array names")
+    parser.add_argument('-o', '--outdir', default=None, help="the directory to write the .npz files")
+    parser.add_argument('-j', '--processes', type=int, default=None, help="the number of worker processes")
+    parser.add_argument('logfiles', nargs='+')
+    args = parser.parse_args()
+
+    start   = time.perf_counter()
+    results = convertlogs(args.logfiles, (args.status, args.values, args.arrays),
+                          outdir=args.outdir, processes=args.processes)
+    elapsed = time.perf_counter() - start
+    failed  = 0
+    for logpath, npzpath, ntrials in results:
+        if npzpath is None:
+            failed += 1
+        else:
+            print("{} -> {} ({} trials)".format(logpath, npzpath, ntrials))
+    print("{} files in {:.3f} s".format(len(results) - failed, elapsed))
+    if failed > 0:
+        sys.exit(1)
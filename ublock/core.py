@@ -1,7 +1,19 @@
+import re
+import sys
 import time
 import threading
+from array import array
+from collections import deque
+from concurrent.futures import Future, CancelledError, TimeoutError as FutureTimeoutError
 from traceback import print_tb
 import serial
+try:
+    import numpy
+except ImportError:
+    # the arrays are decoded into `array` objects
+    numpy = None
+from .transport import openport
+from .metrics import collector
 
 class protocol:
     """used for discriminating between line messages
@@ -15,53 +27,575 @@ class protocol:
     OUTPUT      = '<'
     DELIMITER   = ';'
     HELP        = '?'
+    BINARY      = '\x02' # the start of a binary frame (see `encodeframe()`)
+
+# the first byte and the size of the header of a binary frame
+FRAMESTART  = ord(protocol.BINARY)
+FRAMEHEADER = 4
+
+# the array typecode for little-endian 32-bit integers in binary frames
+INT32 = 'i' if array('i').itemsize == 4 else 'l'
+
+# the array typecode for the integers in text arrays, and its range
+INT64     = 'q'
+INT64_MIN = -(1 << 63)
+INT64_MAX = (1 << 63) - 1
+
+def parseelements(payload):
+    """parses the comma-separated integers in `payload` one by one, skipping
+    empty elements. raises ValueError if any element is not an integer,
+    or is out of the range of int64."""
+    values = [int(elem) for elem in payload.split(',') if len(elem.strip()) > 0]
+    if (len(values) > 0) and ((min(values) < INT64_MIN) or (max(values) > INT64_MAX)):
+        raise ValueError("out of the range of int64: {}".format(payload))
+    return values
+
+def decodearray(payload):
+    """decodes the comma-separated integers in `payload` (the content
+    of the brackets of an array token) in a single call.
+
+    returns a `numpy.ndarray` of int64 if numpy is available,
+    or an `array('q')` otherwise (the devices may send e.g. `unsigned long`
+    time stamps, that do not fit in int32). empty elements are skipped.
+    raises ValueError if any element is not an integer, or is out of the
+    range of int64."""
+    if numpy is not None:
+        try:
+            values = numpy.fromstring(payload, dtype=numpy.int64, sep=',')
+            # numpy saturates the values out of the range, which takes 19 digits
+            # or more: only check for them if the payload is long enough
+            if (len(values) == payload.count(',') + 1) and ((len(payload) < 19) or \
+                    ((values.max() < INT64_MAX) and (values.min() > INT64_MIN))):
+                return values
+        except ValueError:
+            pass
+        # e.g. empty elements: parse one by one
+        return numpy.array(parseelements(payload), dtype=numpy.int64)
+    return array(INT64, parseelements(payload))
+
+class linebuffer:
+    """a reusable receive buffer that splits an incoming byte stream
+    into complete lines.
+
+    each complete line in a chunk passed to `feed()` is passed to `handle`
+    as a `memoryview` over the chunk, with its framing (the trailing newline)
+    intact, i.e. the lines are not copied. any partial line is carried
+    over to the next call (only the partial line is copied).
+
+    a binary frame (see `encodeframe()`) that starts at the beginning
+    of a line is passed to `handle` as a whole, in the same way."""
+
+    def __init__(self, handle):
+        self.buf    = bytearray()
+        self.handle = handle
+
+    def __len__(self):
+        return len(self.buf)
+
+    def clear(self):
+        del self.buf[:]
+
+    def feed(self, data, *args):
+        """splits `data` (following the partial line from the last call)
+        into lines. any extra `args` are passed to `handle` together with
+        each complete line."""
+        scanned = len(self.buf) # a partial text line does not contain any newline
+        if scanned > 0:
+            self.buf += data
+            data = bytes(self.buf)
+            self.buf.clear()
+        elif not isinstance(data, bytes):
+            data = bytes(data) # the views must not change afterwards
+        view    = memoryview(data)
+        size    = len(data)
+        start   = 0
+        while start < size:
+            if data[start] == FRAMESTART:
+                if size - start < FRAMEHEADER:
+                    break
+                end = start + FRAMEHEADER + (data[start+2] | (data[start+3] << 8))
+                if end > size:
+                    break
+            else:
+                end = data.find(b'\n', max(start, scanned))
+                if end < 0:
+                    break
+                end += 1
+            self.handle(view[start:end], *args)
+            start = end
+        if start < size:
+            self.buf += view[start:]
+
+# the pair of (time.time_ns(), time.perf_counter_ns()) taken at the same moment,
+# that is used to convert `perf_counter_ns()` stamps into wall-clock times
+clockorigin = (time.time_ns(), time.perf_counter_ns())
+
+def walltime(stamp):
+    """converts a `time.perf_counter_ns()` stamp into the wall-clock time
+    (nanoseconds since the epoch, as in `time.time_ns()`)."""
+    return clockorigin[0] + (stamp - clockorigin[1])
+
+def perfstamp(wall):
+    """the inverse of `walltime()`: converts the wall-clock time (nanoseconds
+    since the epoch) into the corresponding `time.perf_counter_ns()` stamp."""
+    return clockorigin[1] + (wall - clockorigin[0])
+
+class rxline(str):
+    """a received line.
+
+    it behaves as a str, and carries the time of its arrival
+    (i.e. when its terminating newline was read from the port):
+
+    + stamp    -- `time.perf_counter_ns()` at the arrival
+    + walltime -- the corresponding `time.time_ns()`
+
+    a line that arrived as a binary frame additionally has `arrays`,
+    a {name: values} dict (None for text lines), where the values
+    are typed as in `decodearray()`.
+    """
+
+    stamp   = None
+    arrays  = None
+    _tokens = None
+
+    def __new__(cls, text, stamp=None):
+        self = super().__new__(cls, text)
+        self.stamp = time.perf_counter_ns() if stamp is None else stamp
+        return self
+
+    @property
+    def walltime(self):
+        return walltime(self.stamp)
+
+    @property
+    def prefix(self):
+        """the first character (i.e. the category) of the line."""
+        return self[:1]
+
+    def decode(self):
+        """returns the line itself (for compatibility with `rawline`)."""
+        return self
+
+    def tokens(self):
+        """returns the non-empty tokens of the line (without its prefix),
+        as a tuple of stripped str's. the result is cached."""
+        if self._tokens is None:
+            self._tokens = tuple(splittokens(self))
+        return self._tokens
+
+    def expand(self):
+        """returns the line in the text form, i.e. with its `arrays`
+        (if any) written out as 'name[v1,v2,...]' tokens."""
+        line = str(self)
+        if self.arrays is None:
+            return line
+        if (len(line) > 1) and (not line.endswith(protocol.DELIMITER)):
+            line += protocol.DELIMITER
+        for name, values in self.arrays.items():
+            line += "{}[{}]{}".format(name, ','.join(str(v) for v in values), protocol.DELIMITER)
+        return line
+
+def encodeframe(prefix, text='', arrays=None):
+    """encodes a binary frame. all the integers are little-endian.
+
+        STX (0x02) | prefix (1 byte) | body length (uint16) | body
+
+    where the body consists of `text` (the tokens of the line, without
+    the prefix) terminated by NUL, followed by zero or more arrays:
+
+        name | NUL | count (uint16) | values (int32 x count)
+
+    `arrays` is a {name: sequence of int} dict."""
+    body = bytearray(text.encode())
+    body.append(0)
+    if arrays is not None:
+        for name, values in arrays.items():
+            values = array(INT32, values)
+            if sys.byteorder == 'big':
+                values.byteswap()
+            body += name.encode()
+            body.append(0)
+            body += len(values).to_bytes(2, 'little')
+            body += values.tobytes()
+    if len(body) > 0xFFFF:
+        raise ValueError("the frame is too long: {} bytes".format(len(body)))
+    return bytes((FRAMESTART, ord(prefix))) + len(body).to_bytes(2, 'little') + bytes(body)
+
+def decodeframe(frame, stamp=None):
+    """decodes a complete binary frame (see `encodeframe()`) into an `rxline`
+    with its `arrays`. the text of the line consists of the prefix and
+    the text part of the frame. the values are widened to int64, so that
+    they are typed as those of the text arrays (see `decodearray()`)."""
+    textend = frame.index(0, FRAMEHEADER)
+    line    = rxline(chr(frame[1]) + frame[FRAMEHEADER:textend].decode(), stamp)
+    arrays  = {}
+    pos     = textend + 1
+    while pos < len(frame):
+        nameend = frame.index(0, pos)
+        count   = frame[nameend+1] | (frame[nameend+2] << 8)
+        start   = nameend + 3
+        if numpy is not None:
+            values  = numpy.frombuffer(frame, dtype='<i4', count=count, offset=start).astype(numpy.int64)
+        else:
+            values  = array(INT32)
+            values.frombytes(frame[start:(start + 4 * count)])
+            if sys.byteorder == 'big':
+                values.byteswap()
+            values  = array(INT64, values)
+        arrays[frame[pos:nameend].decode()] = values
+        pos     = start + 4 * count
+    line.arrays = arrays
+    return line
+
+def decodeline(line, stamp=None):
+    """converts a complete line of bytes (with its line terminator)
+    or a binary frame into an `rxline`."""
+    if line[0] == FRAMESTART:
+        return decodeframe(bytes(line), stamp)
+    return rxline(str(line, 'utf-8').strip(), stamp)
+
+class rawline:
+    """a received line that is not decoded yet, as it is passed to `handleLine()`.
+
+    it refers to the bytes of the line in the receive buffer (a `memoryview`,
+    including the line terminator) without copying them. the category of the
+    line is available as `prefix` without decoding, and `decode()` returns
+    the corresponding `rxline` on demand (the result is cached).
+    a line that nobody is interested in is therefore never decoded."""
+
+    __slots__ = ('data', 'stamp', '_line')
+
+    def __init__(self, data, stamp=None):
+        self.data   = data
+        self.stamp  = time.perf_counter_ns() if stamp is None else stamp
+        self._line  = None
+
+    def __repr__(self):
+        return "rawline({!r})".format(bytes(self.data))
+
+    def __str__(self):
+        return str(self.decode())
+
+    @property
+    def prefix(self):
+        """the first character (i.e. the category) of the line."""
+        data = self.data
+        if len(data) == 0:
+            return ''
+        elif data[0] == FRAMESTART:
+            return chr(data[1])
+        elif data[0] in b' \t\r\n':
+            return self.decode().prefix
+        return chr(data[0])
+
+    @property
+    def walltime(self):
+        return walltime(self.stamp)
+
+    def decode(self):
+        """returns the line as an `rxline`."""
+        if self._line is None:
+            self._line = decodeline(self.data, self.stamp)
+        return self._line
+
+    def tokens(self):
+        """returns the non-empty tokens of the line (see `rxline.tokens()`)."""
+        return self.decode().tokens()
+
+class writequeue:
+    """the queue of outgoing lines.
+
+    lines are put as they are requested, and taken out all at once,
+    so that they can be written to the port in a single call.
+    each `put()` returns a sequence number that can be waited for
+    through `flush()`."""
+
+    def __init__(self):
+        self.lines      = deque()
+        self.update     = threading.Condition()
+        self.queued     = 0 # the sequence number of the last line that was put
+        self.written    = 0 # the sequence number of the last line that was written
+        self.closed     = False
+
+    def __len__(self):
+        return len(self.lines)
+
+    def put(self, data):
+        with self.update:
+            if self.closed == True:
+                raise serial.SerialException("the port is being closed")
+            self.lines.append(data)
+            self.queued += 1
+            self.update.notify_all()
+            return self.queued
+
+    def take(self, timeout=None):
+        """waits for line(s) to be queued, and returns (data, seq), where
+        `data` is all the queued lines joined together and `seq` is the
+        sequence number of the last line in it.
+        returns (None, seq) when the queue is closed (or on timeout)."""
+        with self.update:
+            if len(self.lines) == 0 and self.closed == False:
+                self.update.wait(timeout)
+            if len(self.lines) == 0:
+                return None, self.written
+            data = b''.join(self.lines)
+            self.lines.clear()
+            return data, self.queued
+
+    def done(self, seq):
+        """marks the lines until `seq` as written."""
+        with self.update:
+            self.written = max(self.written, seq)
+            self.update.notify_all()
+
+    def flush(self, seq=None, timeout=None):
+        """waits until the line with `seq` (the last one queued, by default)
+        has been written. returns False on timeout or if the queue is closed."""
+        with self.update:
+            if seq is None:
+                seq = self.queued
+            return self.update.wait_for(lambda: (self.written >= seq) or self.closed,
+                                        timeout) and (self.written >= seq)
+
+    def close(self):
+        with self.update:
+            self.closed = True
+            self.update.notify_all()
+
+class writerthread(threading.Thread):
+    """the thread that writes the lines in `queue` (a `writequeue`)
+    to `port`, coalescing all the lines that are waiting into one write."""
+
+    def __init__(self, port, queue):
+        super().__init__(daemon=True)
+        self.port   = port
+        self.queue  = queue
+        self.start()
+
+    def run(self):
+        try:
+            while True:
+                data, seq = self.queue.take()
+                if data is None:
+                    if self.queue.closed == True:
+                        break
+                    continue
+                self.port.write(data)
+                self.queue.done(seq)
+        except (serial.SerialException, OSError, TypeError):
+            # the port has been closed
+            pass
+        self.queue.close()
 
 class iothread(threading.Thread):
-    def __init__(self, port, delegate, waitfirst=0, initialcmd=None):
+    """the thread that reads lines from `port` and passes them
+    to `delegate.handleLine()`.
+
+    by default (`chunked=True`), the thread blocks for at least one byte,
+    drains everything in `port.in_waiting` at once, and splits the lines
+    using a `linebuffer`. `chunked=False` falls back to reading the port
+    one byte at a time.
+
+    by default (`writer=True`), `writeLine()` only puts the line into
+    a `writequeue`, and a separate `writerthread` writes it to the port,
+    so that the calling thread is never blocked by a slow port.
+    `writer=False` writes the line synchronously from the calling thread."""
+
+    def __init__(self, port, delegate, waitfirst=0, initialcmd=None, chunked=True,
+                 writer=True):
         super().__init__()
         self.port       = port
         self.quitreq    = False
         self.buf        = b''
+        self.lines      = linebuffer(self.dispatchLine)
+        self.chunked    = chunked
         self.delegate   = delegate
         self.connected  = False
         self.waitfirst  = waitfirst
         self.initialcmd = initialcmd
         self.port.timeout = 1
+        if writer == True:
+            self.outgoing   = writequeue()
+            self.writer     = writerthread(self.port, self.outgoing)
+        else:
+            self.outgoing   = None
+            self.writer     = None
         self.start()
 
-    def writeLine(self, msg):
-        self.port.write((msg + "\r\n").encode())
+    def writeLine(self, msg, flush=False):
+        """writes `msg` (with the line terminator) to the port.
+        with `flush=True`, it waits until the line is actually written."""
+        data = (msg + "\r\n").encode()
+        if self.outgoing is None:
+            self.port.write(data)
+        else:
+            seq = self.outgoing.put(data)
+            if flush == True:
+                self.outgoing.flush(seq)
+
+    def queueDepth(self):
+        """the number of lines waiting to be written."""
+        return 0 if self.outgoing is None else len(self.outgoing)
+
+    def flush(self, timeout=None):
+        """waits until all the lines queued so far are written.
+        returns False on timeout."""
+        if self.outgoing is None:
+            return True
+        return self.outgoing.flush(timeout=timeout)
 
     def interrupt(self):
         self.quitreq = True
+        if self.outgoing is not None:
+            self.outgoing.close()
         self.port.close()
 
+    def dispatchLine(self, line, stamp):
+        """called with a complete line of bytes, including its line terminator,
+        and the `time.perf_counter_ns()` when it was read."""
+        self.delegate.handleLine(rawline(line, stamp))
+
+    def readChunk(self):
+        """blocks for at least one byte (until `port.timeout`), and then
+        reads all the bytes that are already waiting at the port."""
+        data = self.port.read(max(self.port.in_waiting, 1))
+        if len(data) > 0:
+            waiting = self.port.in_waiting
+            if waiting > 0:
+                data += self.port.read(waiting)
+        return data
+
+    def runChunked(self):
+        while not self.quitreq:
+            try:
+                data = self.readChunk()
+            except serial.SerialTimeoutException:
+                continue
+            if self.connected == False:
+                self.connected = True
+                self.delegate.connected()
+            if len(data) > 0:
+                self.lines.feed(data, time.perf_counter_ns())
+
+    def runBytewise(self):
+        while not self.quitreq:
+            try:
+                ch = self.port.read()
+            except serial.SerialTimeoutException:
+                continue
+            if self.connected == False:
+                self.connected = True
+                self.delegate.connected()
+            self.buf += ch
+            if ch == b'\n':
+                self.dispatchLine(self.buf, time.perf_counter_ns())
+                self.buf = b''
+
     def run(self):
         time.sleep(self.waitfirst)
         if self.initialcmd is not None:
             self.writeLine(self.initialcmd)
         try:
-            while not self.quitreq:
-                try:
-                    ch = self.port.read()
-                except serial.SerialTimeoutException:
-                    continue
-                if self.connected == False:
-                    self.connected = True
-                    self.delegate.connected()
-                self.buf += ch
-                if ch == b'\n':
-                    self.delegate.handleLine(self.buf[:-2].decode().strip())
-                    self.buf = b''
+            if self.chunked == True:
+                self.runChunked()
+            else:
+                self.runBytewise()
         except serial.SerialException:
             pass # just finish the thread
+        except (OSError, TypeError):
+            # pyserial may fail in this way when the port
+            # is closed by `interrupt()` during a read
+            if self.quitreq == False:
+                raise
+        if self.writer is not None:
+            self.outgoing.close()
+            self.writer.join()
         print(">port closed")
         self.delegate.closed()
 
+class replyqueue:
+    """keeps track of the requests that are waiting for their replies.
+
+    each expected reply is represented by a future, which is resolved
+    with the next line that has the corresponding header (RESULT or CONFIG).
+    multiple requests may be in flight for each header, and they are
+    resolved in FIFO order. the futures that are cancelled (e.g. timed out)
+    are skipped, and are not counted in `len()`.
+
+    the queues are guarded by `lock`, as the requests are registered from any
+    thread while the replies are resolved by the I/O thread. the futures are
+    resolved outside of the lock, so that their callbacks may make requests."""
+
+    def __init__(self):
+        self.pending = {protocol.RESULT: deque(), protocol.CONFIG: deque()}
+        self.lock    = threading.Lock()
+
+    def __len__(self):
+        with self.lock:
+            return sum(sum(1 for future in pending if not future.done())
+                       for pending in self.pending.values())
+
+    def expect(self, returns, future=None):
+        """registers `future` (a new `concurrent.futures.Future` by default)
+        for the next reply of the `returns` type ('result' or 'config')."""
+        if future is None:
+            future = Future()
+        pending = self.pending[replyheader(returns)]
+        with self.lock:
+            # drops the cancelled ones that no reply has come for
+            while (len(pending) > 0) and pending[0].done():
+                pending.popleft()
+            pending.append(future)
+        return future
+
+    def resolve(self, line):
+        """resolves the oldest pending future for the category of `line`
+        (an `rxline` or a `rawline`), if any."""
+        pending = self.pending.get(line.prefix, None)
+        if pending is None:
+            return
+        while True:
+            with self.lock:
+                if len(pending) == 0:
+                    return
+                future = pending.popleft()
+            # the cancelled ones (e.g. timed out) are dropped
+            if not future.done():
+                future.set_result(line.decode())
+                return
+
+    def fail(self, exc):
+        """fails all the pending futures with `exc`."""
+        with self.lock:
+            futures = [future for pending in self.pending.values() for future in pending]
+            for pending in self.pending.values():
+                pending.clear()
+        for future in futures:
+            if not future.done():
+                future.set_exception(exc)
+
 class baseclient:
-    def __init__(self, addr, baud=9600, waitfirst=0, initialcmd=None):
-        self.port       = serial.Serial(port=addr, baudrate=baud)
-        self.io         = iothread(self.port, self, initialcmd=initialcmd, waitfirst=waitfirst)
+    """the base class for clients.
+
+    `addr` is passed to `transport.openport()`: it can be a serial port name,
+    a 'tcp://host:port' address, or any port-like object (e.g. one end of
+    `transport.loopback()`).
+
+    the port is served by its own `iothread`, unless a `hub.hub`
+    instance is given as `hub`."""
+
+    def __init__(self, addr, baud=9600, waitfirst=0, initialcmd=None, chunked=True,
+                 writer=True, hub=None):
+        self.addr       = addr
+        self.replies    = replyqueue()
+        self.port       = openport(addr, baud=baud)
+        if hub is None:
+            self.io     = iothread(self.port, self, initialcmd=initialcmd, waitfirst=waitfirst,
+                                   chunked=chunked, writer=writer)
+        else:
+            # the I/O is served by the shared `hub.hub` thread
+            self.io     = hub.attach(self.port, self, initialcmd=initialcmd, waitfirst=waitfirst)
 
     def __enter__(self):
         return self
@@ -82,20 +616,96 @@ class baseclient:
             self.io.interrupt()
             self.io.join()
             self.io = None
+            self.replies.fail(serial.SerialException("port closed: {}".format(self.addr)))
+
+    def request(self, cmd, returns=None, flush=False):
+        """sends `cmd` to the device.
 
-    def request(self, cmd):
+        if `returns` is 'result' or 'config', it returns a `concurrent.futures.Future`
+        that resolves with the reply line of the type (see `replyqueue`).
+        otherwise (or if the port is not connected) it returns None.
+
+        the command is only queued for writing, unless `flush` is True."""
+        if self.io is not None and self.io.connected == True:
+            future = None if returns is None else self.replies.expect(returns)
+            self.io.writeLine(cmd, flush=flush)
+            return future
+        else:
+            print("***port not connected: {}".format(self.addr))
+            return None
+
+    def requestBatch(self, cmd, count, returns, flush=False):
+        """sends `cmd`, to which the device replies `count` times
+        (e.g. a batch of trials, see `loop`).
+
+        returns the list of the futures for the replies (see `request()`),
+        or None if the port is not connected."""
         if self.io is not None and self.io.connected == True:
-            self.io.writeLine(cmd)
+            futures = [self.replies.expect(returns) for i in range(count)]
+            self.io.writeLine(cmd, flush=flush)
+            return futures
         else:
             print("***port not connected: {}".format(self.addr))
+            return None
+
+    def negotiateBinary(self, command='B', enable=True, timeout=1):
+        """requests the device to switch binary frames on (or off),
+        by sending `command` followed by '1' (or '0').
+
+        the device is expected to acknowledge with the config line
+        '@<command>1' (or '@<command>0'). returns whether it did so
+        within `timeout` seconds."""
+        value = command + ('1' if enable == True else '0')
+        reply = self.request(value, returns='config')
+        if reply is None:
+            return False
+        try:
+            return reply.result(timeout).strip() == (protocol.CONFIG + value)
+        except (FutureTimeoutError, serial.SerialException):
+            return False
+
+    def queueDepth(self):
+        """the number of commands waiting to be written."""
+        return 0 if self.io is None else self.io.queueDepth()
+
+    def flush(self, timeout=None):
+        """waits until all the requested commands are written to the port.
+        returns False on timeout."""
+        return True if self.io is None else self.io.flush(timeout=timeout)
 
     def handleLine(self,line):
-        pass
+        self.replies.resolve(line)
 
 class eventhandler:
     """the interface class for receiving events from CUISerial protocol.
     except for `connected` and `closed`, the meaning of each type of messages
-    is up to the user."""
+    is up to the user.
+
+    the lines passed to the handler methods are `rxline` objects, i.e.
+    str's that carry the time of their arrival as `line.stamp`.
+    the lines are only decoded for the handlers that receive them.
+
+    a client only calls the methods that are listed in `categories()`:
+    by default, these are the methods that are overridden by the subclass."""
+
+    # the line prefixes and the corresponding handler methods
+    prefixes = {
+        protocol.DEBUG:     'debug',
+        protocol.INFO:      'info',
+        protocol.CONFIG:    'config',
+        protocol.RESULT:    'result',
+        protocol.ERROR:     'error',
+        protocol.OUTPUT:    'output',
+    }
+
+    # the names of the methods that receive lines
+    linemethods = ('received',) + tuple(prefixes.values()) + ('message',)
+
+    def categories(self):
+        """returns the names of the line-receiving methods (i.e. one of
+        `linemethods`) that this handler wants to be called."""
+        return [name for name in self.linemethods
+                if getattr(getattr(self, name), '__func__', None) is not getattr(eventhandler, name)]
 
     def connected(self, client):
         """called when a serial port is opened (does not necessarily mean
@@ -135,32 +745,125 @@ class eventhandler:
         categories"""
         pass
         
-def tokenize(line, ch=protocol.DELIMITER, has_header=True):
-    """a utility function to split an input line into a chunk of tokens.
-    it yields a token a time until it reaches the end of line."""
+def splittokens(line, ch=protocol.DELIMITER, has_header=True):
+    """splits an input line into the list of its tokens.
+    the tokens are stripped, and the empty ones are skipped.
 
+    this is the faster way to read all the tokens of a line
+    (see `tokenize()` for reading only the first few)."""
     if has_header == True:
         line = line[1:]
-    elems = line.split(ch)
+    return [token for token in map(str.strip, line.split(ch)) if len(token) > 0]
 
-    # stripping on the right hand side
-    while len(elems[-1].strip()) == 0:
-        elems = elems[:-1]
+def tokenize(line, ch=protocol.DELIMITER, has_header=True, spans=False):
+    """a utility function to split an input line into a chunk of tokens.
+    it yields a token a time until it reaches the end of line.
 
-    if len(elems) == 0:
-        yield line
-    else:
-        for elem in elems:
-            if len(elem) == 0:
-                yield elem
+    the tokens are stripped, and the empty ones are skipped (as in `splittokens()`).
+    the line is scanned for `ch` in place, without building any intermediate
+    list, which pays off when only the first few tokens are read. with `spans=True`,
+    it yields the (start, end) offsets of the tokens in `line` instead of the tokens themselves."""
+    start = 1 if has_header == True else 0
+    size  = len(line)
+    find  = line.find
+    while start <= size:
+        end = find(ch, start)
+        if end < 0:
+            end = size
+        token = line[start:end].strip()
+        if len(token) > 0:
+            if spans == True:
+                offset = find(token, start)
+                yield (offset, offset + len(token))
+            else:
+                yield token
+        start = end + 1
+
+class dispatcher:
+    """the mix-in class that dispatches lines to the methods of
+    its `handler` (an `eventhandler`), based on their first character.
+    it is shared by `client` and `aio.client`.
+
+    the dispatch table maps the first character of a line to the callback.
+    it is built whenever `handler` is set, and only includes the categories
+    that the handler subscribes to (see `eventhandler.categories()`):
+    lines of the other categories are not passed to the handler at all.
+    call `updateDispatch()` if the subscription of the handler has changed.
+
+    callbacks for prefixes other than those in `protocol` can be added
+    through `addCategory()`."""
+
+    replies     = None
+    _handler    = None
+    _received   = None
+    _fallback   = None
+    _dispatch   = {}
+    _extra      = {}
 
-class client(baseclient):
+    @property
+    def handler(self):
+        return self._handler
+
+    @handler.setter
+    def handler(self, handler):
+        self._handler = handler
+        self.updateDispatch()
+
+    def addCategory(self, prefix, callback):
+        """dispatches the lines that start with `prefix` (a single character)
+        to `callback`, instead of `handler.message()`."""
+        if len(prefix) != 1:
+            raise ValueError("the prefix must be a single character: '{}'".format(prefix))
+        self._extra = dict(self._extra)
+        self._extra[prefix] = callback
+        self.updateDispatch()
+
+    def removeCategory(self, prefix):
+        self._extra = dict(self._extra)
+        self._extra.pop(prefix, None)
+        self.updateDispatch()
+
+    def updateDispatch(self):
+        """(re-)builds the dispatch table from `handler` and the additional categories."""
+        handler  = self._handler
+        names    = () if handler is None else handler.categories()
+        dispatch = {}
+        if handler is not None:
+            for prefix, name in handler.prefixes.items():
+                if name in names:
+                    dispatch[prefix] = getattr(handler, name)
+        dispatch.update(self._extra)
+        self._received  = handler.received if 'received' in names else None
+        self._fallback  = handler.message if 'message' in names else None
+        self._dispatch  = dispatch
+
+    def handleLine(self, line):
+        """calls its handler's method(s) in turn, based on its first character.
+        `line` is a `rawline` (or an `rxline`, or a str), and it is decoded only
+        if there is any method to be called."""
+        if not isinstance(line, (rawline, rxline)):
+            line = rxline(line.strip())
+        if self.replies is not None:
+            self.replies.resolve(line)
+        if self._received is not None:
+            self._received(line.decode())
+        callback = self._dispatch.get(line.prefix, self._fallback)
+        if callback is not None:
+            callback(line.decode())
+
+class client(dispatcher, baseclient):
     """a client for serial communication that conforms to the CUISerial protocol."""
-    def __init__(self, addr, handler=None, baud=9600, waitfirst=0, initialcmd=None):
-        super().__init__(addr, baud=baud, waitfirst=waitfirst, initialcmd=initialcmd)
+
+    metrics = None # the `metrics.collector`, if enabled
+
+    def __init__(self, addr, handler=None, baud=9600, waitfirst=0, initialcmd=None,
+                 chunked=True, writer=True, hub=None):
         if handler is None:
             handler = eventhandler()
+        # must be set before the I/O starts
         self.handler = handler
+        super().__init__(addr, baud=baud, waitfirst=waitfirst, initialcmd=initialcmd,
+                         chunked=chunked, writer=writer, hub=hub)
 
     @classmethod
     def Uno(cls, addr, handler=None, baud=9600, initialcmd=None):
@@ -178,34 +881,98 @@ class client(baseclient):
     def closed(self):
         self.handler.closed()
 
-    def handleLine(self, line):
-        """calls its handler's method(s) in turn, based on its first character."""
-        if self.handler is None:
-            return
-        self.handler.received(line)
-
-        line = line.strip()
-        if line.startswith(protocol.DEBUG):
-            self.handler.debug(line)
-        elif line.startswith(protocol.INFO):
-            self.handler.info(line)
-        elif line.startswith(protocol.CONFIG):
-            self.handler.config(line)
-        elif line.startswith(protocol.RESULT):
-            self.handler.result(line)
-        elif line.startswith(protocol.ERROR):
-            self.handler.error(line)
-        elif line.startswith(protocol.OUTPUT):
-            self.handler.output(line)
-        else:
-            self.handler.message(line)
-    
     def close(self):
         if self.io is not None:
             super().close()
             if self.handler is not None:
                 self.handler.closed()
 
+    def enableMetrics(self, metrics=None):
+        """attaches a `metrics.collector` (a new one by default), and returns it.
+
+        while it is attached, `handleLine()` and the `linebuffer.feed()` of the
+        I/O are replaced with their instrumented versions, that count the lines
+        and bytes per category, sample the buffer and queue depths, and time the
+        handler. nothing is measured (or slowed down) unless it is enabled."""
+        self.disableMetrics()
+        if metrics is None:
+            metrics = collector()
+        self.metrics    = metrics
+        self.handleLine = self.meteredHandleLine
+        lines = getattr(self.io, 'lines', None)
+        if lines is not None:
+            feed = lines.feed
+            def __feed(data, stamp):
+                metrics.sample('readchunk', len(data))
+                feed(data, stamp)
+                metrics.sample('carryover', len(lines))
+                metrics.sample('writequeue', self.queueDepth())
+                metrics.sample('replies', len(self.replies))
+            lines.feed = __feed
+        return metrics
+
+    def disableMetrics(self):
+        """detaches the metrics collector (if any), and restores the original code paths."""
+        self.__dict__.pop('handleLine', None)
+        lines = getattr(self.io, 'lines', None)
+        if lines is not None:
+            lines.__dict__.pop('feed', None)
+        self.metrics = None
+
+    def meteredHandleLine(self, line):
+        """`handleLine()` while the metrics are enabled."""
+        metrics = self.metrics # may be detached from another thread
+        if not isinstance(line, (rawline, rxline)):
+            line = rxline(line.strip())
+        start = time.perf_counter_ns()
+        type(self).handleLine(self, line)
+        end   = time.perf_counter_ns()
+        if metrics is None:
+            return
+        category = eventhandler.prefixes.get(line.prefix, 'message')
+        metrics.count(category, len(line.data) if isinstance(line, rawline) else len(line))
+        metrics.latency('handler.' + category, end - start)
+        if line.stamp is not None:
+            metrics.latency('wait', start - line.stamp)
+
+class trialtiming:
+    """the planned and actual timing of a trial of `loop`, reported
+    through `loophandler.timing()`. the times are `time.perf_counter_ns()`.
+
+    + index   -- the index of the trial (including the retried ones)
+    + counter -- the value of the counter when the trial started
+    + planned -- the deadline for starting the trial
+    + started -- when the command was actually sent
+    + replied -- when the reply arrived (None if it timed out)
+    + status  -- 'done' (replied), 'retry', 'skip' or 'abort' (timed out or failed)
+    """
+
+    __slots__ = ('command', 'index', 'counter', 'planned', 'started', 'replied', 'status')
+
+    def __init__(self, command, index, counter, planned, started, replied=None, status='done'):
+        self.command = command
+        self.index   = index
+        self.counter = counter
+        self.planned = planned
+        self.started = started
+        self.replied = replied
+        self.status  = status
+
+    def __repr__(self):
+        return "trialtiming(index={}, status={!r}, lateness={:.3f} ms, latency={})".format(
+                    self.index, self.status, self.lateness / 1e6,
+                    "None" if self.latency is None else "{:.3f} ms".format(self.latency / 1e6))
+
+    @property
+    def lateness(self):
+        """the delay of the actual start from the planned one (in ns)."""
+        return self.started - self.planned
+
+    @property
+    def latency(self):
+        """the time from sending the command until the reply (in ns, or None)."""
+        return None if self.replied is None else (self.replied - self.started)
+
 class loophandler:
     """the interface for classes that receive messages from `loop`."""
 
@@ -223,18 +990,69 @@ class loophandler:
         """proxy for serial I/O to dispatch a request."""
         raise RuntimeError("no IO linked to: {}".format(self))
 
+    def timing(self, timing):
+        """invoked after each trial with its `trialtiming`."""
+        pass
+
     def done(self, command, number, counter):
         """invoked when the whole loop is ending."""
         pass
 
+def waituntil(condition, deadline, aborted):
+    """waits on `condition` (a `threading.Condition`) until `deadline`
+    (in `time.perf_counter_ns()`). returns False as soon as `aborted()` is True
+    (it is checked whenever `condition` is notified)."""
+    with condition:
+        while aborted() == False:
+            remaining = deadline - time.perf_counter_ns()
+            if remaining <= 0:
+                return True
+            condition.wait(remaining / 1e9)
+        return False
+
 class loop:
     """class that handles loop structures.
     
     `io` can be any `client`-type instance (that accepts `request()`).
     `handler` is supposed to be a `loophandler` object.
+
+    if `returns` ('result' or 'config') is specified, `io` must be
+    a `client` and each reply is awaited through the future returned
+    by `io.request()`. otherwise, the reply must be passed to
+    `updateWithMessage()` from elsewhere.
     both `io` and `handler` can be set later, but before calling the
     `start()` (or `run()`) method.
 
+    the trials are started at deadlines on the monotonic clock, so that
+    the intervals do not drift with the latency of the replies:
+
+    + schedule='start' -- `interval` seconds from the start of the previous
+      trial (or right after its reply, if the trial took longer)
+    + schedule='reply' -- `interval` seconds from the arrival of the previous
+      reply (i.e. its `stamp`, rather than when it has been processed)
+
+    if `batch` (a command character, e.g. 'N') is specified, the trials are
+    run by the device instead: the loop sends '<batch><count>[;<interval in ms>]'
+    once, and the device runs `count` trials in a row, streaming one reply
+    per trial. the loop follows the progress (and evaluates each trial) from
+    the replies, and runs another batch for the trials that did not count.
+    `abort()` sends `batchabort` to the device, which stops after the current trial.
+    a trial that times out also stops the batch: the replies that are still
+    on their way are discarded, and the remaining trials are run in another batch.
+
+    if `history` (a `trialhistory`) is specified, each reply is parsed and added
+    to it before `handler.evaluate()` is called, so that the handler can base its
+    decisions on the statistics of the trials so far (in constant time).
+
+    the first trial (or batch) can be deferred until `startat`
+    (in `time.perf_counter_ns()`), e.g. to start several loops at once.
+
+    if `timeout` (in seconds) is specified, a trial without any reply within
+    `timeout` is retried up to `retries` times, and then either skipped
+    (`ontimeout='skip'`, i.e. counted without evaluation) or the loop is
+    aborted (`ontimeout='abort'`). the timing of every trial is reported
+    to `handler.timing()`.
+
     note that its `run()` method by itself only specifies 
     the procedure itself, and it does not run in another thread.
 
@@ -242,16 +1060,41 @@ class loop:
     execution thread.
     """
 
+    # the outcomes of `awaitReply()`
+    REPLIED     = 'replied'
+    TIMEOUT     = 'timeout'
+    FAILED      = 'failed'
+
+    # the largest number of trials in a batch (an unsigned 16-bit integer on the device)
+    MAXBATCH    = 0xFFFF
+
     def __init__(self, command, number, interval=0,
-                    io=None, handler=None):
+                    io=None, handler=None, returns=None,
+                    timeout=None, retries=0, ontimeout='skip', schedule='start',
+                    batch=None, batchabort='A', history=None):
         super().__init__()
+        if ontimeout not in ('skip', 'abort'):
+            raise ValueError("'ontimeout' must be either 'skip' or 'abort': {}".format(ontimeout))
+        if schedule not in ('start', 'reply'):
+            raise ValueError("'schedule' must be either 'start' or 'reply': {}".format(schedule))
         self.command  = command
         self.io       = io
         self.number   = number
         self.interval = interval
+        self.returns  = returns
+        self.timeout  = timeout
+        self.retries  = retries
+        self.ontimeout = ontimeout
+        self.schedule = schedule
+        self.batch    = batch
+        self.batchabort = batchabort
+        self.history  = history
         self.handler  = loophandler() if handler is None else handler
         self.update   = threading.Condition()
         self.result   = None
+        self.inbox    = deque() # the replies passed to `updateWithMessage()`
+        self.futures  = ()      # the futures of the current request
+        self.startat  = None    # the deadline of the first trial (now if None)
         self.toabort  = False
 
     def start(self, init=threading.Thread):
@@ -269,59 +1112,586 @@ class loop:
         thread.start()
         return thread
 
+    def waitUntil(self, deadline):
+        """waits until `deadline` (in `time.perf_counter_ns()`).
+        returns False if the loop has been aborted in the meantime."""
+        return waituntil(self.update, deadline, lambda: self.toabort == True)
+
+    def sendRequest(self, command, count=1):
+        """sends `command`, that is expected to be replied `count` times.
+        returns False if it could not be sent."""
+        if self.returns is not None:
+            # `io` is a client: the replies are awaited through futures
+            if count == 1:
+                reply   = self.io.request(command, returns=self.returns)
+                futures = None if reply is None else (reply,)
+            else:
+                futures = self.io.requestBatch(command, count, returns=self.returns)
+            if futures is None:
+                return False
+            self.futures = futures
+            if self.toabort == True:
+                self.cancelReplies()
+        else:
+            # the replies are passed to `updateWithMessage()`
+            with self.update:
+                self.inbox.clear()
+            self.io.request(command)
+        return True
+
+    def awaitReply(self, index=0, cancel=True):
+        """waits for the reply of index `index` to the last request (until `timeout`).
+        returns one of REPLIED, TIMEOUT and FAILED. on timeout, the future of
+        the reply is cancelled, unless `cancel` is False."""
+        if self.returns is not None:
+            reply = self.futures[index]
+            try:
+                try:
+                    self.result = reply.result(self.timeout)
+                except FutureTimeoutError:
+                    if (cancel == True) and (reply.cancel() == True):
+                        return self.TIMEOUT
+                    if not reply.done():
+                        return self.TIMEOUT
+                    # resolved in the meantime
+                    self.result = reply.result()
+            except CancelledError:
+                # aborted
+                return self.FAILED
+            except serial.SerialException as e:
+                print("***{}".format(e))
+                return self.FAILED
+        else:
+            with self.update:
+                if self.update.wait_for(lambda: (len(self.inbox) > 0) or (self.toabort == True),
+                                        self.timeout) == False:
+                    return self.TIMEOUT
+                if len(self.inbox) == 0:
+                    return self.FAILED
+                self.result = self.inbox.popleft()
+        return self.REPLIED
+
+    def cancelReplies(self):
+        """cancels the futures of the replies that are still pending."""
+        for future in self.futures:
+            future.cancel()
+
+    def waitForReply(self):
+        """sends the command, and waits for its reply (until `timeout`).
+        returns one of REPLIED, TIMEOUT and FAILED."""
+        if self.sendRequest(self.command) == False:
+            return self.FAILED
+        try:
+            return self.awaitReply()
+        finally:
+            self.futures = ()
+
+    def settle(self, timing, outcome, counter, retried):
+        """updates `timing` from the `outcome` of a trial,
+        and returns the updated (counter, retried)."""
+        if outcome == self.REPLIED:
+            timing.replied = getattr(self.result, 'stamp', None)
+            if timing.replied is None:
+                timing.replied = time.perf_counter_ns()
+            retried = 0
+            if self.history is not None:
+                self.history.add(self.result)
+            if self.handler.evaluate(self.result) == True:
+                counter += 1
+        elif outcome == self.TIMEOUT:
+            if retried < self.retries:
+                retried += 1
+                timing.status = 'retry'
+            elif self.ontimeout == 'skip':
+                retried = 0
+                counter += 1
+                timing.status = 'skip'
+            else:
+                timing.status = 'abort'
+                self.toabort  = True
+        else:
+            timing.status = 'abort'
+            self.toabort  = True
+        self.handler.timing(timing)
+        return counter, retried
+
     def run(self):
-        counter = 0
+        if self.batch is not None:
+            self.runBatch()
+            return
+        counter  = 0
+        index    = 0
+        retried  = 0
         self.toabort = False
-        while counter < self.number:
+        interval = int(self.interval * 1e9)
+        planned  = time.perf_counter_ns() if self.startat is None else self.startat
+        while (counter < self.number) and (self.toabort == False):
+            if self.io is None:
+                print("***no IO linked to: {}".format(self))
+                break
+            if self.waitUntil(planned) == False:
+                break
             self.handler.starting(self.command,self.number,counter)
-            self.update.acquire()
-            try:
-                if self.io is not None:
-                    self.io.request(self.command)
-                    self.update.wait()
-                    if self.handler.evaluate(self.result) == True:
-                        counter += 1
-                    if self.toabort == True:
-                        break
-                else:
-                    print("***no IO linked to: {}".format(self))
+            started = time.perf_counter_ns()
+            outcome = self.waitForReply()
+            timing  = trialtiming(self.command, index, counter, planned, started)
+            index  += 1
+            counter, retried = self.settle(timing, outcome, counter, retried)
+            if outcome == self.FAILED:
+                break
+
+            # the deadline for the next trial
+            now = time.perf_counter_ns()
+            if (self.schedule == 'reply') and (timing.replied is not None):
+                planned = timing.replied + interval
+            elif self.schedule == 'reply':
+                planned = now + interval
+            else:
+                # stays on the grid, unless the trial took longer than `interval`
+                planned = max(planned + interval, now)
+        self.handler.done(self.command,self.number,counter)
+
+    def batchCommand(self, count):
+        """returns the command that makes the device run `count` trials."""
+        interval = int(round(self.interval * 1000))
+        if interval > 0:
+            return "{}{};{}".format(self.batch, count, interval)
+        return "{}{}".format(self.batch, count)
+
+    def runBatch(self):
+        """the `run()` in the batch mode. the trials are timed by the device:
+        in the reported `trialtiming`s, a trial is regarded as having started
+        at the reply of the previous one (or when the batch was sent)."""
+        counter  = 0
+        index    = 0
+        retried  = 0
+        self.toabort = False
+        if (self.startat is not None) and (self.waitUntil(self.startat) == False):
+            self.handler.done(self.command,self.number,counter)
+            return
+        while (counter < self.number) and (self.toabort == False):
+            if self.io is None:
+                print("***no IO linked to: {}".format(self))
+                break
+            size    = min(self.number - counter, self.MAXBATCH)
+            started = time.perf_counter_ns()
+            if self.sendRequest(self.batchCommand(size), size) == False:
+                break
+            for k in range(size):
+                if self.toabort == True:
+                    break
+                self.handler.starting(self.command,self.number,counter)
+                outcome = self.awaitReply(k, cancel=False)
+                timing  = trialtiming(self.command, index, counter, started, started)
+                index  += 1
+                counter, retried = self.settle(timing, outcome, counter, retried)
+                started = time.perf_counter_ns() if timing.replied is None else timing.replied
+                if outcome == self.TIMEOUT:
+                    # the rest of the batch is run again by the next one
+                    if self.toabort == False:
+                        self.drainBatch(k, size)
                     break
-            finally:
-                self.update.release()
-            if (self.number > 1) and (self.interval > 0):
-                time.sleep(self.interval)
+            if self.toabort == True:
+                self.stopBatch()
+            self.cancelReplies()
+            self.futures = ()
         self.handler.done(self.command,self.number,counter)
 
+    def stopBatch(self):
+        """requests the device to stop the current batch."""
+        if self.io is not None:
+            self.io.request(self.batchabort)
+
+    def drainBatch(self, index, size):
+        """stops the current batch (of `size` trials) after the trial of `index`
+        has timed out, and discards the replies that are still on their way
+        (until none arrives within `timeout`), so that they are not taken for
+        those of the next batch."""
+        if index < size - 1:
+            self.stopBatch()
+        if self.returns is not None:
+            for future in self.futures[index:]:
+                try:
+                    future.result(self.timeout)
+                except (FutureTimeoutError, CancelledError, serial.SerialException):
+                    break
+        else:
+            with self.update:
+                while self.update.wait_for(lambda: (len(self.inbox) > 0) or (self.toabort == True),
+                                           self.timeout) == True:
+                    if self.toabort == True:
+                        break
+                    self.inbox.clear()
+
     def abort(self):
-        self.update.acquire()
-        self.toabort = True
-        self.update.release()
+        with self.update:
+            self.toabort = True
+            self.update.notify_all()
+        self.cancelReplies()
 
     def updateWithMessage(self, msg):
-        self.update.acquire()
-        self.result = msg
-        self.update.notify_all()
-        self.update.release()
+        with self.update:
+            self.result = msg
+            self.inbox.append(msg)
+            self.update.notify_all()
+
+def replyheader(returns):
+    """returns the line header that corresponds to the `returns`
+    type of an action (i.e. 'result' or 'config')."""
+    if returns.lower() == 'result':
+        return protocol.RESULT
+    elif returns.lower() == 'config':
+        return protocol.CONFIG
+    else:
+        raise ValueError("'returns' currently only accepts 'result' or 'config'")
 
 def testResult(status_set, returns='result'):
     """generates an evaluator that tests if the returned status
-    starts with one of the word in `status_set`.
+    (i.e. the text before the first delimiter, e.g. '' for '+;hit')
+    is one of the words in `status_set`.
 
     intended for the use with `loophandler.evaluate()`.
     """
-    if returns.lower() == 'result':
-        header = protocol.RESULT
-    elif returns.lower() == 'config':
-        header = protocol.CONFIG
-    else:
-        raise ValueError("'returns' currently only accepts 'result' or 'config'")
+    header     = replyheader(returns)
+    status_set = frozenset(status_set)
 
     def __evaluator(msg):
-        if protocol.DELIMITER in msg:
-            msg = msg[:(msg.index(protocol.DELIMITER))]
-        if msg[0] == header:
-            msg = msg[1:]
-        return (msg in status_set)
+        end = msg.find(protocol.DELIMITER)
+        if end < 0:
+            end = len(msg)
+        start = 1 if msg[:1] == header else 0
+        return (msg[start:end] in status_set)
     return __evaluator
 
 
+
+class configstate:
+    """the last known configuration of the device, that is updated
+    incrementally from CONFIG lines. it does not depend on Qt.
+
+    the values are keyed by the commands: for each config (see `addConfig()`),
+    the value is the str that follows the command in the config token
+    (e.g. 'd100' for the config 'd'). for each mode (see `addModes()`),
+    the value is True if the mode is selected (e.g. '[P]T' for the modes 'P'
+    and 'T'), and False otherwise.
+
+    `update()` only returns the values that have changed."""
+
+    def __init__(self):
+        self.values     = {}
+        self.configs    = set()
+        self.lengths    = ()
+        self.modes      = {}
+
+    def addConfig(self, command):
+        """starts tracking the values of the config `command`."""
+        self.configs.add(command)
+        # the longer commands first, in case some commands are the prefixes of the others
+        self.lengths = tuple(sorted(set(len(cmd) for cmd in self.configs), reverse=True))
+
+    def addModes(self, commands):
+        """starts tracking the selection of a group of mutually exclusive modes."""
+        commands = tuple(commands)
+        for command in commands:
+            self.modes[command] = commands
+
+    def get(self, key, default=None):
+        return self.values.get(key, default)
+
+    def invalidate(self, key=None):
+        """forgets the value of `key` (or all the values if `key` is None),
+        so that the next report of it is taken as a change."""
+        if key is None:
+            self.values.clear()
+        else:
+            self.values.pop(key, None)
+
+    def parseToken(self, token):
+        """returns the (key, value) pairs that a config token represents."""
+        start = token.find('[')
+        if start >= 0:
+            end = token.find(']', start)
+            selected = token[(start+1):end]
+            if (end > start) and (selected in self.modes):
+                return [(command, command == selected) for command in self.modes[selected]]
+            return []
+        for length in self.lengths:
+            if token[:length] in self.configs:
+                return [(token[:length], token[length:])]
+        return []
+
+    def update(self, line):
+        """updates the state from a CONFIG line (an `rxline` or a str),
+        and returns the list of (key, value) pairs that have changed."""
+        if not isinstance(line, rxline):
+            line = rxline(line)
+        changed = []
+        values  = self.values
+        for token in line.tokens():
+            for key, value in self.parseToken(token):
+                if (key not in values) or (values[key] != value):
+                    values[key] = value
+                    changed.append((key, value))
+        return changed
+
+class trialresult:
+    """the result of a trial, parsed from a result line by `resultparser.parseTrial()`.
+
+    + status  -- the status of the trial (None if the line had no known status)
+    + values  -- {name: int}
+    + arrays  -- {name: values}, typed as in `decodearray()`
+    + unknown -- the tokens that could not be parsed (including any extra status)
+    + stamp   -- the `time.perf_counter_ns()` at the arrival of the line
+    """
+
+    __slots__ = ('status', 'values', 'arrays', 'unknown', 'stamp')
+
+    def __init__(self, status=None, values=None, arrays=None, unknown=(), stamp=None):
+        self.status  = status
+        self.values  = {} if values is None else values
+        self.arrays  = {} if arrays is None else arrays
+        self.unknown = tuple(unknown)
+        self.stamp   = stamp
+
+    def __repr__(self):
+        return "trialresult(status={!r}, values={!r}, arrays={!r}, unknown={!r})".format(
+                    self.status, self.values, self.arrays, self.unknown)
+
+    @property
+    def walltime(self):
+        return walltime(self.stamp)
+
+class resultparser:
+    """a parser of result lines, compiled once from the model of the result
+    (i.e. `model.Result`, see `Result.parser()`). it does not depend on Qt.
+
+    each token of a line is classified as one of:
+
+    + STATUS  -- an exact match to one of `status`: (STATUS, status, None)
+    + VALUE   -- one of `values` followed by an integer: (VALUE, name, int)
+    + ARRAY   -- one of `arrays` followed by '[v1,v2,...]': (ARRAY, name, values)
+    + UNKNOWN -- anything else: (UNKNOWN, token, None)
+
+    the value and array tokens are matched by a single regular expression,
+    compiled from all the names (the longest first, so that the longest
+    name wins if a name ends with a digit), so that a token is tested against
+    the names in one pass instead of one name after another in Python."""
+
+    STATUS  = 'status'
+    VALUE   = 'value'
+    ARRAY   = 'array'
+    UNKNOWN = 'unknown'
+
+    def __init__(self, status=(), values=(), arrays=()):
+        self.status  = frozenset(status)
+        self.values  = frozenset(values)
+        self.arrays  = frozenset(arrays)
+        self.pattern = re.compile(r'(?:({})\[(.*)\]|({})([-+]?\d+))\Z'.format(
+                                  self.alternation(self.arrays), self.alternation(self.values)))
+
+    @staticmethod
+    def alternation(names):
+        """the regex that matches any of `names` (longest first), or nothing if empty."""
+        if len(names) == 0:
+            return '(?!)'
+        return '|'.join(re.escape(name) for name in sorted(names, key=len, reverse=True))
+
+    def parseToken(self, token):
+        """classifies a single (stripped) token, and returns a (kind, name, value) tuple."""
+        if token in self.status:
+            return (self.STATUS, token, None)
+        matched = self.pattern.match(token)
+        if matched is None:
+            return (self.UNKNOWN, token, None)
+        array, elements, value, number = matched.groups()
+        if value is not None:
+            return (self.VALUE, value, int(number))
+        try:
+            return (self.ARRAY, array, decodearray(elements))
+        except ValueError:
+            print("***error while parsing array '{}': {}".format(array, token))
+            return (self.UNKNOWN, token, None)
+
+    def parse(self, line):
+        """parses a result line (an `rxline` or a str), and returns the list of
+        (kind, name, value) tuples for its tokens. the arrays of a line that
+        arrived as a binary frame are appended at the end."""
+        if not isinstance(line, rxline):
+            line = rxline(line)
+        parsed = [self.parseToken(token) for token in line.tokens()]
+        if line.arrays is not None:
+            for name, values in line.arrays.items():
+                if name in self.arrays:
+                    parsed.append((self.ARRAY, name, values))
+                else:
+                    parsed.append((self.UNKNOWN, name, None))
+        return parsed
+
+    def parseTrial(self, line):
+        """parses a result line into a `trialresult`."""
+        trial   = trialresult(stamp=getattr(line, 'stamp', None))
+        unknown = []
+        for kind, name, value in self.parse(line):
+            if (kind == self.STATUS) and (trial.status is None):
+                trial.status = name
+            elif kind == self.VALUE:
+                trial.values[name] = value
+            elif kind == self.ARRAY:
+                trial.arrays[name] = value
+            else:
+                unknown.append(name)
+        trial.unknown = tuple(unknown)
+        return trial
+
+class runningstats:
+    """the count, mean and variance of a value, that are updated in O(1)
+    as the values are added (and removed, e.g. when they leave a window)."""
+
+    __slots__ = ('count', 'total', 'squares')
+
+    def __init__(self):
+        self.count   = 0
+        self.total   = 0
+        self.squares = 0
+
+    def __repr__(self):
+        return "runningstats(count={}, mean={}, variance={})".format(
+                    self.count, self.mean, self.variance)
+
+    def add(self, value):
+        self.count   += 1
+        self.total   += value
+        self.squares += value * value
+
+    def remove(self, value):
+        self.count   -= 1
+        self.total   -= value
+        self.squares -= value * value
+
+    @property
+    def mean(self):
+        """the mean (None if there is no value)."""
+        return (self.total / self.count) if self.count > 0 else None
+
+    @property
+    def variance(self):
+        """the unbiased variance (None if there are less than two values)."""
+        if self.count < 2:
+            return None
+        # exact for the integer values of the results
+        return (self.count * self.squares - self.total * self.total) / (self.count * (self.count - 1))
+
+    def as_dict(self):
+        return {'count': self.count, 'mean': self.mean, 'variance': self.variance}
+
+class trialhistory:
+    """the history of the parsed trials of a `loop` (see its `history`), kept
+    in a ring buffer of the last `size` trials, with the statistics that are
+    updated incrementally, i.e. in O(1) per trial however long the session runs:
+
+    + counts -- {status: the number of the trials} over all the trials
+    + recent -- {status: the number of the trials} over the last `size` trials
+    + values -- {name: `runningstats`} over all the trials
+    + window -- {name: `runningstats`} over the last `size` trials
+    + streak -- the number of the latest trials in a row that had the status of the last one
+
+    `parser` is a `resultparser` (e.g. from `model.Result.parser()`).
+    the trials can be accessed as a sequence, from the oldest (0) to the latest (-1)."""
+
+    def __init__(self, parser, size=100):
+        if size < 1:
+            raise ValueError("'size' must be 1 or larger: {}".format(size))
+        self.parser = parser
+        self.size   = int(size)
+        self.clear()
+
+    def clear(self):
+        self.records    = [None] * self.size
+        self.head       = 0     # where the next trial is stored
+        self.filled     = 0
+        self.total      = 0     # the number of the trials in all
+        self.counts     = {}
+        self.recent     = {}
+        self.values     = {}
+        self.window     = {}
+        self.laststatus = None
+        self.streak     = 0
+
+    def __len__(self):
+        return self.filled
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += self.filled
+        if (index < 0) or (index >= self.filled):
+            raise IndexError("trial history index out of range")
+        return self.records[(self.head - self.filled + index) % self.size]
+
+    def __iter__(self):
+        for index in range(self.filled):
+            yield self[index]
+
+    @property
+    def last(self):
+        """the latest trial (None if there is none)."""
+        return self[-1] if self.filled > 0 else None
+
+    def add(self, line):
+        """parses `line` (a result line, or a `trialresult` as it is),
+        records it and returns the `trialresult`."""
+        trial = line if isinstance(line, trialresult) else self.parser.parseTrial(line)
+        if self.filled == self.size:
+            self.forget(self.records[self.head])
+        else:
+            self.filled += 1
+        self.records[self.head] = trial
+        self.head   = (self.head + 1) % self.size
+        self.total += 1
+
+        status = trial.status
+        self.counts[status] = self.counts.get(status, 0) + 1
+        self.recent[status] = self.recent.get(status, 0) + 1
+        if (self.streak > 0) and (status == self.laststatus):
+            self.streak += 1
+        else:
+            self.streak = 1
+        self.laststatus = status
+        for name, value in trial.values.items():
+            if name not in self.values:
+                self.values[name] = runningstats()
+                self.window[name] = runningstats()
+            self.values[name].add(value)
+            self.window[name].add(value)
+        return trial
+
+    def forget(self, trial):
+        """removes `trial` (that leaves the ring buffer) from the recent statistics."""
+        self.recent[trial.status] -= 1
+        for name, value in trial.values.items():
+            self.window[name].remove(value)
+
+    def count(self, status, recent=True):
+        """the number of the trials with `status` (among the last `size` trials if `recent`)."""
+        return (self.recent if recent == True else self.counts).get(status, 0)
+
+    def rate(self, statuses, recent=True):
+        """the ratio of the trials that had one of `statuses` (a status or a sequence of them),
+        among the last `size` trials (or all the trials). None if there is no trial."""
+        if isinstance(statuses, str):
+            statuses = (statuses,)
+        table  = self.recent if recent == True else self.counts
+        number = self.filled if recent == True else self.total
+        if number == 0:
+            return None
+        return sum(table.get(status, 0) for status in statuses) / number
+
+    def stats(self, name, recent=True):
+        """the `runningstats` of the value `name` (among the last `size` trials if `recent`)."""
+        stats = (self.window if recent == True else self.values).get(name, None)
+        return runningstats() if stats is None else stats
+
+    def mean(self, name, recent=True):
+        return self.stats(name, recent=recent).mean
+
+    def variance(self, name, recent=True):
+        return self.stats(name, recent=recent).variance
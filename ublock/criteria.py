@@ -0,0 +1,216 @@
+import re
+import operator
+
+from .core import protocol, tokenize, trialresult, resultparser
+
+"""a small language for the criteria of actions.
+
+a criteria expression is compiled once (through `compilecriteria()`)
+into a function that takes a result (a `core.trialresult`, or a result
+line), and returns whether the trial counts:
+
+    hit                     -- the status is 'hit'
+    hit|catch               -- the status is one of 'hit' and 'catch'
+    wait>200                -- the value 'wait' is larger than 200
+                               (also: >=, <, <=, ==, !=)
+    len(lick)>=3            -- the array 'lick' has 3 or more elements
+    hit and not wait>200    -- predicates combined with 'and', 'or',
+                               'not' and parentheses
+
+a predicate on a value or an array that is missing from the result is False.
+the status of a result line is its first token (see `statusof()`), whether
+the expression only tests the status or not.
+
+a sequence of statuses (instead of an expression) accepts a result line
+that starts with one of them, e.g. ('hit',) also accepts '+hit2;...',
+as the `strict` mode of `app.RepeatUI` has always done.
+"""
+
+COMPARATORS = {
+    '>':    operator.gt,
+    '>=':   operator.ge,
+    '<':    operator.lt,
+    '<=':   operator.le,
+    '==':   operator.eq,
+    '!=':   operator.ne,
+}
+
+KEYWORDS = ('and', 'or', 'not', 'len')
+
+TOKEN = re.compile(r"\s*(?:(?P<number>[+-]?\d+)(?![^\s|()<>=!])|(?P<op>>=|<=|==|!=|[<>|()])|(?P<name>[^\s|()<>=!]+))")
+
+class criteriaparser:
+    """the recursive-descent parser that turns an expression into a predicate
+    on a `trialresult`. the names that the expression refers to are collected
+    in `status`, `values` and `arrays`."""
+
+    def __init__(self, expression):
+        self.expression = expression
+        self.tokens     = self.lex(expression)
+        self.pos        = 0
+        self.status     = set()
+        self.values     = set()
+        self.arrays     = set()
+
+    def lex(self, expression):
+        tokens = []
+        pos    = 0
+        expression = expression.rstrip()
+        while pos < len(expression):
+            matched = TOKEN.match(expression, pos)
+            if matched is None:
+                raise ValueError("invalid criteria: '{}' (at {})".format(expression, pos))
+            kind = matched.lastgroup
+            tokens.append((kind, matched.group(kind)))
+            pos = matched.end()
+        return tokens
+
+    def peek(self):
+        return self.tokens[self.pos] if self.pos < len(self.tokens) else (None, None)
+
+    def describe(self, token):
+        return "'{}'".format(token[1]) if token[0] is not None else "the end"
+
+    def take(self, kind=None, value=None):
+        token = self.peek()
+        if ((kind is not None) and (token[0] != kind)) or ((value is not None) and (token[1] != value)):
+            expected = value if value is not None else kind
+            raise ValueError("invalid criteria: '{}' ({} expected, got {})".format(
+                                self.expression, expected, self.describe(token)))
+        self.pos += 1
+        return token[1]
+
+    def parse(self):
+        predicate = self.parseOr()
+        if self.pos < len(self.tokens):
+            raise ValueError("invalid criteria: '{}' (unexpected {})".format(
+                                self.expression, self.describe(self.peek())))
+        return predicate
+
+    def parseOr(self):
+        terms = [self.parseAnd()]
+        while self.peek() == ('name', 'or'):
+            self.take()
+            terms.append(self.parseAnd())
+        if len(terms) == 1:
+            return terms[0]
+        return lambda trial: any(term(trial) for term in terms)
+
+    def parseAnd(self):
+        factors = [self.parseNot()]
+        while self.peek() == ('name', 'and'):
+            self.take()
+            factors.append(self.parseNot())
+        if len(factors) == 1:
+            return factors[0]
+        return lambda trial: all(factor(trial) for factor in factors)
+
+    def parseNot(self):
+        if self.peek() == ('name', 'not'):
+            self.take()
+            factor = self.parseNot()
+            return lambda trial: not factor(trial)
+        elif self.peek() == ('op', '('):
+            self.take()
+            predicate = self.parseOr()
+            self.take('op', ')')
+            return predicate
+        return self.parsePredicate()
+
+    def parseComparison(self):
+        compare = COMPARATORS.get(self.peek()[1], None)
+        if compare is None:
+            raise ValueError("invalid criteria: '{}' (comparator expected, got {})".format(
+                                self.expression, self.describe(self.peek())))
+        self.take()
+        return compare, int(self.take('number'))
+
+    def parseName(self):
+        name = self.take('name')
+        if name in KEYWORDS:
+            raise ValueError("invalid criteria: '{}' (unexpected '{}')".format(self.expression, name))
+        return name
+
+    def parsePredicate(self):
+        if self.peek() == ('name', 'len'):
+            self.take()
+            self.take('op', '(')
+            name = self.parseName()
+            self.take('op', ')')
+            compare, threshold = self.parseComparison()
+            self.arrays.add(name)
+            return lambda trial: (name in trial.arrays) and compare(len(trial.arrays[name]), threshold)
+
+        name = self.parseName()
+        if self.peek()[1] in COMPARATORS:
+            compare, threshold = self.parseComparison()
+            self.values.add(name)
+            return lambda trial: (name in trial.values) and compare(trial.values[name], threshold)
+
+        statuses = {name}
+        while self.peek() == ('op', '|'):
+            self.take()
+            statuses.add(self.parseName())
+        self.status.update(statuses)
+        statuses = frozenset(statuses)
+        return lambda trial: trial.status in statuses
+
+def statusof(result):
+    """returns the status of `result`, i.e. the `status` of a `trialresult`,
+    or the first token of a result line (or None if it has no tokens)."""
+    if isinstance(result, trialresult):
+        return result.status
+    has_header = result[:1] in (protocol.RESULT, protocol.CONFIG)
+    return next(tokenize(result, has_header=has_header), None)
+
+def statusevaluator(statuses):
+    """returns an evaluator that only tests the status (see `statusof()`)."""
+    statuses = frozenset(statuses)
+
+    def __evaluator(result):
+        return statusof(result) in statuses
+    return __evaluator
+
+def prefixevaluator(statuses):
+    """returns an evaluator that tests whether the result line starts with
+    one of `statuses` (or the status of a `trialresult` does)."""
+    statuses = tuple(statuses)
+
+    def __evaluator(result):
+        if isinstance(result, trialresult):
+            return (result.status is not None) and result.status.startswith(statuses)
+        if result[:1] in (protocol.RESULT, protocol.CONFIG):
+            result = result[1:]
+        return result.startswith(statuses)
+    return __evaluator
+
+def compilecriteria(spec):
+    """compiles `spec` into a function that evaluates a result.
+
+    `spec` can be a criteria expression, a sequence of statuses (that
+    the result line must start with; see the module documentation), or a
+    callable (that is returned as it is). returns None if `spec` is None.
+    raises ValueError if the expression is invalid."""
+    if (spec is None) or callable(spec):
+        return spec
+    if not isinstance(spec, str):
+        return prefixevaluator(spec)
+
+    parser    = criteriaparser(spec)
+    predicate = parser.parse()
+    if all((token == ('op', '|')) or (token[0] == 'name') and (token[1] not in KEYWORDS)
+           for token in parser.tokens):
+        # only a set of statuses: no need to parse the whole line
+        return statusevaluator(parser.status)
+
+    # only the names that the expression refers to are parsed
+    results = resultparser(parser.status, parser.values, parser.arrays)
+
+    def __evaluator(result):
+        if not isinstance(result, trialresult):
+            line   = result
+            result = results.parseTrial(line)
+            # the same status as in `statusevaluator()`
+            result.status = statusof(line)
+        return predicate(result)
+    return __evaluator
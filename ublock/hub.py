@@ -0,0 +1,194 @@
+import os
+import time
+import heapq
+import itertools
+import threading
+import selectors
+from collections import deque
+from traceback import print_exc
+import serial
+
+from .core import linebuffer, rawline, writequeue
+
+"""multiplexing the I/O of many clients in a single thread.
+
+instead of running one `iothread` per client, pass a shared `hub`
+to the clients:
+
+    iohub   = hub()
+    devices = [client(addr, handler=handler, hub=iohub) for addr in addrs]
+    ...
+    iohub.close()
+
+the ports must provide `fileno()` (i.e. it does not work with
+pyserial on Windows).
+"""
+
+class channel:
+    """the per-port counterpart of `iothread` for a client attached to a `hub`.
+
+    it provides the same interface as `iothread` to the client
+    (`connected`, `writeLine()`, `queueDepth()`, `flush()`, `interrupt()` and `join()`),
+    while the actual I/O takes place in the hub thread."""
+
+    def __init__(self, hub, port, delegate):
+        self.hub        = hub
+        self.port       = port
+        self.delegate   = delegate
+        self.lines      = linebuffer(self.dispatchLine)
+        self.outgoing   = writequeue()
+        self.connected  = False
+        self.finished   = threading.Event()
+        self.port.timeout = 0
+
+    def writeLine(self, msg, flush=False):
+        seq = self.outgoing.put((msg + "\r\n").encode())
+        self.hub.wake()
+        if flush == True:
+            self.outgoing.flush(seq)
+
+    def queueDepth(self):
+        return len(self.outgoing)
+
+    def flush(self, timeout=None):
+        return self.outgoing.flush(timeout=timeout)
+
+    def interrupt(self):
+        self.hub.call(self.hub.detach, self)
+
+    def join(self, timeout=None):
+        if threading.current_thread() is not self.hub:
+            self.finished.wait(timeout)
+
+    def dispatchLine(self, line, stamp):
+        self.delegate.handleLine(rawline(line, stamp))
+
+    def readReady(self):
+        data = self.port.read(max(self.port.in_waiting, 1))
+        if len(data) > 0:
+            self.lines.feed(data, time.perf_counter_ns())
+
+    def writeReady(self):
+        data, seq = self.outgoing.take(timeout=0)
+        if data is not None:
+            self.port.write(data)
+            self.outgoing.done(seq)
+
+class hub(threading.Thread):
+    """the thread that serves the I/O of many ports through `selectors`.
+
+    use `attach()` (or the `hub` keyword argument of `client`)
+    to add a port, and `close()` to detach all the ports and
+    to stop the thread."""
+
+    def __init__(self):
+        super().__init__(daemon=True)
+        self.selector   = selectors.DefaultSelector()
+        self.channels   = []
+        self.calls      = deque()
+        self.timers     = []
+        self.timerseq   = itertools.count()
+        self.quitreq    = False
+        self._waker, self._wakew = os.pipe()
+        os.set_blocking(self._wakew, False)
+        self.selector.register(self._waker, selectors.EVENT_READ, None)
+        self.start()
+
+    def wake(self):
+        try:
+            os.write(self._wakew, b'x')
+        except BlockingIOError:
+            pass # already woken up
+
+    def call(self, func, *args):
+        """calls `func(*args)` from within the hub thread."""
+        self.calls.append((func, args))
+        self.wake()
+
+    def callLater(self, delay, func, *args):
+        """calls `func(*args)` from within the hub thread after `delay` seconds."""
+        self.call(heapq.heappush, self.timers, (time.monotonic() + delay, next(self.timerseq), func, args))
+
+    def attach(self, port, delegate, waitfirst=0, initialcmd=None):
+        """starts serving `port`, and returns a `channel` that dispatches
+        the lines to `delegate.handleLine()`."""
+        chan = channel(self, port, delegate)
+        self.callLater(waitfirst, self.register, chan, initialcmd)
+        return chan
+
+    def register(self, chan, initialcmd):
+        if chan.finished.is_set():
+            return
+        self.selector.register(chan.port.fileno(), selectors.EVENT_READ, chan)
+        self.channels.append(chan)
+        chan.connected = True
+        chan.delegate.connected()
+        if initialcmd is not None:
+            chan.writeLine(initialcmd)
+
+    def detach(self, chan):
+        if chan.finished.is_set():
+            return
+        if chan in self.channels:
+            self.channels.remove(chan)
+            try:
+                self.selector.unregister(chan.port.fileno())
+            except (KeyError, ValueError):
+                pass
+        chan.outgoing.close()
+        try:
+            chan.port.close()
+        except serial.SerialException:
+            pass
+        print(">port closed")
+        chan.delegate.closed()
+        chan.finished.set()
+
+    def close(self):
+        """detaches all the channels and stops the thread."""
+        for chan in list(self.channels):
+            chan.interrupt()
+        self.call(setattr, self, 'quitreq', True)
+        self.join()
+        self.selector.close()
+        os.close(self._waker)
+        os.close(self._wakew)
+
+    def invoke(self, func, args):
+        try:
+            func(*args)
+        except Exception:
+            print_exc()
+
+    def nextTimeout(self):
+        if len(self.timers) == 0:
+            return None
+        return max(self.timers[0][0] - time.monotonic(), 0)
+
+    def run(self):
+        while not self.quitreq:
+            for key, mask in self.selector.select(self.nextTimeout()):
+                chan = key.data
+                if chan is None:
+                    os.read(self._waker, 4096)
+                    continue
+                try:
+                    chan.readReady()
+                except serial.SerialException:
+                    self.detach(chan)
+                except Exception:
+                    # an error in one of the delegates must not stop the others
+                    print_exc()
+            while len(self.calls) > 0:
+                func, args = self.calls.popleft()
+                self.invoke(func, args)
+            now = time.monotonic()
+            while len(self.timers) > 0 and self.timers[0][0] <= now:
+                _, _, func, args = heapq.heappop(self.timers)
+                self.invoke(func, args)
+            for chan in self.channels:
+                if len(chan.outgoing) > 0:
+                    try:
+                        chan.writeReady()
+                    except serial.SerialException:
+                        self.call(self.detach, chan)
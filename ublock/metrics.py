@@ -0,0 +1,186 @@
+import json
+import time
+import threading
+
+"""opt-in runtime metrics of the I/O pipeline.
+
+a `collector` is attached through `client.enableMetrics()` or
+`app.SerialIO.enableMetrics()`. the instrumented code paths are swapped
+in only while it is attached (and swapped out by `disableMetrics()`),
+so that the pipeline runs exactly as before when the metrics are disabled.
+
+the collector keeps:
+
++ counters   -- the number of lines and bytes per category ('result', 'config', ...)
++ gauges     -- the last and the maximum of the depths (e.g. 'readchunk': the bytes
+                drained from the port at a time, 'carryover': the partial line in the
+                read buffer, 'writequeue': the commands waiting to be written)
++ histograms -- the latencies (in ns), e.g. 'handler.<category>' (the time spent in
+                `handleLine()`), 'wait' (from the read until the dispatch of a line),
+                'deliver.<category>' (from the read until the Qt slots have been called),
+                'parse' and 'plot' (in `app.ResultParser`)
+
+`snapshot()` returns all of them as a dictionary, and `startDumping()`
+appends a snapshot to a file (as a line of JSON) every `interval` seconds.
+"""
+
+class histogram:
+    """a histogram of non-negative integers (e.g. latencies in ns)
+    in power-of-2 bins, i.e. the bin `b` counts the values in [2**(b-1), 2**b)."""
+
+    NBINS = 64
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self.bins   = [0] * self.NBINS
+        self.count  = 0
+        self.total  = 0
+        self.max    = 0
+
+    def add(self, value):
+        value = max(int(value), 0)
+        self.bins[min(value.bit_length(), self.NBINS - 1)] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def percentile(self, point):
+        """returns the upper bound of the bin that contains `point` (in %)
+        of the values, or 0 if there is no value."""
+        if self.count == 0:
+            return 0
+        target  = self.count * point / 100
+        counted = 0
+        for b, num in enumerate(self.bins):
+            counted += num
+            if counted >= target:
+                return min(1 << b, self.max) if b > 0 else 0
+        return self.max
+
+    def as_dict(self):
+        return {
+            'count':    self.count,
+            'mean':     self.total / self.count if self.count > 0 else 0,
+            'p50':      self.percentile(50),
+            'p90':      self.percentile(90),
+            'p99':      self.percentile(99),
+            'max':      self.max,
+        }
+
+class gauge:
+    """keeps the last and the maximum of a sampled value."""
+
+    def __init__(self):
+        self.last   = 0
+        self.max    = 0
+
+    def set(self, value):
+        self.last = value
+        if value > self.max:
+            self.max = value
+
+    def as_dict(self):
+        return {'last': self.last, 'max': self.max}
+
+class collector:
+    """collects the counters, gauges and histograms of the pipeline.
+
+    updates may come from the I/O thread, the GUI thread and the dumping
+    thread at the same time: the counters are updated, and each entry is
+    only created, under `lock`."""
+
+    def __init__(self):
+        self.lock       = threading.Lock()
+        self.started    = time.time()
+        self.lines      = {}
+        self.bytes      = {}
+        self.gauges     = {}
+        self.histograms = {}
+        self.dumper     = None
+        self.dumpstop   = threading.Event()
+
+    def _entry(self, table, name, factory):
+        entry = table.get(name, None)
+        if entry is None:
+            with self.lock:
+                entry = table.setdefault(name, factory())
+        return entry
+
+    def count(self, category, nbytes):
+        """counts a line of `nbytes` bytes in `category`."""
+        # under the lock, as `clear()` may empty the tables at any time
+        with self.lock:
+            self.lines[category] = self.lines.get(category, 0) + 1
+            self.bytes[category] = self.bytes.get(category, 0) + nbytes
+
+    def sample(self, name, value):
+        """sets the gauge `name` to `value`."""
+        self._entry(self.gauges, name, gauge).set(value)
+
+    def latency(self, name, ns):
+        """adds `ns` to the histogram `name`."""
+        self._entry(self.histograms, name, histogram).add(ns)
+
+    def clear(self):
+        with self.lock:
+            self.started = time.time()
+            self.lines.clear()
+            self.bytes.clear()
+            self.gauges.clear()
+            self.histograms.clear()
+
+    def snapshot(self):
+        """returns the current state as a dictionary (that can be written as JSON)."""
+        with self.lock:
+            now = time.time()
+            return {
+                'time':         now,
+                'elapsed':      now - self.started,
+                'lines':        dict(self.lines),
+                'bytes':        dict(self.bytes),
+                'gauges':       dict((name, entry.as_dict()) for name, entry in self.gauges.items()),
+                'histograms':   dict((name, entry.as_dict()) for name, entry in self.histograms.items()),
+            }
+
+    def report(self):
+        """returns a human-readable summary (the latencies in us)."""
+        snapshot = self.snapshot()
+        lines    = ["metrics ({:.1f} s):".format(snapshot['elapsed'])]
+        for category in sorted(snapshot['lines'].keys()):
+            lines.append("  {:<20}: {} lines, {} bytes".format(category,
+                         snapshot['lines'][category], snapshot['bytes'][category]))
+        for name in sorted(snapshot['gauges'].keys()):
+            entry = snapshot['gauges'][name]
+            lines.append("  {:<20}: last {}, max {}".format(name, entry['last'], entry['max']))
+        for name in sorted(snapshot['histograms'].keys()):
+            entry = snapshot['histograms'][name]
+            lines.append("  {:<20}: n={}, mean {:.1f}, p50 {:.1f}, p90 {:.1f}, p99 {:.1f}, max {:.1f}".format(
+                         name, entry['count'], entry['mean'] / 1000, entry['p50'] / 1000,
+                         entry['p90'] / 1000, entry['p99'] / 1000, entry['max'] / 1000))
+        return "\n".join(lines)
+
+    def dump(self, path):
+        """appends the current snapshot to the file at `path`, as a line of JSON."""
+        with open(path, 'a') as out:
+            print(json.dumps(self.snapshot()), file=out, flush=True)
+
+    def startDumping(self, path, interval=1.0):
+        """dumps the snapshot to `path` every `interval` seconds, from a daemon thread."""
+        self.stopDumping()
+        self.dumpstop.clear()
+        def __run():
+            while not self.dumpstop.wait(interval):
+                self.dump(path)
+            self.dump(path)
+        self.dumper = threading.Thread(target=__run, daemon=True)
+        self.dumper.start()
+
+    def stopDumping(self):
+        """stops the periodic dumping (after writing the last snapshot)."""
+        if self.dumper is not None:
+            self.dumpstop.set()
+            self.dumper.join()
+            self.dumper = None
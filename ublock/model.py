@@ -1,5 +1,8 @@
 from collections import OrderedDict
 
+from .core import resultparser
+from .criteria import compilecriteria
+
 """the model layer of ublock."""
 
 class Command:
@@ -37,22 +40,39 @@ class Config(Command):
         self.defaultvalue = int(defaultvalue)
 
 class Action(Command):
-    """a class that represents the task action."""
+    """a class that represents the task action.
+
+    `criteria` and `strict` are compiled once through `criteria.compilecriteria()`,
+    i.e. they can be an expression such as 'hit and wait>200',
+    a sequence of statuses, or a callable.
+
+    for repeated actions, `interval` (the inter-trial interval in seconds),
+    `timeout` (in seconds), `retries`, `ontimeout` and `batch` (the command
+    for running the trials on the device) are passed to `core.loop`."""
 
     def __init__(self, name, command, label=None, desc=None,
                  repeats=True, returns='result', criteria=None,
-                 strict=None):
+                 strict=None, interval=0, timeout=None, retries=0,
+                 ontimeout='skip', batch=None):
         super().__init__(name, command, label=label, desc=desc)
         self.returns    = returns
         self.repeats    = bool(repeats)
-        self.criteria   = criteria
-        self.strict     = strict
+        self.criteria   = compilecriteria(criteria)
+        self.strict     = compilecriteria(strict)
+        self.interval   = interval
+        self.timeout    = timeout
+        self.retries    = int(retries)
+        self.ontimeout  = ontimeout
+        self.batch      = batch
 
 class Logger:
-    def __init__(self, name, label=None, fmt="{}_%Y-%m-%d_%H%M%S.log"):
-        self.name   = name
-        self.label  = label
-        self.fmt    = fmt
+    def __init__(self, name, label=None, fmt="{}_%Y-%m-%d_%H%M%S.log",
+                 timestamps=False):
+        """timestamps: whether or not to prefix each line with its time of arrival."""
+        self.name       = name
+        self.label      = label
+        self.fmt        = fmt
+        self.timestamps = bool(timestamps)
 
 class Result:
     """a class that is used inside the Model instance
@@ -67,6 +87,10 @@ class Result:
     def as_dict(self):
         return dict(status=self.status, values=self.values, arrays=self.arrays)
 
+    def parser(self):
+        """returns a `core.resultparser` that is compiled from this model."""
+        return resultparser(self.status, self.values, self.arrays)
+
 class ResultPlot:
     """a base configuration class for plotting results"""
     def __init__(self, colormappings, markersize=8):
@@ -125,16 +149,20 @@ class Task:
                                     defaultvalue=defaultvalue)
 
     def addAction(self, name, command, label=None, desc=None,
-                  returns='result', repeats=True, criteria=None, strict=None):
+                  returns='result', repeats=True, criteria=None, strict=None,
+                  interval=0, timeout=None, retries=0, ontimeout='skip', batch=None):
         self.actions[name] = Action(name, command, label=label,
                                     desc=desc, repeats=repeats,
-                                    returns=returns, criteria=criteria, strict=strict)
+                                    returns=returns, criteria=criteria, strict=strict,
+                                    interval=interval, timeout=timeout,
+                                    retries=retries, ontimeout=ontimeout, batch=batch)
 
     def setResult(self, status=(), values=(), arrays=()):
         self.result = Result(status, values, arrays)
 
-    def addLogger(self, name, label=None, fmt="{}_%Y-%m-%d_%H%M%S.log"):
-        self.loggers[name] = Logger(name, label=label, fmt=fmt)
+    def addLogger(self, name, label=None, fmt="{}_%Y-%m-%d_%H%M%S.log",
+                  timestamps=False):
+        self.loggers[name] = Logger(name, label=label, fmt=fmt, timestamps=timestamps)
 
     def addFeatures(self, *features):
         """current set of features: see Task.available_features"""
@@ -0,0 +1,202 @@
+import sys
+import time
+import threading
+import serial
+
+from .core import rxline, perfstamp, dispatcher, eventhandler
+
+"""replaying the log files recorded by `app.LoggerUI`.
+
+the lines of a log file can be fed through the same handler chain
+as the lines from a live device, either:
+
++ through a `replayport`, a port-like object that can be opened by
+  `client` or `app.SerialIO` (e.g. `widget.serial.openPort(replayport(path))`),
+  so that the whole pipeline (including the I/O thread) is exercised, or
++ through a `player`, that calls `handler` synchronously in the calling
+  thread (headless, e.g. for profiling or offline analysis).
+
+with `speed=None`, the lines are fed as fast as possible. otherwise the
+lines are paced using their recorded time stamps (i.e. a log that was recorded
+with `timestamps=True`), with `speed=2` replaying the session twice as fast.
+lines without time stamps are fed as soon as possible.
+
+run as `python -m ublock.replay LOGFILE [SPEED]` to measure the throughput
+of a headless replay.
+"""
+
+def parselogline(line):
+    """returns (walltime, text) from a line of a log file, where `walltime`
+    is the recorded time in nanoseconds since the epoch (None if the line
+    does not have any time stamp)."""
+    head, sep, text = line.partition('\t')
+    if len(sep) > 0:
+        try:
+            return int(round(float(head) * 1e9)), text
+        except ValueError:
+            pass
+    return None, line
+
+def readlog(path):
+    """yields the (walltime, text) of each non-empty line of the log file at `path`."""
+    with open(path, 'r') as logfile:
+        for line in logfile:
+            line = line.rstrip('\r\n')
+            if len(line) > 0:
+                yield parselogline(line)
+
+class pacer:
+    """converts the recorded time stamps into the due times of replay
+    (in `time.perf_counter()`) at `speed`."""
+
+    def __init__(self, speed=None):
+        self.speed   = speed
+        self.started = None
+        self.origin  = None
+
+    def due(self, wall):
+        if self.started is None:
+            self.started = time.perf_counter()
+        if (self.speed is None) or (wall is None):
+            return self.started
+        if self.origin is None:
+            self.origin = wall
+        return self.started + (wall - self.origin) / 1e9 / self.speed
+
+class replayport:
+    """a read-only, port-like object that serves the lines of a log file.
+
+    the lines that are due are reported through `in_waiting` (at most
+    `chunksize` bytes at a time), and `read()` blocks until the next line
+    is due (or until `timeout`). it raises `serial.SerialException` at
+    the end of the log, so that the I/O thread finishes. anything written
+    to the port is discarded."""
+
+    def __init__(self, path, speed=None, chunksize=4096):
+        self.name       = path
+        self.timeout    = None
+        self.is_open    = True
+        self.chunksize  = chunksize
+        self.records    = readlog(path)
+        self.pacer      = pacer(speed)
+        self.pending    = None # the (due, data) of the next line
+        self.buf        = bytearray()
+        self.closing    = threading.Event()
+
+    def __repr__(self):
+        return "replayport({})".format(self.name)
+
+    def _check(self):
+        if self.is_open == False:
+            raise serial.SerialException("port not open: {}".format(self.name))
+
+    def _fill(self):
+        """moves the lines that are due into the buffer.
+        returns False if the log has been read out."""
+        now = time.perf_counter()
+        while len(self.buf) < self.chunksize:
+            if self.pending is None:
+                record = next(self.records, None)
+                if record is None:
+                    return len(self.buf) > 0
+                wall, text = record
+                self.pending = (self.pacer.due(wall), (text + "\r\n").encode())
+            if self.pending[0] > now:
+                break
+            self.buf += self.pending[1]
+            self.pending = None
+        return True
+
+    @property
+    def in_waiting(self):
+        self._check()
+        self._fill()
+        return len(self.buf)
+
+    def read(self, size=1):
+        self._check()
+        deadline = None if self.timeout is None else (time.perf_counter() + self.timeout)
+        while len(self.buf) == 0:
+            if self._fill() == False:
+                raise serial.SerialException("{}: end of the log".format(self.name))
+            if len(self.buf) > 0:
+                break
+            wait = self.pending[0] - time.perf_counter()
+            if deadline is not None:
+                if deadline <= time.perf_counter():
+                    break # timeout
+                wait = min(wait, deadline - time.perf_counter())
+            if self.closing.wait(max(wait, 0)):
+                break
+        data = bytes(self.buf[:size])
+        del self.buf[:size]
+        return data
+
+    def write(self, data):
+        self._check()
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.is_open = False
+        self.closing.set()
+
+class player(dispatcher):
+    """feeds the lines of a log file to `handler` (an `eventhandler`)
+    synchronously, in the calling thread.
+
+    the lines are passed as `rxline` objects that carry their recorded
+    time stamps (i.e. `line.walltime` is the time of recording).
+    `run()` returns the number of the lines that have been fed."""
+
+    def __init__(self, path, handler=None, speed=None):
+        self.path       = path
+        self.speed      = speed
+        self.handler    = eventhandler() if handler is None else handler
+        self.stopped    = False
+
+    def stop(self):
+        """stops `run()` after the current line (can be called from another thread)."""
+        self.stopped = True
+
+    def run(self):
+        self.stopped = False
+        self.handler.connected(self)
+        timing  = pacer(self.speed)
+        count   = 0
+        for wall, text in readlog(self.path):
+            if self.stopped == True:
+                break
+            if self.speed is not None:
+                wait = timing.due(wall) - time.perf_counter()
+                if wait > 0:
+                    time.sleep(wait)
+            self.handleLine(rxline(text, None if wall is None else perfstamp(wall)))
+            count += 1
+        self.handler.closed()
+        return count
+
+class categorycounter(eventhandler):
+    """an `eventhandler` that counts the lines in each category."""
+
+    def __init__(self):
+        self.counts = {}
+
+    def received(self, line):
+        prefix = line.prefix
+        self.counts[prefix] = self.counts.get(prefix, 0) + 1
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("usage: python -m ublock.replay LOGFILE [SPEED]")
+        sys.exit(1)
+    speed   = float(sys.argv[2]) if len(sys.argv) > 2 else None
+    counter = categorycounter()
+    start   = time.perf_counter()
+    count   = player(sys.argv[1], handler=counter, speed=speed).run()
+    elapsed = time.perf_counter() - start
+    print("{} lines in {:.3f} s ({:.0f} lines/s)".format(count, elapsed, count / elapsed))
+    for prefix, num in sorted(counter.counts.items()):
+        print("  '{}': {}".format(prefix, num))
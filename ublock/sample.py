@@ -21,6 +21,8 @@ if __name__ == "__main__":
 
     # add 'repeatable' actions
     task.addAction('runTask', 'X', label="Run task")
+    # the same trials, run in a row by the device ('N<count>')
+    task.addAction('runBatch', 'X', label="Run batch", batch='N')
 
     # add 'non-repeatable' actions
     task.addAction('querySettings', '?', label='Current settings', repeats=False,
@@ -0,0 +1,528 @@
+import os
+import json
+import time
+import random
+import threading
+
+from .core import loop, loophandler, waituntil
+
+"""precomputed trial schedules.
+
+a `design` describes a session as a sequence of blocks, and is compiled
+(reproducibly from its `seed`) into the list of `step`s, i.e. the trials
+in the order they are run, each with its action and the mode/configs it requires:
+
+    session = design(task, seed=1)
+    session.addBlock('runTask', 50, mode='Pair')
+    session.addBlock('runTask', 200, conditions=[{'stim_dur_ms': 100}, {'stim_dur_ms': 200}],
+                     mode='Test', order='balanced', catch=0.1, catchcondition={'stim_dur_ms': 0})
+    runner  = scheduler(task, session.compile(), io=client(addr), checkpoint='session.ckpt')
+    runner.run()
+
+a condition is a dictionary from the names of the configs (in `task`) to their
+values, and may also contain 'mode' (the name of a mode) and 'action' (the name
+of the action, in place of that of the block). `order` is one of:
+
++ 'sequential' -- the conditions in the given order, each as a sub-block
++ 'balanced'   -- cycles through all the conditions, in a shuffled order in each cycle
++ 'random'     -- shuffled as a whole (with the same number of trials per condition)
+
+`catch` is the ratio of the trials of the block that are run with `catchcondition`
+instead. they are spread evenly over the block (one at a random position in each
+segment of 1/`catch` trials), unless one has to be moved so that the block
+keeps to `maxrun`.
+
+the `scheduler` runs the steps through `core.loop`: consecutive steps with the
+same action and state are run as a single loop (i.e. as a batch on the device,
+if the action has `batch`), and only the mode/config commands that change
+the state are sent. they are not waited for before the trials, but the
+position in the schedule only advances once they have been acknowledged
+(the replies come in order, so they arrive before those of the trials):
+if any of them has not, the run is aborted without counting the trial.
+
+with `checkpoint` (a path), the schedule and the progress after each trial are
+written to the file, so that an interrupted run can be continued through
+`scheduler.resume()`.
+"""
+
+ORDERS = ('sequential', 'balanced', 'random')
+
+def runthrough(sequence, pos):
+    """the length of the run of the same items that includes `pos`."""
+    item  = sequence[pos]
+    left  = pos
+    while (left > 0) and (sequence[left - 1] == item):
+        left -= 1
+    right = pos
+    while (right < len(sequence) - 1) and (sequence[right + 1] == item):
+        right += 1
+    return right - left + 1
+
+def limitruns(sequence, maxrun, rng):
+    """rearranges `sequence` (in place) so that no item repeats more than
+    `maxrun` times in a row, by swapping the items that exceed it with the ones
+    at random positions. raises ValueError if it is not possible."""
+    if (maxrun is None) or (len(sequence) == 0):
+        return sequence
+    run = 1
+    for i in range(1, len(sequence)):
+        run = (run + 1) if sequence[i] == sequence[i - 1] else 1
+        if run <= maxrun:
+            continue
+        for j in rng.sample(range(len(sequence)), len(sequence)):
+            if sequence[j] == sequence[i]:
+                continue
+            sequence[i], sequence[j] = sequence[j], sequence[i]
+            if (runthrough(sequence, i) <= maxrun) and (runthrough(sequence, j) <= maxrun):
+                break
+            sequence[i], sequence[j] = sequence[j], sequence[i]
+        else:
+            raise ValueError("cannot limit the runs to {}: {}".format(maxrun, sequence))
+        run = 1
+        while (run < i + 1) and (sequence[i - run] == sequence[i]):
+            run += 1
+    return sequence
+
+class step:
+    """a trial of a compiled schedule.
+
+    + block  -- the index of the block
+    + action -- the name of the action
+    + state  -- {'mode': name, config name: value} that the trial requires
+    + catch  -- whether it is a catch trial
+    """
+
+    __slots__ = ('block', 'action', 'state', 'catch')
+
+    def __init__(self, block, action, state, catch=False):
+        self.block  = block
+        self.action = action
+        self.state  = state
+        self.catch  = catch
+
+    def __repr__(self):
+        return "step(block={}, action={!r}, state={}, catch={})".format(
+                    self.block, self.action, self.state, self.catch)
+
+    def as_list(self):
+        return [self.block, self.action, self.state, self.catch]
+
+    @classmethod
+    def fromlist(cls, item):
+        return cls(*item)
+
+class block:
+    """a block of `number` trials of `action` (see `design.addBlock()`)."""
+
+    def __init__(self, action, number, conditions=None, mode=None, configs=None,
+                 order='balanced', catch=0, catchcondition=None, maxrun=None):
+        if order not in ORDERS:
+            raise ValueError("'order' must be one of {}: {}".format(', '.join(ORDERS), order))
+        if (catch < 0) or (catch > 1):
+            raise ValueError("'catch' must be a ratio between 0 and 1: {}".format(catch))
+        if (catch > 0) and (catchcondition is None):
+            raise ValueError("'catchcondition' is required for catch trials")
+        if (maxrun is not None) and (maxrun < 1):
+            raise ValueError("'maxrun' must be 1 or larger: {}".format(maxrun))
+        if (maxrun is not None) and (order == 'sequential'):
+            raise ValueError("'maxrun' cannot be used with the 'sequential' order")
+        self.action     = action
+        self.number     = int(number)
+        self.conditions = [{}] if not conditions else list(conditions)
+        self.mode       = mode
+        self.configs    = {} if configs is None else dict(configs)
+        self.order      = order
+        self.catch      = catch
+        self.catchcondition = catchcondition
+        self.maxrun     = maxrun
+
+    def resolve(self, task, conditions):
+        """returns (action, state) of each condition, where all the states
+        have the same keys (those without a value take that of the block,
+        or the default of `task`)."""
+        base = dict(self.configs)
+        if self.mode is not None:
+            base['mode'] = self.mode
+        resolved = []
+        for condition in conditions:
+            state  = dict(base)
+            state.update(condition)
+            action = state.pop('action', self.action)
+            if action not in task.actions:
+                raise ValueError("unknown action: {}".format(action))
+            resolved.append((action, state))
+        keys = set()
+        for action, state in resolved:
+            keys.update(state.keys())
+        for key in keys:
+            if key == 'mode':
+                default = next(iter(task.modes.keys()), None)
+            elif key in task.configs:
+                default = task.configs[key].defaultvalue
+            else:
+                raise ValueError("unknown config: {}".format(key))
+            for action, state in resolved:
+                state.setdefault(key, default)
+                if (key == 'mode') and (state[key] not in task.modes):
+                    raise ValueError("unknown mode: {}".format(state[key]))
+        return resolved
+
+    def order_of(self, number, rng):
+        """returns the indices of the conditions for `number` regular trials."""
+        nconds  = len(self.conditions)
+        if self.order == 'balanced':
+            sequence = []
+            while len(sequence) < number:
+                cycle = rng.sample(range(nconds), min(nconds, number - len(sequence)))
+                if (len(sequence) > 0) and (len(cycle) > 1) and (cycle[0] == sequence[-1]):
+                    # avoids a repeat at the boundary of the cycles
+                    swap = rng.randrange(1, len(cycle))
+                    cycle[0], cycle[swap] = cycle[swap], cycle[0]
+                sequence.extend(cycle)
+            if (self.maxrun is not None) and (self.maxrun < 2):
+                limitruns(sequence, self.maxrun, rng)
+            return sequence
+        counts = [number // nconds] * nconds
+        for i in range(number % nconds):
+            counts[i] += 1
+        if self.order == 'random':
+            rng.shuffle(counts)
+        sequence = [i for i, count in enumerate(counts) for k in range(count)]
+        if self.order == 'random':
+            rng.shuffle(sequence)
+            limitruns(sequence, self.maxrun, rng)
+        return sequence
+
+    def compile(self, task, rng, index):
+        """returns the list of the `step`s of this block."""
+        ncatch   = int(round(self.number * self.catch))
+        regular  = self.number - ncatch
+        conditions = list(self.conditions)
+        if ncatch > 0:
+            conditions.append(self.catchcondition)
+        resolved = self.resolve(task, conditions)
+        # one catch trial in each segment of the block
+        catches  = set(rng.randrange((i * self.number) // ncatch, ((i + 1) * self.number) // ncatch)
+                       for i in range(ncatch))
+        sequence = iter(self.order_of(regular, rng))
+        ordered  = [len(self.conditions) if pos in catches else next(sequence)
+                    for pos in range(self.number)]
+        if ncatch > 0:
+            # adjacent catch trials may make a run of their own
+            limitruns(ordered, self.maxrun, rng)
+        steps    = []
+        for item in ordered:
+            action, state = resolved[item]
+            steps.append(step(index, action, state, item == len(self.conditions)))
+        return steps
+
+class design:
+    """a session as a sequence of blocks, that is compiled into a schedule
+    (the list of `step`s) by `compile()`.
+
+    the compiled schedule only depends on the blocks and `seed`
+    (a random one is chosen if it is None)."""
+
+    def __init__(self, task, seed=None):
+        if seed is None:
+            seed = random.SystemRandom().randrange(1 << 32)
+        self.task   = task
+        self.seed   = seed
+        self.blocks = []
+
+    def addBlock(self, action, number, conditions=None, mode=None, configs=None,
+                 order='balanced', catch=0, catchcondition=None, maxrun=None):
+        """adds a block of `number` trials of `action` (the name of an action).
+
+        conditions     -- the list of the conditions (see the module docstring)
+        mode, configs  -- the mode name and {config name: value} that are common to the block
+        order          -- 'sequential', 'balanced' or 'random'
+        catch          -- the ratio of the catch trials, run with `catchcondition`
+        maxrun         -- the largest number of the same condition (or of the catch trials)
+                          in a row, for the 'balanced' and 'random' orders (None for no limit)
+        """
+        added = block(action, number, conditions=conditions, mode=mode, configs=configs,
+                      order=order, catch=catch, catchcondition=catchcondition, maxrun=maxrun)
+        self.blocks.append(added)
+        return added
+
+    def compile(self):
+        rng   = random.Random(self.seed)
+        steps = []
+        for index, added in enumerate(self.blocks):
+            steps.extend(added.compile(self.task, rng, index))
+        return steps
+
+def readcheckpoint(path):
+    """returns (header, position, trials) from the checkpoint file at `path`.
+    the lines that cannot be read (e.g. partly written before a crash) are skipped."""
+    header   = None
+    position = 0
+    trials   = 0
+    with open(path, 'r') as src:
+        for line in src:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+            if header is None:
+                header = entry
+            else:
+                position = entry['position']
+                trials   = entry['trials']
+    if header is None:
+        raise ValueError("not a checkpoint file: {}".format(path))
+    return header, position, trials
+
+class scheduler(loophandler):
+    """runs the `step`s of a compiled schedule (see the module docstring).
+
+    `io` is a `client`, whose futures are used to await the replies.
+    if `futures` is False, `io` only needs `request()` (e.g. `app.SerialIO`),
+    and the replies must be passed to `updateWithMessage()`, as for `core.loop`.
+    with `acknowledge`, each mode/config command is expected to be replied
+    with a config line before the first trial with the state is counted
+    (otherwise the run is aborted, and the command is sent again when it is
+    run or resumed).
+
+    `handler` (a `loophandler`) follows the progress of the whole schedule:
+    `starting()` and `done()` receive the total number of steps and the
+    position in the schedule, and `timing()` the `trialtiming` of each trial.
+    a trial is evaluated with the criteria of its action (or `handler.evaluate()`),
+    and the step is repeated until it counts.
+
+    like `core.loop`, `run()` runs in the calling thread, and `start()`
+    returns a new thread."""
+
+    def __init__(self, task, steps, io=None, handler=None, futures=True,
+                 acknowledge=True, checkpoint=None, position=0, trials=0, sync=False):
+        self.task       = task
+        self.steps      = steps
+        self.io         = io
+        self.handler    = loophandler() if handler is None else handler
+        self.futures    = futures
+        self.acknowledge = acknowledge
+        self.checkpoint = checkpoint
+        self.sync       = sync
+        self.position   = position  # the index of the next step
+        self.trials     = trials    # the number of the trials run (including the repeated ones)
+        self.sent       = {}        # the state that has been sent to the device
+        self.acks       = []        # the acknowledgements that have not been checked
+        self.update     = threading.Condition()
+        self.current    = None      # the `loop` that is running
+        self.criteria   = None
+        self.counted    = False
+        self.last       = None      # the `trialtiming` of the last trial
+        self.command    = None
+        self.output     = None
+        self.toabort    = False
+
+    @classmethod
+    def resume(cls, path, task, io=None, handler=None, futures=True, acknowledge=True, sync=False):
+        """returns a `scheduler` that continues the schedule in the checkpoint file at `path`."""
+        header, position, trials = readcheckpoint(path)
+        if header['task'] != task.name:
+            raise ValueError("the checkpoint is for another task: {}".format(header['task']))
+        steps = [step.fromlist(item) for item in header['steps']]
+        return cls(task, steps, io=io, handler=handler, futures=futures, acknowledge=acknowledge,
+                   checkpoint=path, position=position, trials=trials, sync=sync)
+
+    def start(self, init=threading.Thread):
+        """starts a new thread that has this instance's `run()` as the target
+        (see `core.loop.start()`), and returns it."""
+        thread = init(target=self.run)
+        thread.start()
+        return thread
+
+    def runs(self):
+        """yields (step, count) for the runs of the same action and state
+        from the current position."""
+        pos = self.position
+        while pos < len(self.steps):
+            first = self.steps[pos]
+            end   = pos + 1
+            while (end < len(self.steps)) and (self.steps[end].action == first.action) \
+                    and (self.steps[end].state == first.state):
+                end += 1
+            yield first, end - pos
+            pos = end
+
+    def commandFor(self, key, value):
+        if key == 'mode':
+            return self.task.modes[value].command
+        return self.task.configs[key].command + str(value)
+
+    def sendState(self, state):
+        """sends the commands for the changes from the state that has been sent.
+        returns the list of (key, command, future) of the acknowledgements."""
+        acks = []
+        # the mode first, in case it affects the configs
+        for key in sorted(state.keys(), key=lambda key: key != 'mode'):
+            value = state[key]
+            if (key in self.sent) and (self.sent[key] == value):
+                continue
+            command = self.commandFor(key, value)
+            if (self.futures == True) and (self.acknowledge == True):
+                future = self.io.request(command, returns='config')
+                if future is not None:
+                    acks.append((key, command, future))
+            else:
+                self.io.request(command)
+            self.sent[key] = value
+        return acks
+
+    def checkAcknowledged(self, acks):
+        """drops the acknowledgements that have not arrived,
+        so that their commands are sent again. returns True if all have arrived."""
+        acknowledged = True
+        for key, command, future in acks:
+            if (not future.done()) or future.cancelled() or (future.exception() is not None):
+                future.cancel()
+                if self.toabort == False:
+                    print("***no acknowledgement for: {}".format(command))
+                self.sent.pop(key, None)
+                acknowledged = False
+        return acknowledged
+
+    def confirmState(self):
+        """returns True if the state of the current run has been acknowledged.
+        otherwise, the run is aborted."""
+        acks, self.acks = self.acks, []
+        if self.checkAcknowledged(acks) == True:
+            return True
+        self.abort()
+        return False
+
+    def waitUntil(self, deadline):
+        """waits until `deadline` (in `time.perf_counter_ns()`).
+        returns False if aborted in the meantime."""
+        return waituntil(self.update, deadline, lambda: self.toabort == True)
+
+    def openCheckpoint(self):
+        if self.checkpoint is None:
+            return
+        if (self.position == 0) or (not os.path.exists(self.checkpoint)):
+            self.output = open(self.checkpoint, 'w')
+            header = {'task': self.task.name, 'created': time.time(),
+                      'steps': [item.as_list() for item in self.steps]}
+            print(json.dumps(header), file=self.output)
+            self.flushCheckpoint()
+        else:
+            self.truncateCheckpoint()
+            self.output = open(self.checkpoint, 'a')
+
+    def truncateCheckpoint(self):
+        """removes a partly written last line (e.g. after a crash),
+        so that the records appended from now on can be read."""
+        with open(self.checkpoint, 'rb+') as out:
+            size = out.seek(0, os.SEEK_END)
+            end  = size
+            while end > 0:
+                start = max(end - 4096, 0)
+                out.seek(start)
+                newline = out.read(end - start).rfind(b'\n')
+                if newline >= 0:
+                    end = start + newline + 1
+                    break
+                end = start
+            if end < size:
+                out.truncate(end)
+
+    def flushCheckpoint(self):
+        self.output.flush()
+        if self.sync == True:
+            os.fsync(self.output.fileno())
+
+    def record(self):
+        """appends the current progress to the checkpoint file."""
+        if self.output is not None:
+            print(json.dumps({'position': self.position, 'trials': self.trials,
+                              'time': time.time()}), file=self.output)
+            self.flushCheckpoint()
+
+    def closeCheckpoint(self):
+        if self.output is not None:
+            self.output.close()
+            self.output = None
+
+    def run(self):
+        self.toabort = False
+        self.sent    = {} # the state of the device is not known (e.g. when resuming)
+        self.last    = None
+        self.openCheckpoint()
+        try:
+            for first, count in self.runs():
+                if self.io is None:
+                    print("***no IO linked to: {}".format(self))
+                    break
+                if self.runSteps(first, count) == False:
+                    break
+        finally:
+            self.closeCheckpoint()
+        self.handler.done(self.command, len(self.steps), self.position)
+
+    def runSteps(self, first, count):
+        """runs `count` trials of `first`. returns False if aborted."""
+        action   = self.task.actions[first.action]
+        interval = int(action.interval * 1e9)
+        # keeps the inter-trial interval across the runs
+        if (self.last is not None) and (interval > 0):
+            if self.waitUntil(self.last.started + interval) == False:
+                return False
+        self.acks = self.sendState(first.state)
+        trials   = loop(action.command, count, interval=action.interval, io=self.io, handler=self,
+                        returns=action.returns if self.futures == True else None,
+                        timeout=action.timeout, retries=action.retries, ontimeout=action.ontimeout,
+                        batch=action.batch if count > 1 else None)
+        with self.update:
+            if self.toabort == True:
+                acks, self.acks = self.acks, []
+                self.checkAcknowledged(acks)
+                return False
+            self.current  = trials
+            self.criteria = action.criteria
+            self.command  = action.command
+        try:
+            trials.run()
+        finally:
+            with self.update:
+                self.current = None
+        acks, self.acks = self.acks, []
+        self.checkAcknowledged(acks)
+        return (self.toabort == False) and (trials.toabort == False)
+
+    def abort(self):
+        with self.update:
+            self.toabort = True
+            self.update.notify_all()
+            current = self.current
+        if current is not None:
+            current.abort()
+
+    def updateWithMessage(self, msg):
+        current = self.current
+        if current is not None:
+            current.updateWithMessage(msg)
+
+    def starting(self, command, number, counter):
+        if self.toabort == True:
+            # aborted before the loop started
+            self.current.abort()
+        self.handler.starting(command, len(self.steps), self.position)
+
+    def evaluate(self, result):
+        if self.criteria is not None:
+            self.counted = self.criteria(result)
+        else:
+            self.counted = self.handler.evaluate(result)
+        return self.counted
+
+    def timing(self, timing):
+        self.trials += 1
+        self.last    = timing
+        if ((timing.status == 'done') and (self.counted == True)) or (timing.status == 'skip'):
+            if self.confirmState() == True:
+                self.position += 1
+                self.record()
+        self.counted = False
+        self.handler.timing(timing)
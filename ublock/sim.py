@@ -0,0 +1,315 @@
+import time
+import random
+import threading
+import serial
+
+from .core import encodeframe
+
+"""simulated devices that run on the device end of a transport.
+
+they allow the `client`, `loop` and `app.SerialIO` code to be run
+without a physical board, e.g.:
+
+    host, dev = transport.loopback()
+    device    = sim.sampletask(dev, timescale=0)
+    io        = client(host, handler=myhandler)
+"""
+
+class device(threading.Thread):
+    """the base class for simulated devices.
+
+    it behaves like an Arduino sketch: `setup()` is called once,
+    and then `loop()` is called repeatedly until `stop()` is called.
+    `readChar()`, `available()`, `print()` and `println()` correspond
+    to the `Serial` methods of the sketch."""
+
+    def __init__(self, port, start=True):
+        super().__init__(daemon=True)
+        self.port       = port
+        self.port.timeout = 0.1
+        self.quitreq    = threading.Event()
+        self.outbuf     = []
+        self.inbuf      = b''
+        if start == True:
+            self.start()
+
+    def setup(self):
+        pass
+
+    def loop(self):
+        pass
+
+    def stop(self):
+        self.quitreq.set()
+        self.port.close()
+        if self.is_alive() and (threading.current_thread() is not self):
+            self.join()
+
+    def delay(self, msec):
+        """waits for `msec` milliseconds (or until `stop()` is called)."""
+        if msec > 0:
+            self.quitreq.wait(msec / 1000)
+
+    def available(self):
+        if len(self.inbuf) == 0:
+            waiting = self.port.in_waiting
+            if waiting > 0:
+                self.inbuf = self.port.read(waiting)
+        return len(self.inbuf)
+
+    def readChar(self):
+        """blocks until a character arrives, and returns it as a str.
+        returns None when the device is stopping."""
+        while len(self.inbuf) == 0:
+            if self.quitreq.is_set():
+                return None
+            self.inbuf = self.port.read(max(self.port.in_waiting, 1))
+        ch, self.inbuf = self.inbuf[:1], self.inbuf[1:]
+        return ch.decode()
+
+    def print(self, value):
+        self.outbuf.append(str(value))
+
+    def println(self, value=''):
+        self.outbuf.append(str(value))
+        self.outbuf.append("\r\n")
+        self.port.write(''.join(self.outbuf).encode())
+        self.outbuf = []
+
+    def write(self, data):
+        """writes raw bytes (e.g. a binary frame)."""
+        if len(self.outbuf) > 0:
+            self.port.write(''.join(self.outbuf).encode())
+            self.outbuf = []
+        self.port.write(data)
+
+    def run(self):
+        try:
+            self.setup()
+            while not self.quitreq.is_set():
+                self.loop()
+        except serial.SerialException:
+            pass # the port has been closed
+
+class streamer(device):
+    """a device that writes `line` for `count` times (or forever if
+    `count` is None), at `rate` lines/sec (or as fast as possible
+    if `rate` is None). incoming characters are ignored.
+
+    `line` can also be bytes (e.g. a binary frame), that are written as they are.
+    if `stamps` is a list, the `time.perf_counter_ns()` before writing
+    each line is appended to it."""
+
+    def __init__(self, port, line, rate=None, count=None, stamps=None, start=True):
+        self.line   = line
+        self.rate   = rate
+        self.count  = count
+        self.stamps = stamps
+        self.sent   = 0
+        super().__init__(port, start=start)
+
+    def setup(self):
+        self.started = time.perf_counter()
+
+    def loop(self):
+        if (self.count is not None) and (self.sent >= self.count):
+            self.quitreq.wait(0.1)
+            return
+        if self.rate is not None:
+            wait = self.started + self.sent / self.rate - time.perf_counter()
+            if wait > 0:
+                self.quitreq.wait(wait)
+        if self.stamps is not None:
+            self.stamps.append(time.perf_counter_ns())
+        if isinstance(self.line, bytes):
+            self.write(self.line)
+        else:
+            self.println(self.line)
+        self.sent += 1
+
+def isRecognizable(ch):
+    code = ord(ch)
+    return ((code >= 33) and (code <= 91)) or ((code >= 93) and (code <= 122))
+
+class sampletask(device):
+    """a simulation of `sample_devicecode/SampleTask`.
+
+    all the delays in the sketch are multiplied by `timescale`,
+    so that `timescale=0` runs trials as fast as possible.
+
+    'N<count>[;<interval>]' runs `count` trials in a row, with `interval`
+    milliseconds in between (see the batch mode of `core.loop`). during a
+    batch, 'A' stops it after the current trial (other input is ignored)."""
+
+    CFG_CHR_PAIR = 'P'
+    CFG_CHR_TEST = 'T'
+    CFG_CHR_STIM = 'd'
+    CFG_CHR_RESP = 'f'
+    CMD_CHR_EXEC = 'X'
+    CFG_CHR_BINARY = 'B'
+    CMD_CHR_BATCH = 'N'
+    CMD_CHR_ABORT = 'A'
+
+    def __init__(self, port, timescale=1.0, seed=None, start=True):
+        self.timescale  = timescale
+        self.random     = random.Random(seed)
+        self.binary     = False
+        self.mode       = self.CFG_CHR_PAIR
+        self.stim       = 100
+        self.resp       = 1000
+        self.terminator = None # the character that ended the last unsigned integer
+        super().__init__(port, start=start)
+
+    def delay(self, msec):
+        super().delay(msec * self.timescale)
+
+    def setup(self):
+        self.writeSettings()
+
+    def loop(self):
+        ch = self.readChar()
+        if ch is not None:
+            self.parseFromSerial(ch)
+
+    def writeMode(self, standalone=False):
+        if standalone == True:
+            self.print("@")
+        self.print("[P]" if self.mode == self.CFG_CHR_PAIR else "P")
+        self.print("[T]" if self.mode == self.CFG_CHR_TEST else "T")
+        if standalone == True:
+            self.println()
+        else:
+            self.print(';')
+
+    def writeValue(self, command, value, standalone=False):
+        if standalone == True:
+            self.print("@")
+        self.print(command)
+        self.print(value)
+        if standalone == True:
+            self.println()
+        else:
+            self.print(';')
+
+    def writeSettings(self):
+        self.print("@<SampleTask>;")
+        self.writeMode()
+        self.writeValue(self.CFG_CHR_STIM, self.stim)
+        self.writeValue(self.CFG_CHR_RESP, self.resp)
+        self.println()
+
+    def parseFromSerial(self, ch):
+        if not isRecognizable(ch):
+            return
+        if ch == '?':
+            self.writeSettings()
+        elif ch in (self.CFG_CHR_PAIR, self.CFG_CHR_TEST):
+            self.mode = ch
+            self.writeMode(True)
+        elif ch == self.CFG_CHR_STIM:
+            self.stim = self.parseUnsignedFromSerial(self.stim)
+            self.writeValue(self.CFG_CHR_STIM, self.stim, True)
+        elif ch == self.CFG_CHR_RESP:
+            self.resp = self.parseUnsignedFromSerial(self.resp)
+            self.writeValue(self.CFG_CHR_RESP, self.resp, True)
+        elif ch == self.CFG_CHR_BINARY:
+            self.binary = (self.parseUnsignedFromSerial(int(self.binary)) != 0)
+            self.writeValue(self.CFG_CHR_BINARY, int(self.binary), True)
+        elif ch == self.CMD_CHR_EXEC:
+            self.runOnce()
+        elif ch == self.CMD_CHR_BATCH:
+            count    = self.parseUnsignedFromSerial(0)
+            interval = self.parseUnsignedFromSerial(0) if self.terminator == ';' else 0
+            self.runBatch(count, interval)
+        elif ch in (';', self.CMD_CHR_ABORT):
+            pass # the abort request arrived after the batch
+        else:
+            self.println("*error: {}".format(ch))
+
+    def parseUnsignedFromSerial(self, orig):
+        value = 0
+        while True:
+            ch = self.readChar()
+            self.terminator = ch
+            if ch is None:
+                return orig
+            elif ch.isdigit():
+                value = value * 10 + int(ch)
+            elif (not isRecognizable(ch)) or (ch == ';'):
+                break
+            else:
+                self.println("*error: {}".format(ch))
+                value = orig
+                break
+        return value & 0xFFFF
+
+    def genResponse(self, length, nresp):
+        return sorted(set(self.random.randrange(length) for i in range(nresp)))
+
+    def runOnce(self):
+        cued      = (self.mode == self.CFG_CHR_PAIR)
+        nresp     = self.random.randrange(20)
+        start     = time.perf_counter()
+        self.println(">Delay")
+        response  = self.genResponse(5000, nresp)
+        self.delay(1000)
+        wait      = int(round((time.perf_counter() - start) * 1000))
+
+        self.println(">Cued")
+        if (not cued) and (self.random.randrange(10) > 0):
+            cued = True
+        responded = any((t > 2500) and (t < 3500) for t in response)
+        self.delay(500)
+        self.println(">WithResp" if responded == True else ">NoResp")
+        self.delay(self.resp)
+        self.writeResults(cued, responded, wait, response)
+
+    def pollAbort(self):
+        """reads the input that is available, and returns whether it includes CMD_CHR_ABORT."""
+        aborted = False
+        while self.available() > 0:
+            if self.readChar() == self.CMD_CHR_ABORT:
+                aborted = True
+        return aborted
+
+    def runBatch(self, count, interval):
+        for i in range(count):
+            if self.quitreq.is_set():
+                return
+            self.runOnce()
+            if i == count - 1:
+                break
+            deadline = time.perf_counter() + interval * self.timescale / 1000
+            while True:
+                if self.pollAbort() == True:
+                    return
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                self.quitreq.wait(min(remaining, 0.005))
+
+    def resultStatus(self, cued, responded):
+        pair = (self.mode == self.CFG_CHR_PAIR)
+        if cued == True:
+            if responded == True:
+                return "hit"
+            else:
+                return "noresp" if pair == True else "miss"
+        else:
+            if responded == True:
+                return "catch"
+            else:
+                return "noresp" if pair == True else "reject"
+
+    def writeResults(self, cued, responded, wait, response):
+        status = self.resultStatus(cued, responded)
+        if self.binary == True:
+            self.write(encodeframe('+', "{};wait{}".format(status, wait),
+                                   {'lick': response}))
+            return
+        self.print("+{};".format(status))
+        self.print("wait")
+        self.print(wait)
+        self.print(";lick[")
+        self.print(','.join(str(t) for t in response))
+        self.println("];")
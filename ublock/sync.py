@@ -0,0 +1,185 @@
+import time
+import threading
+
+from .core import loop
+from .metrics import collector
+
+"""running the loops of several devices in step.
+
+a `coordinator` runs a `core.loop` per client, and aligns the onsets
+of their trials in either of the modes:
+
++ mode='barrier'  -- before each trial, every loop waits until all the
+  others are ready (i.e. have got the reply of their previous trial),
+  and then they all start at a common deadline
++ mode='deadline' -- the loops share the deadline of the first trial,
+  and stay on the same grid of `interval` from there, without waiting for
+  each other (a late reply only delays the device in question)
+
+e.g.:
+
+    devices = [client(addr) for addr in addrs]
+    session = coordinator('X', 100, devices, interval=2.0, returns='result')
+    session.run()
+    print(session.report())
+
+the skew of the trial onsets across the devices (the spread of the times
+the commands were sent, for the trial of the same index) is recorded in
+the 'skew' histogram of `metrics` (a `metrics.collector`), and how much the
+common deadlines were later than the planned ones (i.e. the wait for the
+slowest device) in 'release'.
+
+with `returns=None`, the replies must be passed to the `updateWithMessage()`
+of the respective loop (in `loops`), as for `core.loop`.
+"""
+
+MODES = ('barrier', 'deadline')
+
+class syncedloop(loop):
+    """a `core.loop` that starts its trials through a `coordinator`."""
+
+    def __init__(self, coordinator, command, number, **kwargs):
+        super().__init__(command, number, **kwargs)
+        self.coordinator = coordinator
+        self.counter     = 0 # the counter of the last trial
+
+    def waitUntil(self, deadline):
+        if self.coordinator.mode == 'barrier':
+            deadline = self.coordinator.arrive(deadline)
+            if deadline is None:
+                return False
+        return super().waitUntil(deadline)
+
+    def settle(self, timing, outcome, counter, retried):
+        self.coordinator.started(self, timing)
+        self.counter, retried = super().settle(timing, outcome, counter, retried)
+        return self.counter, retried
+
+    def run(self):
+        self.counter = 0
+        try:
+            super().run()
+        finally:
+            self.coordinator.leave(self)
+
+class coordinator:
+    """runs `loop`s of `command` for `number` trials on each of `clients`
+    (see the module docstring).
+
+    `handlers` is the list of the `loophandler` for each client (None for
+    the default one). the other keyword arguments are passed to `core.loop`.
+
+    `lead` (in seconds) is the time between the release of a barrier (or
+    the start of `run()`) and the common deadline, so that all the loop
+    threads are awake by then.
+    """
+
+    def __init__(self, command, number, clients, handlers=None, mode='barrier',
+                 lead=0.002, metrics=None, **kwargs):
+        if mode not in MODES:
+            raise ValueError("'mode' must be one of {}: {}".format(', '.join(MODES), mode))
+        if kwargs.get('batch', None) is not None:
+            raise ValueError("the batch mode cannot be coordinated")
+        if handlers is None:
+            handlers = [None] * len(clients)
+        elif len(handlers) != len(clients):
+            raise ValueError("the numbers of clients and handlers differ: {} and {}".format(
+                             len(clients), len(handlers)))
+        self.mode       = mode
+        self.lead       = int(lead * 1e9)
+        self.metrics    = collector() if metrics is None else metrics
+        self.loops      = [syncedloop(self, command, number, io=io, handler=handler, **kwargs)
+                           for io, handler in zip(clients, handlers)]
+        self.update     = threading.Condition()
+        self.active     = 0     # the number of loops that are running
+        self.arrived    = 0     # the number of loops waiting at the barrier
+        self.latest     = 0     # the latest deadline of the loops at the barrier
+        self.generation = 0
+        self.released   = None  # the common deadline of the last release
+        self.onsets     = {}    # {trial index: [onsets]}
+        self.toabort    = False
+
+    def start(self, init=threading.Thread):
+        """starts a new thread that has this instance's `run()`
+        as the target (see `core.loop.start()`), and returns it."""
+        thread = init(target=self.run)
+        thread.start()
+        return thread
+
+    def run(self):
+        """runs the loops until all of them are done, and returns their counters."""
+        self.toabort    = False
+        self.arrived    = 0
+        self.latest     = 0
+        self.onsets     = {}
+        self.active     = len(self.loops)
+        startat         = time.perf_counter_ns() + self.lead * max(len(self.loops), 1)
+        for member in self.loops:
+            member.startat = startat
+        threads = [member.start() for member in self.loops]
+        for thread in threads:
+            thread.join()
+        return [member.counter for member in self.loops]
+
+    def wait(self, timeout=None):
+        """waits until all the loops are done. returns False on timeout."""
+        with self.update:
+            return self.update.wait_for(lambda: self.active == 0, timeout)
+
+    def arrive(self, deadline):
+        """waits at the barrier until all the running loops have arrived.
+        returns the common deadline, or None if aborted."""
+        with self.update:
+            if self.toabort == True:
+                return None
+            generation   = self.generation
+            self.arrived += 1
+            self.latest  = max(self.latest, deadline)
+            if self.arrived >= self.active:
+                self.release()
+            else:
+                self.update.wait_for(lambda: (self.generation != generation) or (self.toabort == True))
+            return None if self.generation == generation else self.released
+
+    def release(self):
+        """releases the loops at the barrier (called with `update` held)."""
+        self.released   = max(self.latest, time.perf_counter_ns() + self.lead)
+        self.metrics.latency('release', self.released - self.latest)
+        self.arrived    = 0
+        self.latest     = 0
+        self.generation += 1
+        self.update.notify_all()
+
+    def leave(self, member):
+        """removes a loop that has finished from the barrier."""
+        with self.update:
+            self.active -= 1
+            if (self.arrived > 0) and (self.arrived >= self.active):
+                self.release()
+            self.update.notify_all()
+
+    def started(self, member, timing):
+        """records the onset of a trial, and the skew once all the
+        running loops have started the trial of the index."""
+        with self.update:
+            onsets = self.onsets.setdefault(timing.index, [])
+            onsets.append(timing.started)
+            if len(onsets) >= self.active:
+                del self.onsets[timing.index]
+                if len(onsets) > 1:
+                    self.metrics.latency('skew', max(onsets) - min(onsets))
+
+    def abort(self):
+        with self.update:
+            self.toabort = True
+            self.update.notify_all()
+        for member in self.loops:
+            member.abort()
+
+    def skew(self):
+        """returns the statistics of the onset skew (in ns; see `metrics.histogram.as_dict()`)."""
+        histogram = self.metrics.histograms.get('skew', None)
+        return None if histogram is None else histogram.as_dict()
+
+    def report(self):
+        return self.metrics.report()
@@ -0,0 +1,249 @@
+import os
+import time
+import errno
+import select
+import socket
+import struct
+import serial
+try:
+    import fcntl
+    import termios
+    import tty
+except ImportError:
+    # not on a POSIX platform: only pyserial ports are available
+    fcntl = termios = tty = None
+
+"""the transport layer of ublock.
+
+any object that implements the subset of `serial.Serial` that is used by
+`iothread` can be used as a port: i.e. `read(size)`, `in_waiting`, `write(data)`,
+the `timeout` attribute, `close()` and (for multiplexing) `fileno()`.
+errors are reported as `serial.SerialException`, as in pyserial.
+
+the backends provided here are:
+
++ pyserial   -- `openport('/dev/ttyACM0')` (the default)
++ pty pair   -- `ptypair()`, for simulated devices behind a real serial path
++ TCP socket -- `openport('tcp://host:port')`, served by a `tcplistener`
++ loopback   -- `loopback()`, an in-process pair of connected ports
+
+all the backends other than pyserial require a POSIX platform.
+"""
+
+class streamport:
+    """the base class for port-like objects over a file descriptor.
+
+    reading is done through `select()` so that `timeout` behaves
+    as in `serial.Serial`, and `close()` wakes up any blocking `read()`.
+    subclasses implement `fileno()`, `_recv()`, `_send()` and `_close()`."""
+
+    def __init__(self, name=None):
+        if fcntl is None:
+            raise RuntimeError("{} requires a POSIX platform".format(self.__class__.__name__))
+        self.name       = name
+        self.timeout    = None
+        self.is_open    = True
+        self._abortr, self._abortw = os.pipe()
+
+    def __repr__(self):
+        return "{}({})".format(self.__class__.__name__, self.name)
+
+    def __del__(self):
+        for fd in (getattr(self, '_abortr', None), getattr(self, '_abortw', None)):
+            if fd is None:
+                continue
+            try:
+                os.close(fd)
+            except OSError:
+                pass
+
+    def fileno(self):
+        raise NotImplementedError()
+
+    def _recv(self, size):
+        raise NotImplementedError()
+
+    def _send(self, data):
+        raise NotImplementedError()
+
+    def _close(self):
+        raise NotImplementedError()
+
+    def _check(self):
+        if self.is_open == False:
+            raise serial.SerialException("port not open: {}".format(self.name))
+
+    @property
+    def in_waiting(self):
+        self._check()
+        try:
+            value = fcntl.ioctl(self.fileno(), termios.FIONREAD, b'\0\0\0\0')
+        except OSError as e:
+            raise serial.SerialException("{}: {}".format(self.name, e))
+        return struct.unpack('I', value)[0]
+
+    def read(self, size=1):
+        self._check()
+        read     = bytearray()
+        deadline = None if self.timeout is None else (time.monotonic() + self.timeout)
+        while len(read) < size:
+            remaining = None if deadline is None else max(deadline - time.monotonic(), 0)
+            try:
+                ready, _, _ = select.select([self.fileno(), self._abortr], [], [], remaining)
+                if self._abortr in ready:
+                    os.read(self._abortr, 1000)
+                    break
+                if not ready:
+                    break # timeout
+                data = self._recv(size - len(read))
+            except OSError as e:
+                if e.errno in (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR):
+                    continue
+                elif self.is_open == False:
+                    break
+                raise serial.SerialException("{}: read failed: {}".format(self.name, e))
+            except ValueError:
+                # the file descriptor has been closed from another thread
+                break
+            if len(data) == 0:
+                raise serial.SerialException("{}: connection closed by peer".format(self.name))
+            read += data
+        return bytes(read)
+
+    def write(self, data):
+        self._check()
+        view  = memoryview(data)
+        total = 0
+        try:
+            while total < len(view):
+                total += self._send(view[total:])
+        except OSError as e:
+            raise serial.SerialException("{}: write failed: {}".format(self.name, e))
+        return total
+
+    def flush(self):
+        pass
+
+    def close(self):
+        if self.is_open == True:
+            self.is_open = False
+            os.write(self._abortw, b'x')
+            self._close()
+
+class fdport(streamport):
+    """a port over a raw file descriptor (e.g. one end of a pty pair)."""
+
+    def __init__(self, fd, name=None):
+        super().__init__(name=name)
+        self.fd = fd
+
+    def fileno(self):
+        return self.fd
+
+    def _recv(self, size):
+        return os.read(self.fd, size)
+
+    def _send(self, data):
+        return os.write(self.fd, data)
+
+    def _close(self):
+        os.close(self.fd)
+
+class socketport(streamport):
+    """a port over a connected stream socket."""
+
+    def __init__(self, sock, name=None):
+        super().__init__(name=name)
+        self.sock = sock
+
+    def fileno(self):
+        return self.sock.fileno()
+
+    def _recv(self, size):
+        return self.sock.recv(size)
+
+    def _send(self, data):
+        return self.sock.send(data)
+
+    def _close(self):
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.sock.close()
+
+class ptyport(fdport):
+    """the device (master) end of a pseudo-terminal pair.
+
+    the host side can open `ptyport.name` like any other serial device,
+    e.g. through `client(ptyport.name)`."""
+
+    def __init__(self):
+        master, slave = os.openpty()
+        tty.setraw(slave)
+        super().__init__(master, name=os.ttyname(slave))
+        # keeps the slave end open so that the master never reports EIO
+        # while the host side is not connected
+        self.slave = slave
+
+    def _close(self):
+        super()._close()
+        os.close(self.slave)
+
+def ptypair():
+    """returns a (host, device) pair of ports connected through a pseudo-terminal.
+    the path of the host end is available as `host.name`."""
+    device = ptyport()
+    hostfd = os.open(device.name, os.O_RDWR | os.O_NOCTTY)
+    return fdport(hostfd, name=device.name), device
+
+def loopback():
+    """returns a (host, device) pair of in-process ports that are connected
+    to each other."""
+    host, device = socket.socketpair()
+    return socketport(host, name='loopback:host'), socketport(device, name='loopback:device')
+
+class tcplistener:
+    """the device end of a TCP transport.
+
+    the host connects through `openport(listener.url)`, and the
+    device end of the connection is obtained by `accept()`."""
+
+    def __init__(self, host='127.0.0.1', port=0):
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.bind((host, port))
+        self.sock.listen(1)
+        self.address = self.sock.getsockname()
+        self.url     = "tcp://{}:{}".format(*self.address)
+
+    def accept(self, timeout=None):
+        self.sock.settimeout(timeout)
+        conn, peer = self.sock.accept()
+        conn.settimeout(None)
+        conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        return socketport(conn, name="tcp://{}:{}".format(*peer))
+
+    def close(self):
+        self.sock.close()
+
+def tcpconnect(url):
+    """connects to a `tcplistener` at `url` (in the form of 'tcp://host:port')."""
+    if not url.startswith('tcp://'):
+        raise ValueError("not a TCP address: {}".format(url))
+    host, port = url[len('tcp://'):].rsplit(':', 1)
+    sock = socket.create_connection((host, int(port)))
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    return socketport(sock, name=url)
+
+def openport(addr, baud=9600):
+    """opens a port for `addr`.
+
+    `addr` can be a port-like object (returned as it is), a 'tcp://host:port'
+    address, or anything else that `serial.Serial` accepts as its `port`."""
+    if not isinstance(addr, str):
+        return addr
+    elif addr.startswith('tcp://'):
+        return tcpconnect(addr)
+    else:
+        return serial.Serial(port=addr, baudrate=baud)